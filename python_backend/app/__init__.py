@@ -1,11 +1,19 @@
-from flask import Flask, jsonify, session, request
+from flask import Flask, jsonify, session, request, g
 from flask_cors import CORS
 from flask_login import LoginManager
 from dotenv import load_dotenv
 from datetime import timedelta
+import hmac
 import os
 import pymongo
 from bson.objectid import ObjectId
+from app.utils.json_encoder import MongoJSONProvider
+from app.utils.log import setup_logging
+from app.utils.sessions import mongo_sessions
+from app.utils.indexes import register_indexes
+from app.utils.query_metrics import query_monitor
+from app.utils.slow_queries import slow_queries
+from app.utils.response_cache import response_cache
 
 # Load environment variables
 load_dotenv()
@@ -13,14 +21,17 @@ load_dotenv()
 # Create Flask app
 app = Flask(__name__)
 
-# Clean up any existing sessions in the database on server start
+# Serialize ObjectId/datetime straight to response bytes in jsonify
+app.json = MongoJSONProvider(app)
+
+# Prune expired sessions and reset tokens on server start
 def cleanup_sessions():
     try:
         from app.models.user import User
-        User.cleanup_sessions()  # This is a new method we'll add
-        print("Successfully cleaned up all sessions on server start")
+        User.cleanup_sessions()
+        logger.info("Successfully pruned expired sessions on server start")
     except Exception as e:
-        print(f"Error cleaning up sessions: {e}")
+        logger.error("Error cleaning up sessions: %s", e)
 
 # Handle proper HTTPS detection for secure cookies
 @app.before_request
@@ -36,6 +47,9 @@ def handle_https():
 # Development mode flag
 DEV_MODE = os.getenv('FLASK_ENV') == 'development' or os.getenv('DEV_MODE') == 'true'
 
+# Leveled, redacted, queue-backed logging (LOG_LEVEL / LOG_SAMPLE_RATES)
+logger = setup_logging(DEV_MODE)
+
 # Configure app and session handling
 app.config.update(
     SECRET_KEY=os.getenv('SECRET_KEY', 'dev-key-please-change'),
@@ -48,7 +62,7 @@ app.config.update(
     SESSION_COOKIE_SAMESITE='Lax' if DEV_MODE else 'None',  # Use Lax in development, None in production
     SESSION_COOKIE_DOMAIN=None,  # Allow all domains in development
     PERMANENT_SESSION_LIFETIME=timedelta(days=1),  # One day session lifetime
-    SESSION_TYPE='filesystem',  # Use filesystem session storage
+    SESSION_TYPE=os.getenv('SESSION_TYPE', 'mongodb'),  # 'mongodb' (server-side) or 'cookie'
     
     # Remember me cookie configuration
     REMEMBER_COOKIE_NAME='casaconnect_remember',
@@ -70,33 +84,33 @@ login_manager.refresh_view = "auth.login"    # Redirect to login for session ref
 
 @login_manager.user_loader
 def load_user(user_id):
-    print(f"Attempting to load user with ID: {user_id}")
+    logger.debug("Attempting to load user with ID: %s", user_id)
     
     # Skip validation if no user_id
     if not user_id:
-        print("No user ID provided")
+        logger.debug("No user ID provided")
         return None
     
     try:
         # Get the user from database
-        print(f"Looking up user with ObjectId: {user_id}")
+        logger.debug("Looking up user with ObjectId: %s", user_id)
         from app.models.user import User
         user = User.get_by_id(user_id)
         
         if user:
-            print(f"Found user data: {user.username} (ID: {user.id})")
+            logger.debug("Found user data: %s (ID: %s)", user.username, user.id)
             
             # Check if X-User-ID header is present
             user_id_header = request.headers.get('X-User-ID')
             if user_id_header:
                 if user_id_header == 'undefined' or user_id_header == 'null' or not user_id_header.strip():
-                    print(f"Invalid X-User-ID header value: {user_id_header}")
-                    print("Using session user ID instead")
+                    logger.info("Invalid X-User-ID header value: %s", user_id_header)
+                    logger.debug("Using session user ID instead")
                 elif user_id_header != str(user.id):
                     # For trade-related endpoints, prioritize X-User-ID header
                     if request.path.startswith('/api/trades'):
-                        print(f"User ID mismatch in trades endpoint: header={user_id_header}, session={user.id}")
-                        print(f"Prioritizing X-User-ID header for trades")
+                        logger.warning("User ID mismatch in trades endpoint: header=%s, session=%s", user_id_header, user.id)
+                        logger.debug("Prioritizing X-User-ID header for trades")
                         # Return the user from the header instead
                         from app.models.user import User
                         header_user = User.get_by_id(user_id_header)
@@ -104,22 +118,22 @@ def load_user(user_id):
                             return header_user
                     else:
                         # For other endpoints, session user takes precedence
-                        print(f"User ID mismatch: header={user_id_header}, session={user.id}")
-                        print(f"Prioritizing session user_id")
+                        logger.warning("User ID mismatch: header=%s, session=%s", user_id_header, user.id)
+                        logger.debug("Prioritizing session user_id")
             else:
-                print(f"No X-User-ID header present, using session user")
+                logger.debug("No X-User-ID header present, using session user")
                 
             # Store user ID in session for consistency
             if 'user_id' not in session or session['user_id'] != str(user.id):
                 session['user_id'] = str(user.id)
-                print(f"Updated session user ID: {session['user_id']}")
+                logger.debug("Updated session user ID: %s", session['user_id'])
                 
             return user
         else:
-            print(f"No user found for ID: {user_id}")
+            logger.warning("No user found for ID: %s", user_id)
             return None
     except Exception as e:
-        print(f"Error loading user: {e}")
+        logger.error("Error loading user: %s", e)
         return None
 
 # Configure CORS to handle cross-origin requests
@@ -129,7 +143,7 @@ CORS(app,
          "origins": ["http://127.0.0.1:5500", "http://localhost:5500", "http://localhost:5000", 
                     "http://127.0.0.1:5501", "http://localhost:5501"],
          "allow_credentials": True,
-         "expose_headers": ["Set-Cookie", "X-User-ID", "Content-Type", "Authorization"],
+         "expose_headers": ["Set-Cookie", "X-User-ID", "Content-Type", "Authorization", "X-Next-Cursor", "Link"],
          "allow_headers": ["Content-Type", "Cookie", "Accept", "Origin", "X-User-ID", 
                           "X-Requested-With", "Authorization", "Cache-Control"],
          "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
@@ -141,7 +155,9 @@ CORS(app,
 # Make sessions permanent by default
 @app.before_request
 def make_session_permanent():
-    session.permanent = True
+    # Only touch it when needed so read-only requests don't rewrite the session
+    if not session.permanent:
+        session.permanent = True
     
 # Add middleware to handle X-User-ID based authentication
 @app.before_request
@@ -151,34 +167,40 @@ def handle_user_id_header():
         return
     
     # Debug request path and method
-    print(f"Request: {request.method} {request.path}")
-    print(f"Headers: {dict(request.headers)}")
+    logger.debug("Request: %s %s", request.method, request.path)
+    logger.debug("Headers: %s", request.headers)
     
     # Check if this is a trades endpoint - completely bypass login checks
     if request.path.startswith('/api/trades'):
         user_id = request.headers.get('X-User-ID')
         if user_id and user_id != 'undefined' and user_id != 'null' and user_id.strip():
-            print(f"Using X-User-ID header for authentication: {user_id}")
+            logger.debug("Using X-User-ID header for authentication: %s", user_id)
             # Set a flag in the request context to indicate this request is using header auth
             request.using_header_auth = True
             # No need to check for session auth for trade endpoints
             return
         else:
-            print(f"Warning: Missing or invalid X-User-ID header for trades endpoint")
+            logger.info("Missing or invalid X-User-ID header for trades endpoint")
             
     # For all other requests, proceed with normal session handling
 
 # Set up MongoDB connection
 try:
-    client = pymongo.MongoClient(os.getenv('MONGODB_URI'))
+    # query_monitor attributes every command to the endpoint that issued it
+    client = pymongo.MongoClient(os.getenv('MONGODB_URI'), event_listeners=[query_monitor])
     client.server_info()  # Test connection
     db = client.get_default_database()
-    print("Successfully connected to MongoDB")
-    
+    logger.info("Successfully connected to MongoDB")
+
+    # Server-side sessions shared by all workers (expired ones dropped by a TTL index)
+    if app.config['SESSION_TYPE'] == 'mongodb':
+        app.session_interface = mongo_sessions(db.sessions)
+        register_indexes(app.session_interface.store)
+
     # Clean up sessions when server starts
     cleanup_sessions()
 except Exception as e:
-    print(f"Error connecting to MongoDB: {e}")
+    logger.error("Error connecting to MongoDB: %s", e)
     db = None
 
 # Enable debug mode
@@ -187,23 +209,23 @@ app.debug = True
 # Custom unauthorized handler for API requests
 @login_manager.unauthorized_handler
 def unauthorized():
-    print("Unauthorized access attempt - login_required failed")
+    logger.info("Unauthorized access attempt - login_required failed")
     
     # Debug info to help diagnose the issue
-    print(f"Request path: {request.path}")
-    print(f"Request method: {request.method}")
-    print(f"Session: {session}")
-    print(f"Headers: {dict(request.headers)}")
+    logger.debug("Request path: %s", request.path)
+    logger.debug("Request method: %s", request.method)
+    logger.debug("Session: %s", session)
+    logger.debug("Headers: %s", request.headers)
     
     # Check if this is a trades route with X-User-ID header
     if request.path.startswith('/api/trades') and request.headers.get('X-User-ID'):
         # Special case for trades routes - allow header-based auth
-        print("Trade route with X-User-ID header - bypassing login_required")
+        logger.debug("Trade route with X-User-ID header - bypassing login_required")
         return None
     
     # Check if request was flagged as using header auth
     if hasattr(request, 'using_header_auth') and request.using_header_auth:
-        print("Request is using header auth - bypassing login_required")
+        logger.debug("Request is using header auth - bypassing login_required")
         return None
     
     # Add CORS headers for better browser handling
@@ -217,31 +239,50 @@ def unauthorized():
     
     return response, 401
 
+# Per-request command count (X-Query-Count) and query budgets
+query_monitor.init_app(app)
+
+# Opt-in slow query log with explain plans (SLOW_QUERY_MS)
+slow_queries.init_app(app, db, query_monitor)
+
+# Read-through cache of hot public responses (RESPONSE_CACHE)
+response_cache.init_app(app, db)
+
+# Report how many per-result author lookups the batched hydration avoided
+@app.after_request
+def report_author_lookups(response):
+    saved = g.get('author_lookups_saved', 0)
+    if saved:
+        response.headers['X-Author-Lookups-Saved'] = str(saved)
+    return response
+
 # Import routes
-from app.routes import auth, posts, roommates, trades, users, search
+from app.routes import auth, posts, roommates, trades, users, search, images, chats, messages, events
 app.register_blueprint(auth.bp)  # Auth routes (using url_prefix from blueprint)
 app.register_blueprint(posts.bp, url_prefix='/api')  # Posts under /api
 app.register_blueprint(roommates.bp, url_prefix='/api')  # Roommates under /api
 app.register_blueprint(trades.bp, url_prefix='/api')  # Trades under /api
 app.register_blueprint(users.bp)  # Users routes (already has url_prefix in blueprint)
 app.register_blueprint(search.bp)  # Search routes (already has url_prefix in blueprint)
+app.register_blueprint(images.bp)  # Image store (already has url_prefix in blueprint)
+app.register_blueprint(chats.bp)  # Chats (already has url_prefix in blueprint)
+app.register_blueprint(messages.bp)  # Direct messages (already has url_prefix in blueprint)
+app.register_blueprint(events.bp)  # Server-sent events (already has url_prefix in blueprint)
 
-from flask import Blueprint, jsonify
-from bson import ObjectId
-from datetime import datetime
-import json
+# CLI commands (flask --app app images migrate, ...)
+from app import commands
 
-# Add custom JSON encoder for MongoDB ObjectId and datetime
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, ObjectId):
-            return str(obj)
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
+# Create the indexes every model declares (idempotent). Rolling deploys can
+# set AUTO_CREATE_INDEXES=false and run `flask --app app indexes ensure`.
+from app.models import user, post, roommate, trade, chat, message, conversation
+from app.utils.indexes import ensure_indexes
+if db is not None and os.getenv('AUTO_CREATE_INDEXES', 'true').lower() == 'true':
+    try:
+        ensure_indexes()
+    except Exception as e:
+        logger.error("Error creating indexes: %s", e)
 
-# Configure Flask to use our custom JSON encoder
-app.json.encoder = CustomJSONEncoder
+from flask import Blueprint
 
 base = Blueprint("base", __name__)
 
@@ -253,6 +294,40 @@ def root():
 def health():
     return jsonify(ok=True), 200
 
+@base.get("/metrics/user-cache")
+def user_cache_metrics():
+    from app.utils.identity_cache import user_cache
+    return jsonify(user_cache.stats()), 200
+
+@base.get("/metrics/queries")
+def query_metrics():
+    return jsonify(query_monitor.snapshot()), 200
+
+@base.get("/admin/slow-queries")
+def slow_query_report():
+    token = os.getenv('ADMIN_TOKEN')
+    if not token or not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({
+        'enabled': slow_queries.enabled,
+        'threshold_ms': slow_queries.threshold_ms,
+        'shapes': slow_queries.summary(request.args.get('limit', 20, type=int))
+    }), 200
+
+@base.get("/metrics/response-cache")
+def response_cache_metrics():
+    return jsonify(response_cache.stats()), 200
+
+@base.get("/metrics/trade-cycles")
+def trade_cycle_metrics():
+    from app.models.trade import Trade
+    return jsonify(Trade.cycles.stats()), 200
+
+@base.get("/metrics/events")
+def event_metrics():
+    from app.utils.events import broker
+    return jsonify(broker.stats()), 200
+
 app.register_blueprint(base)
 
 if __name__ == '__main__':
@@ -0,0 +1,299 @@
+"""Maintenance commands, run with ``flask --app app <group> <command>``."""
+from datetime import datetime
+
+import click
+from pymongo import UpdateOne
+from app import app, db
+from app.models.chat import Chat
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.models.post import normalize_price
+from app.utils.facets import invalidate as invalidate_facets
+from app.utils.geo import geocode
+from app.utils.ids import REFERENCE_FIELDS, convert_refs
+from app.utils.image_store import InvalidImage, decode_inline_image, externalize_images
+from app.utils.indexes import ensure_indexes, index_report
+from app.utils.response_cache import response_cache
+
+IMAGE_COLLECTIONS = ('posts', 'roommates', 'trades')
+GEO_COLLECTIONS = ('posts', 'roommates')
+
+
+@app.cli.group('images')
+def images_cli():
+    """Image store maintenance."""
+
+
+@images_cli.command('migrate')
+@click.option('--batch-size', default=100, show_default=True, help='Documents fetched per batch.')
+@click.option('--collection', 'collections', multiple=True, type=click.Choice(IMAGE_COLLECTIONS),
+              help='Only migrate these collections (default: all).')
+@click.option('--dry-run', is_flag=True, help='Count documents without changing them.')
+def migrate_images(batch_size, collections, dry_run):
+    """Move inline base64 images out of documents into the image store.
+
+    Safe to re-run: documents that only hold refs or URLs are skipped, and
+    the store dedupes identical images.
+    """
+    for name in collections or IMAGE_COLLECTIONS:
+        collection = db[name]
+        last_id = None
+        moved = scanned = skipped = 0
+        while True:
+            query = {'images.0': {'$exists': True}}
+            if last_id is not None:
+                query['_id'] = {'$gt': last_id}
+            batch = list(collection.find(query, {'images': 1}).sort('_id', 1).limit(batch_size))
+            if not batch:
+                break
+            for doc in batch:
+                scanned += 1
+                images = doc.get('images') or []
+                if not any(decode_inline_image(value) is not None for value in images):
+                    continue
+                if not dry_run:
+                    try:
+                        externalized = externalize_images(images)
+                    except InvalidImage as e:
+                        # Leave it inline; one bad image mustn't stop the run
+                        click.echo(f"{name}: skipping {doc['_id']}: {e}", err=True)
+                        skipped += 1
+                        continue
+                    collection.update_one(
+                        {'_id': doc['_id'], 'images': images},
+                        {'$set': {'images': externalized}}
+                    )
+                moved += 1
+            last_id = batch[-1]['_id']
+        verb = 'would migrate' if dry_run else 'migrated'
+        click.echo(f"{name}: scanned {scanned}, {verb} {moved}, skipped {skipped} with invalid images")
+
+
+@app.cli.group('indexes')
+def indexes_cli():
+    """Index registry maintenance."""
+
+
+@indexes_cli.command('ensure')
+def ensure_indexes_command():
+    """Create every index the models declare (existing ones are left alone)."""
+    for name, created in ensure_indexes().items():
+        click.echo(f"{name}: ensured {', '.join(created) or 'nothing'}")
+
+
+@indexes_cli.command('report')
+def index_report_command():
+    """Show declared indexes that are missing and indexes that are never used."""
+    problems = False
+    for name, entry in index_report().items():
+        for kind in ('missing', 'unused', 'undeclared'):
+            for index in entry[kind]:
+                problems = problems or kind == 'missing'
+                click.echo(f"{name}: {kind} {index}")
+    if not problems:
+        click.echo("All declared indexes exist")
+
+
+@app.cli.group('chats')
+def chats_cli():
+    """Chat storage maintenance."""
+
+
+@chats_cli.command('migrate')
+@click.option('--batch-size', default=100, show_default=True, help='Chats fetched per batch.')
+def migrate_chats(batch_size):
+    """Move embedded chat ``messages`` arrays into bucket documents.
+
+    Each chat is converted in one go and loses its array afterwards, so the
+    command can be re-run until it reports nothing left.
+    """
+    last_id = None
+    chats = moved = 0
+    while True:
+        query = {'messages': {'$exists': True}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = list(db.chats.find(query).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        for chat in batch:
+            moved += Chat.migrate_embedded_messages(chat)
+            chats += 1
+        last_id = batch[-1]['_id']
+    click.echo(f"chats: migrated {chats}, moved {moved} messages into buckets")
+
+
+@app.cli.group('messages')
+def messages_cli():
+    """Direct message maintenance."""
+
+
+@messages_cli.command('migrate')
+@click.option('--batch-size', default=500, show_default=True, help='Messages fetched per batch.')
+def migrate_messages(batch_size):
+    """Add conversation keys and convert string ``timeSent`` values to dates.
+
+    Resumable: converted messages no longer match, so re-running only picks
+    up what is left.
+    """
+    query = {'$or': [{'conv_key': {'$exists': False}}, {'timeSent': {'$type': 'string'}}]}
+    last_id = None
+    migrated = 0
+    while True:
+        batch_query = dict(query, _id={'$gt': last_id}) if last_id is not None else query
+        batch = list(
+            db.messages.find(batch_query, {'senderId': 1, 'receiverId': 1, 'timeSent': 1})
+            .sort('_id', 1).limit(batch_size)
+        )
+        if not batch:
+            break
+        migrated += Message.migrate_batch(batch)
+        last_id = batch[-1]['_id']
+    click.echo(f"messages: migrated {migrated}")
+
+
+@messages_cli.command('rebuild-inbox')
+def rebuild_inbox():
+    """Recompute the per-user inbox rows from the messages collection.
+
+    Only needed once for messages sent before inbox rows existed. Runs in
+    place while the app is serving: existing unread counts are kept and new
+    rows start at 0.
+    """
+    messages = db.messages.find({}, {'senderId': 1, 'receiverId': 1, 'message': 1, 'timeSent': 1}).sort('timeSent', 1)
+    click.echo(f"conversations: rebuilt {Conversation.rebuild(messages)} inbox rows")
+
+
+@app.cli.group('ids')
+def ids_cli():
+    """Reference type maintenance."""
+
+
+@ids_cli.command('migrate')
+@click.option('--batch-size', default=500, show_default=True, help='Documents fetched per batch.')
+@click.option('--restart', is_flag=True, help='Ignore saved progress and scan from the beginning.')
+def migrate_ids(batch_size, restart):
+    """Convert string references (user_id, senderId, ...) to ObjectIds.
+
+    Progress is saved per collection/field in the ``migrations`` collection
+    after every batch, so an interrupted run continues where it stopped.
+    """
+    for name, fields in REFERENCE_FIELDS.items():
+        for field in fields:
+            progress_id = f'typed-ids:{name}.{field}'
+            progress = {} if restart else (db.migrations.find_one({'_id': progress_id}) or {})
+            if progress.get('done'):
+                click.echo(f"{name}.{field}: already done ({progress.get('converted', 0)} converted)")
+                continue
+
+            last_id = progress.get('last_id')
+            converted = progress.get('converted', 0)
+            while True:
+                # $type matches arrays that contain a string, too
+                query = {field: {'$type': 'string'}}
+                if last_id is not None:
+                    query['_id'] = {'$gt': last_id}
+                batch = list(db[name].find(query, {field: 1}).sort('_id', 1).limit(batch_size))
+                if not batch:
+                    break
+
+                ops = []
+                for doc in batch:
+                    value, changed = convert_refs(doc.get(field))
+                    if changed:
+                        # Only if nobody changed the field since we read it
+                        ops.append(UpdateOne({'_id': doc['_id'], field: doc[field]}, {'$set': {field: value}}))
+                if ops:
+                    converted += db[name].bulk_write(ops, ordered=False).modified_count
+                last_id = batch[-1]['_id']
+                db.migrations.update_one(
+                    {'_id': progress_id},
+                    {'$set': {'last_id': last_id, 'converted': converted, 'updated_at': datetime.utcnow()}},
+                    upsert=True
+                )
+
+            db.migrations.update_one(
+                {'_id': progress_id},
+                {'$set': {'done': True, 'converted': converted, 'updated_at': datetime.utcnow()}},
+                upsert=True
+            )
+            click.echo(f"{name}.{field}: converted {converted}")
+
+
+@app.cli.group('geo')
+def geo_cli():
+    """Listing location maintenance."""
+
+
+@geo_cli.command('backfill')
+@click.option('--batch-size', default=500, show_default=True, help='Documents fetched per batch.')
+def backfill_geo(batch_size):
+    """Geocode listings that have a ``location`` but no ``geo`` point.
+
+    Safe to re-run, e.g. after adding places to the gazetteer; locations it
+    still doesn't recognize are counted and left alone.
+    """
+    for name in GEO_COLLECTIONS:
+        last_id = None
+        located = unknown = 0
+        while True:
+            query = {'location': {'$nin': [None, '']}, 'geo': {'$exists': False}}
+            if last_id is not None:
+                query['_id'] = {'$gt': last_id}
+            batch = list(db[name].find(query, {'location': 1}).sort('_id', 1).limit(batch_size))
+            if not batch:
+                break
+
+            ops = []
+            for doc in batch:
+                point = geocode(doc['location'])
+                if point:
+                    # Only if the location wasn't edited since we read it
+                    ops.append(UpdateOne({'_id': doc['_id'], 'location': doc['location']}, {'$set': {'geo': point}}))
+                else:
+                    unknown += 1
+            if ops:
+                located += db[name].bulk_write(ops, ordered=False).modified_count
+            last_id = batch[-1]['_id']
+        click.echo(f"{name}: located {located}, unrecognized {unknown}")
+
+
+@app.cli.group('posts')
+def posts_cli():
+    """Post maintenance."""
+
+
+@posts_cli.command('normalize-prices')
+@click.option('--batch-size', default=500, show_default=True, help='Documents fetched per batch.')
+def normalize_prices(batch_size):
+    """Store numeric string prices ("25", "$1,200") as numbers.
+
+    Posts written before prices were normalized keep strings, which the
+    ``min_price``/``max_price`` filters never match. Safe to re-run; prices
+    that aren't numbers ("free", "OBO") are counted and left alone.
+    """
+    last_id = None
+    converted = skipped = 0
+    while True:
+        query = {'price': {'$type': 'string'}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = list(db.posts.find(query, {'price': 1}).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+
+        ops = []
+        for doc in batch:
+            price = normalize_price(doc['price'])
+            if isinstance(price, str):
+                skipped += 1
+            else:
+                # Only if the price wasn't edited since we read it
+                ops.append(UpdateOne({'_id': doc['_id'], 'price': doc['price']}, {'$set': {'price': price}}))
+        if ops:
+            converted += db.posts.bulk_write(ops, ordered=False).modified_count
+        last_id = batch[-1]['_id']
+    if converted:
+        invalidate_facets()
+        response_cache.invalidate('posts')
+    click.echo(f"posts: converted {converted} prices, left {skipped} non-numeric")
@@ -1,58 +1,208 @@
+import logging
 from datetime import datetime
 from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING, ReturnDocument
 from app import db
-import json
-from app.models.post import JSONEncoder
+from app.utils.indexes import register_indexes
+from app.utils.events import publish
+from app.utils.ids import maybe_object_id
 
+logger = logging.getLogger(__name__)
+
+# Messages per bucket document. Message n of a chat lives in bucket
+# n // BUCKET_SIZE, so appending never touches more than one small document.
+BUCKET_SIZE = 50
+
+
+class InvalidHistoryCursor(ValueError):
+    """Raised for a ``before`` cursor that isn't a message number."""
+
+
+def _parse_time(value):
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+@register_indexes
+class ChatBucket:
+    collection = db.chat_buckets
+    indexes = [
+        IndexModel([('chatId', ASCENDING), ('seq', DESCENDING)], unique=True),
+    ]
+
+
+@register_indexes
 class Chat:
+    """Chat header: who, when, and the last message; messages are in ChatBucket."""
     collection = db.chats
-    
+    indexes = [
+        IndexModel([('friendId', ASCENDING), ('timeUpdated', DESCENDING)]),
+        IndexModel([('userId', ASCENDING), ('timeUpdated', DESCENDING)]),
+    ]
+
     @staticmethod
-    def create_chat(friend_id, friend_profile_pic=None):
+    def create_chat(friend_id, friend_profile_pic=None, user_id=None):
         chat_data = {
             'friendId': ObjectId(friend_id),
             'friendProfilePic': friend_profile_pic,
-            'messages': [],
-            'timeUpdated': datetime.utcnow().isoformat()
+            'messageCount': 0,
+            'lastMessage': None,
+            'timeUpdated': datetime.utcnow()
         }
+        if user_id:
+            chat_data['userId'] = ObjectId(user_id)
         result = Chat.collection.insert_one(chat_data)
         chat_data['_id'] = result.inserted_id
-        return json.loads(json.dumps(chat_data, cls=JSONEncoder))
-    
+        return chat_data
+
     @staticmethod
     def get_by_id(chat_id):
         try:
-            chat = Chat.collection.find_one({'_id': ObjectId(chat_id)})
-            return json.loads(json.dumps(chat, cls=JSONEncoder)) if chat else None
+            chat = Chat.collection.find_one({'_id': ObjectId(chat_id)}, {'messages': 0})
+            return chat
         except Exception as e:
-            print(f"Error getting chat by id: {e}")
+            logger.error("Error getting chat by id: %s", e)
             raise
-    
+
+    @staticmethod
+    def is_member(chat, user_id):
+        return str(user_id) in (str(chat.get('friendId')), str(chat.get('userId')))
+
     @staticmethod
     def add_message(chat_id, from_user, text):
         try:
+            now = datetime.utcnow()
             message = {
-                'from': from_user,
+                'from': maybe_object_id(from_user) or from_user,
                 'text': text,
-                'time': datetime.utcnow().isoformat()
+                'time': now
             }
-            result = Chat.collection.update_one(
+            # Reserve the next message number and update the header in one step
+            chat = Chat.collection.find_one_and_update(
                 {'_id': ObjectId(chat_id)},
                 {
-                    '$push': {'messages': message},
-                    '$set': {'timeUpdated': datetime.utcnow().isoformat()}
-                }
+                    '$inc': {'messageCount': 1},
+                    '$set': {'timeUpdated': now, 'lastMessage': message}
+                },
+                projection={'messageCount': 1, 'friendId': 1, 'userId': 1},
+                return_document=ReturnDocument.AFTER
             )
-            return result.modified_count > 0
+            if not chat:
+                return False
+
+            message['n'] = chat['messageCount'] - 1
+            ChatBucket.collection.update_one(
+                {'chatId': chat['_id'], 'seq': message['n'] // BUCKET_SIZE},
+                {
+                    # Numbers are reserved before the push, so concurrent sends
+                    # can arrive out of order; keep each bucket sorted by n
+                    '$push': {'messages': {'$each': [message], '$sort': {'n': 1}}},
+                    '$inc': {'count': 1},
+                    '$set': {'end': now},
+                    '$setOnInsert': {'start': now}
+                },
+                upsert=True
+            )
+            publish('chat_message', dict(message, chat_id=chat['_id']),
+                    users=[chat.get('friendId'), chat.get('userId')])
+            return True
         except Exception as e:
-            print(f"Error adding message to chat: {e}")
+            logger.error("Error adding message to chat: %s", e)
             raise
-    
+
+    @staticmethod
+    def get_messages(chat_id, before=None, limit=50):
+        """Newest-first page of messages older than message number ``before``.
+
+        Returns ``(messages, next_cursor)``; pass ``next_cursor`` back as
+        ``before`` to load older messages. It is None once the start of the
+        chat is reached.
+        """
+        if before is not None:
+            try:
+                before = int(before)
+            except (TypeError, ValueError):
+                raise InvalidHistoryCursor(f"Invalid cursor: {before}")
+        limit = max(1, min(int(limit), 100))
+
+        chat_id = ObjectId(chat_id)
+        query = {'chatId': chat_id}
+        if before is not None:
+            if before <= 0:
+                return [], None
+            query['seq'] = {'$lte': (before - 1) // BUCKET_SIZE}
+
+        messages = []
+        # Buckets newest-first; a page spans at most limit // BUCKET_SIZE + 2 of them
+        buckets = ChatBucket.collection.find(query, {'messages': 1}).sort('seq', -1).limit(limit // BUCKET_SIZE + 2)
+        for bucket in buckets:
+            # Sorted again for buckets written before pushes kept them in order
+            for message in sorted(bucket['messages'], key=lambda m: m['n'], reverse=True):
+                if before is None or message['n'] < before:
+                    messages.append(message)
+            if len(messages) >= limit:
+                break
+
+        messages = messages[:limit]
+        oldest = messages[-1]['n'] if messages else 0
+        next_cursor = str(oldest) if oldest > 0 else None
+        return messages, next_cursor
+
     @staticmethod
     def get_user_chats(user_id):
         try:
-            chats = list(Chat.collection.find({'friendId': ObjectId(user_id)}).sort('timeUpdated', -1))
-            return json.loads(json.dumps(chats, cls=JSONEncoder))
+            user_id = ObjectId(user_id)
+            chats = list(Chat.collection.find(
+                {'$or': [{'friendId': user_id}, {'userId': user_id}]},
+                {'messages': 0}
+            ).sort('timeUpdated', -1))
+            return chats
         except Exception as e:
-            print(f"Error getting user chats: {e}")
-            raise
\ No newline at end of file
+            logger.error("Error getting user chats: %s", e)
+            raise
+
+    @staticmethod
+    def migrate_embedded_messages(chat):
+        """Move a legacy chat's embedded ``messages`` array into buckets.
+
+        Buckets are rebuilt from the array each time, so an interrupted run
+        can simply be repeated.
+        """
+        messages = [
+            dict(message, n=n, time=_parse_time(message.get('time')))
+            for n, message in enumerate(chat.get('messages') or [])
+        ]
+        buckets = []
+        for start in range(0, len(messages), BUCKET_SIZE):
+            chunk = messages[start:start + BUCKET_SIZE]
+            buckets.append({
+                'chatId': chat['_id'],
+                'seq': start // BUCKET_SIZE,
+                'count': len(chunk),
+                'start': chunk[0]['time'],
+                'end': chunk[-1]['time'],
+                'messages': chunk
+            })
+
+        ChatBucket.collection.delete_many({'chatId': chat['_id']})
+        if buckets:
+            ChatBucket.collection.insert_many(buckets)
+        last = messages[-1] if messages else None
+        if last:
+            last = {k: v for k, v in last.items() if k != 'n'}
+        Chat.collection.update_one(
+            {'_id': chat['_id']},
+            {
+                '$set': {
+                    'messageCount': len(messages),
+                    'lastMessage': last,
+                    'timeUpdated': _parse_time(chat.get('timeUpdated'))
+                },
+                '$unset': {'messages': ''}
+            }
+        )
+        return len(messages)
@@ -0,0 +1,107 @@
+import logging
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING, UpdateOne
+from app import db
+from app.utils.indexes import register_indexes
+
+logger = logging.getLogger(__name__)
+
+@register_indexes
+class Conversation:
+    """Per-user inbox rows, one per counterpart, kept up to date on every message.
+
+    ``{'userId', 'peerId', 'lastMessage', 'lastSenderId', 'timeSent', 'unread'}``
+    """
+    collection = db.conversations
+    indexes = [
+        IndexModel([('userId', ASCENDING), ('peerId', ASCENDING)], unique=True),
+        IndexModel([('userId', ASCENDING), ('timeSent', DESCENDING)]),
+    ]
+
+    @staticmethod
+    def _row_update(user_id, peer_id, message, unread_inc=0):
+        """Upsert of one row that only takes ``message`` if it is the newest.
+
+        Two sends racing for the same pair may commit in either order, so
+        the last-message fields only change when ``message.timeSent`` is not
+        older than the stored one; the unread counter always moves.
+        """
+        sent = message['timeSent']
+        newer = {'$gte': [sent, {'$ifNull': ['$timeSent', sent]}]}    # true for a new row
+
+        def latest(field, value):
+            return {'$cond': [newer, {'$literal': value}, '$' + field]}
+
+        return UpdateOne({'userId': user_id, 'peerId': peer_id}, [{'$set': {
+            'lastMessage': latest('lastMessage', message['message']),
+            'lastMessageId': latest('lastMessageId', message['_id']),
+            'lastSenderId': latest('lastSenderId', message['senderId']),
+            'timeSent': {'$max': ['$timeSent', sent]},
+            'unread': {'$add': [{'$ifNull': ['$unread', 0]}, unread_inc]},
+        }}], upsert=True)
+
+    @staticmethod
+    def record(message):
+        """Update both participants' rows for a newly stored message (one round trip)."""
+        sender, receiver = message['senderId'], message['receiverId']
+        ops = [Conversation._row_update(sender, receiver, message, 0)]
+        if receiver != sender:
+            ops.append(Conversation._row_update(receiver, sender, message, 1))
+        Conversation.collection.bulk_write(ops, ordered=False)
+
+    @staticmethod
+    def get_inbox(user_id, limit=50):
+        try:
+            return list(
+                Conversation.collection.find({'userId': ObjectId(user_id)}, {'userId': 0})
+                .sort('timeSent', -1)
+                .limit(max(1, min(int(limit), 100)))
+            )
+        except Exception as e:
+            logger.error("Error getting inbox: %s", e)
+            raise
+
+    @staticmethod
+    def mark_read(user_id, peer_id):
+        result = Conversation.collection.update_one(
+            {'userId': ObjectId(user_id), 'peerId': ObjectId(peer_id)},
+            {'$set': {'unread': 0}}
+        )
+        return result.matched_count > 0
+
+    @staticmethod
+    def rebuild(messages, batch_size=1000):
+        """Recompute every row from ``messages`` (oldest first), in place.
+
+        Rows are upserted with the same newest-wins update as ``record``, so
+        the inbox stays readable throughout and messages sent meanwhile are
+        not undone; existing unread counts are kept, new rows start at 0.
+        Afterwards rows for pairs without messages are deleted (unless they
+        were written after the rebuild started).
+        """
+        started = datetime.utcnow()
+        latest = {}
+        for message in messages:
+            sender, receiver = message['senderId'], message['receiverId']
+            latest[(sender, receiver)] = message
+            latest[(receiver, sender)] = message
+
+        ops = [
+            Conversation._row_update(user_id, peer_id, message)
+            for (user_id, peer_id), message in latest.items()
+        ]
+        for start in range(0, len(ops), batch_size):
+            Conversation.collection.bulk_write(ops[start:start + batch_size], ordered=False)
+
+        stale = [
+            row['_id']
+            for row in Conversation.collection.find({'timeSent': {'$lt': started}}, {'userId': 1, 'peerId': 1})
+            if (row['userId'], row['peerId']) not in latest
+        ]
+        for start in range(0, len(stale), batch_size):
+            Conversation.collection.delete_many({
+                '_id': {'$in': stale[start:start + batch_size]},
+                'timeSent': {'$lt': started},
+            })
+        return len(ops)
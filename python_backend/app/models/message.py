@@ -1,11 +1,37 @@
+import logging
 from datetime import datetime
 from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING, UpdateOne
 from app import db
-import json
-from app.models.post import JSONEncoder
+from app.utils.indexes import register_indexes
+from app.models.conversation import Conversation
+from app.utils.events import publish
+from app.utils.pagination import InvalidCursor, paginate
 
+logger = logging.getLogger(__name__)
+
+def conversation_key(user1_id, user2_id):
+    """Same key whichever of the two users is the sender."""
+    return ':'.join(sorted((str(user1_id), str(user2_id))))
+
+def _parse_time(value):
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+@register_indexes
 class Message:
     collection = db.messages
+    indexes = [
+        # Serves both directions of a conversation and the sender side of the inbox
+        IndexModel([('senderId', ASCENDING), ('receiverId', ASCENDING), ('timeSent', DESCENDING)]),
+        IndexModel([('receiverId', ASCENDING), ('timeSent', DESCENDING)]),
+        # One range scan per history page, whoever sent what
+        IndexModel([('conv_key', ASCENDING), ('timeSent', DESCENDING), ('_id', DESCENDING)]),
+    ]
     
     @staticmethod
     def create_message(sender_id, receiver_id, message):
@@ -13,25 +39,34 @@ class Message:
             'senderId': ObjectId(sender_id),
             'receiverId': ObjectId(receiver_id),
             'message': message,
-            'timeSent': datetime.utcnow().isoformat()
+            'conv_key': conversation_key(sender_id, receiver_id),
+            'timeSent': datetime.utcnow()
         }
         result = Message.collection.insert_one(message_data)
         message_data['_id'] = result.inserted_id
-        return json.loads(json.dumps(message_data, cls=JSONEncoder))
+        # Keep both inbox rows current so the inbox never aggregates messages
+        Conversation.record(message_data)
+        publish('message', message_data, users=[sender_id, receiver_id])
+        return message_data
     
     @staticmethod
-    def get_conversation(user1_id, user2_id, limit=50):
+    def get_conversation(user1_id, user2_id, before=None, limit=50):
+        """Newest-first page of the conversation: ``(messages, next_cursor)``.
+
+        Pass ``next_cursor`` back as ``before`` to load older messages.
+        """
         try:
-            # Get messages where either user is sender and the other is receiver
-            messages = list(Message.collection.find({
-                '$or': [
-                    {'senderId': ObjectId(user1_id), 'receiverId': ObjectId(user2_id)},
-                    {'senderId': ObjectId(user2_id), 'receiverId': ObjectId(user1_id)}
-                ]
-            }).sort('timeSent', -1).limit(limit))
-            return json.loads(json.dumps(messages, cls=JSONEncoder))
+            return paginate(
+                Message.collection,
+                {'conv_key': conversation_key(user1_id, user2_id)},
+                after=before,
+                limit=limit,
+                field='timeSent'
+            )
+        except InvalidCursor:
+            raise
         except Exception as e:
-            print(f"Error getting conversation: {e}")
+            logger.error("Error getting conversation: %s", e)
             raise
     
     @staticmethod
@@ -44,7 +79,24 @@ class Message:
                     {'receiverId': ObjectId(user_id)}
                 ]
             }).sort('timeSent', -1).limit(limit))
-            return json.loads(json.dumps(messages, cls=JSONEncoder))
+            return messages
         except Exception as e:
-            print(f"Error getting user messages: {e}")
-            raise
\ No newline at end of file
+            logger.error("Error getting user messages: %s", e)
+            raise
+    
+    @staticmethod
+    def migrate_batch(messages):
+        """Add ``conv_key`` and turn ISO string ``timeSent`` values into dates."""
+        ops = [
+            UpdateOne(
+                {'_id': m['_id']},
+                {'$set': {
+                    'conv_key': conversation_key(m['senderId'], m['receiverId']),
+                    'timeSent': _parse_time(m.get('timeSent'))
+                }}
+            )
+            for m in messages
+        ]
+        if ops:
+            Message.collection.bulk_write(ops, ordered=False)
+        return len(ops)
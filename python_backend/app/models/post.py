@@ -1,21 +1,51 @@
+import logging
 from datetime import datetime
-import json
 from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING, ReturnDocument
 from app import db
+from app.utils.indexes import register_indexes
+from app.utils.pagination import paginate, cached_count, keyset_index
+from app.utils.authors import hydrate_authors
+from app.utils.image_store import externalize_images, present_images
+from app.utils.search import invalidate as invalidate_search, text_index
+from app.utils.response_cache import response_cache
+from app.utils.ids import as_object_id, maybe_object_id
+from app.utils.conditional import VALIDATOR_PROJECTION
+from app.utils.geo import geocode, geo_index
+from app.utils.facets import invalidate as invalidate_facets
+from app.utils.ownership import NotFound, Forbidden, owned_by, update_owned, delete_owned
 
-class JSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, ObjectId):
-            return str(o)
-        if isinstance(o, datetime):
-            return o.isoformat()
-        return super().default(o)
+logger = logging.getLogger(__name__)
 
+
+def normalize_price(value):
+    """Numeric strings ("12", "$1,200.50") become numbers, so ?min_price=/?max_price=
+    can match them; anything else is kept as it was."""
+    if isinstance(value, str):
+        try:
+            return float(value.strip().lstrip('$').replace(',', ''))
+        except ValueError:
+            return value
+    return value
+
+
+@register_indexes
 class Post:
     collection = db.posts
+    indexes = [
+        keyset_index(),  # home feed
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)]),  # profile posts
+        IndexModel([('user_id', ASCENDING), ('type', ASCENDING), ('created_at', DESCENDING)]),  # profile posts by type
+        text_index('posts'),  # /api/search
+        geo_index(),  # ?near=
+        # ?category= (+ price range read from the index), ?status=, ?condition=
+        IndexModel([('category', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING), ('price', ASCENDING)]),
+        IndexModel([('status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('condition', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ]
     
     @staticmethod
-    def create_post(user_id, title, description, type='item', category=None, condition=None, images=None, price=None, status='Available'):
+    def create_post(user_id, title, description, type='item', category=None, condition=None, images=None, price=None, status='Available', location=None):
         try:
             post_data = {
                 'user_id': ObjectId(user_id),
@@ -24,17 +54,26 @@ class Post:
                 'type': type,
                 'category': category,
                 'condition': condition,
-                'images': images or [],
-                'price': price,
+                'images': externalize_images(images) or [],
+                'price': normalize_price(price),
                 'status': status,
                 'created_at': datetime.utcnow(),
                 'updated_at': datetime.utcnow()
             }
+            if location is not None:
+                post_data['location'] = location
+                geo = geocode(location)
+                if geo:
+                    post_data['geo'] = geo
             result = Post.collection.insert_one(post_data)
             post_data['_id'] = result.inserted_id
-            return json.loads(json.dumps(post_data, cls=JSONEncoder))
+            invalidate_search('posts', post_data['_id'])
+            response_cache.invalidate('posts')
+            invalidate_facets()
+            present_images([post_data])
+            return post_data
         except Exception as e:
-            print(f"Error creating post: {e}")
+            logger.error("Error creating post: %s", e)
             raise
     
     @staticmethod
@@ -44,77 +83,87 @@ class Post:
             if not post:
                 return None
 
-            # Get author information
-            if post.get('user_id'):
-                author = db.users.find_one({'_id': post['user_id']})
-                if author:
-                    post['author_name'] = author.get('username', 'Unknown')
-                    post['author_image'] = author.get('profile_image')
-                else:
-                    post['author_name'] = 'User not found'
-                    post['author_image'] = None
-            else:
-                post['author_name'] = 'No author specified'
-                post['author_image'] = None
+            # Get author information (memoized for the rest of the request)
+            hydrate_authors([post])
+            present_images([post])
 
-            return json.loads(json.dumps(post, cls=JSONEncoder))
+            return post
         except Exception as e:
-            print(f"Error getting post by id: {e}")
+            logger.error("Error getting post by id: %s", e)
             raise
     
     @staticmethod
-    def get_posts_by_user(user_id):
+    def delete_post(post_id, user_id=None):
+        """Delete a post; with ``user_id`` only if they own it (raises NotFound/Forbidden)."""
         try:
-            posts = list(Post.collection.find({'user_id': ObjectId(user_id)}).sort('created_at', -1))
-            return json.loads(json.dumps(posts, cls=JSONEncoder))
-        except Exception as e:
-            print(f"Error getting posts by user: {e}")
+            if user_id is not None:
+                delete_owned(Post.collection, post_id, owned_by(user_id))
+                deleted = True
+            else:
+                deleted = Post.collection.delete_one({'_id': ObjectId(post_id)}).deleted_count > 0
+            invalidate_search('posts', ObjectId(post_id))
+            response_cache.invalidate('posts')
+            invalidate_facets()
+            return deleted
+        except (NotFound, Forbidden):
             raise
-
-    @staticmethod
-    def delete_post(post_id):
-        try:
-            result = Post.collection.delete_one({'_id': ObjectId(post_id)})
-            return result.deleted_count > 0
         except Exception as e:
-            print(f"Error deleting post: {e}")
+            logger.error("Error deleting post: %s", e)
             raise
 
     @staticmethod
-    def get_all_posts(page: int = 1, limit: int = 20):
-        try:
-            query = {}
-            total = Post.collection.count_documents(query)
+    def get_stamp(post_id):
+        """Just ``_id``/``updated_at``/``created_at``, for conditional GETs."""
+        _id = maybe_object_id(post_id)
+        return Post.collection.find_one({'_id': _id}, VALIDATOR_PROJECTION) if _id else None
 
-            # compute skip safely
-            page = max(1, int(page))
-            limit = max(1, min(int(limit), 100))  
-            skip = (page - 1) * limit
+    @staticmethod
+    def page_stamps(page=1, limit=20, after=None, include_total=False, query=None):
+        """``(stamps, total)``: validator fields of one feed page, for conditional GETs."""
+        query = query or {}
+        stamps, _ = paginate(Post.collection, query, after=after, limit=limit, page=page, projection=VALIDATOR_PROJECTION)
+        total = cached_count(Post.collection, query) if include_total else None
+        return stamps, total
 
-            cursor = (
-                    Post.collection.find(query)
-                    .sort('created_at', -1)
-                    .skip(skip)
-                    .limit(limit)
-                    )
+    @staticmethod
+    def get_all_posts(page: int = 1, limit: int = 20, after=None, include_total=True, query=None):
+        """Return ``(posts, total, next_cursor)`` for the home feed.
 
-            posts = list(cursor)
-            return json.loads(json.dumps(posts, cls=JSONEncoder)), total
+        Pass ``after`` (a cursor from a previous page) for keyset paging;
+        ``page`` is only used for the legacy offset mode. ``total`` is None
+        when ``include_total`` is false. ``query`` narrows the feed (e.g.
+        ``geo.near_filter``) without changing its order.
+        """
+        try:
+            query = query or {}
+            posts, next_cursor = paginate(
+                Post.collection, query, after=after, limit=limit, page=page
+            )
+            hydrate_authors(posts)
+            present_images(posts, thumbnail=True)
+            total = cached_count(Post.collection, query) if include_total else None
+            return posts, total, next_cursor
         except Exception as e:
-            print(f"Error getting all posts: {e}")
+            logger.error("Error getting all posts: %s", e)
             raise
     
     @staticmethod
-    def get_user_posts(user_id):
+    def get_user_posts(user_id, post_type=None):
+        """``user_id``'s posts, newest first, optionally of one ``type``."""
         try:
-            posts = list(Post.collection.find({'user_id': ObjectId(user_id)}).sort('created_at', -1))
-            return json.loads(json.dumps(posts, cls=JSONEncoder))
+            query = {'user_id': as_object_id(user_id)}
+            if post_type is not None:
+                query['type'] = post_type
+            posts = list(Post.collection.find(query).sort('created_at', -1))
+            return present_images(posts, thumbnail=True)
         except Exception as e:
-            print(f"Error getting user posts: {e}")
+            logger.error("Error getting user posts: %s", e)
             raise
     
     @staticmethod
-    def update_post(post_id, title=None, description=None, images=None, price=None):
+    def update_post(post_id, title=None, description=None, images=None, price=None, user_id=None, location=None):
+        """Update a post and return it; with ``user_id`` only if they own it
+        (raises NotFound/Forbidden)."""
         try:
             update_data = {'updated_at': datetime.utcnow()}
             if title is not None:
@@ -122,21 +171,36 @@ class Post:
             if description is not None:
                 update_data['description'] = description
             if images is not None:
-                update_data['images'] = images
+                update_data['images'] = externalize_images(images)
             if price is not None:
-                update_data['price'] = price
-            
-            result = Post.collection.update_one(
-                {'_id': ObjectId(post_id)},
-                {'$set': update_data}
-            )
+                update_data['price'] = normalize_price(price)
+            update = {'$set': update_data}
+            if location is not None:
+                update_data['location'] = location
+                geo = geocode(location)
+                if geo:
+                    update_data['geo'] = geo
+                else:
+                    update['$unset'] = {'geo': ''}
             
-            if result.modified_count:
-                post = Post.get_by_id(post_id)
-                return post
-            return None
+            if user_id is not None:
+                post = update_owned(Post.collection, post_id, owned_by(user_id), update)
+            else:
+                post = Post.collection.find_one_and_update(
+                    {'_id': ObjectId(post_id)},
+                    update,
+                    return_document=ReturnDocument.AFTER
+                )
+            if not post:
+                return None
+
+            invalidate_search('posts', post['_id'])
+            response_cache.invalidate('posts')
+            invalidate_facets()
+            hydrate_authors([post])
+            return present_images([post])[0]
+        except (NotFound, Forbidden):
+            raise
         except Exception as e:
-            print(f"Error updating post: {e}")
+            logger.error("Error updating post: %s", e)
             raise
-        return result.modified_count > 0
-    
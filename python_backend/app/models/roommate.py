@@ -1,22 +1,33 @@
+import logging
 from datetime import datetime
-import json
 from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING, ReturnDocument
 from app import db
+from app.utils.indexes import register_indexes
+from app.utils.pagination import paginate, cached_count, keyset_index
+from app.utils.authors import hydrate_authors
+from app.utils.image_store import externalize_images, present_images
+from app.utils.search import invalidate as invalidate_search, text_index
+from app.utils.response_cache import response_cache
+from app.utils.conditional import VALIDATOR_PROJECTION
+from app.utils.geo import geocode, geo_index
+from app.utils.ids import maybe_object_id
+from app.utils.matching import MATCH_PROJECTION, MatchIndex
+from app.utils.ownership import NotFound, Forbidden, owned_by, update_owned, delete_owned
 
-# --- JSON helpers so ObjectId/datetime serialize cleanly ---
-class _JSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, ObjectId):
-            return str(o)
-        if isinstance(o, datetime):
-            return o.isoformat()
-        return super().default(o)
-
-def _dump(o):
-    return json.loads(json.dumps(o, cls=_JSONEncoder))
+logger = logging.getLogger(__name__)
 
+@register_indexes
 class Roommate:
     collection = db.roommates
+    indexes = [
+        keyset_index(),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        text_index("roommates"),
+        geo_index(),
+    ]
+    # Preference vectors for /api/roommates/matches, kept current by the writes below
+    match_index = MatchIndex(db.roommates)
 
     @staticmethod
     def create_roommate_post(user_id, title, description, type='roommate', preferences=None, location=None, images=None, username=None, year=None
@@ -29,61 +40,73 @@ class Roommate:
             "type": type,
             "preferences": preferences or [],
             "location": location,
-            "images": images or [],
+            "images": externalize_images(images) or [],
             "username": (username or ""),
             "year": (year or ""),
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow(),
         }
+        geo = geocode(location)
+        if geo:
+            roommate_data["geo"] = geo
 
-        # insert and verify what actually got saved
         result = Roommate.collection.insert_one(roommate_data)
-        saved = Roommate.collection.find_one(
-            {"_id": result.inserted_id},
-            {"username": 1, "year": 1}
-        )
-
         roommate_data["_id"] = result.inserted_id
-        return _dump(roommate_data)
+        Roommate.match_index.upsert(roommate_data)
+        invalidate_search("roommates", roommate_data["_id"])
+        response_cache.invalidate("roommates")
+        return present_images([roommate_data])[0]
 
 
     @staticmethod
     def get_by_id(roommate_id):
         doc = Roommate.collection.find_one({"_id": ObjectId(roommate_id)})
-        return _dump(doc) if doc else None
+        return present_images([doc])[0] if doc else None
 
     @staticmethod
     def get_all_roommate_posts():
         """Backward-compatible: return ALL posts (no pagination)."""
         docs = list(Roommate.collection.find().sort("created_at", -1))
-        return _dump(docs)
+        return present_images(hydrate_authors(docs), thumbnail=True)
+
+    # Paginated list (keyset when ``after`` is given, offset otherwise)
+    @staticmethod
+    def get_stamp(roommate_id):
+        """Just ``_id``/``updated_at``/``created_at``, for conditional GETs."""
+        _id = maybe_object_id(roommate_id)
+        return Roommate.collection.find_one({'_id': _id}, VALIDATOR_PROJECTION) if _id else None
+
+    @staticmethod
+    def page_stamps(page=1, limit=20, after=None, include_total=False, query=None):
+        """``(stamps, total)``: validator fields of one feed page, for conditional GETs."""
+        query = query or {}
+        stamps, _ = paginate(Roommate.collection, query, after=after, limit=limit, page=page, projection=VALIDATOR_PROJECTION)
+        total = cached_count(Roommate.collection, query) if include_total else None
+        return stamps, total
 
-    # NEW: paginated list
     @staticmethod
-    def get_all_roommate_posts_paginated(page: int = 1, limit: int = 20):
-        query = {}
-        total = Roommate.collection.count_documents(query)
-        page = max(1, int(page))
-        limit = max(1, min(int(limit), 100))
-        skip = (page - 1) * limit
-        cursor = (
-            Roommate.collection.find(query)
-            .sort("created_at", -1)
-            .skip(skip)
-            .limit(limit)
+    def get_all_roommate_posts_paginated(page: int = 1, limit: int = 20, after=None, include_total=True, query=None):
+        """``query`` narrows the feed (e.g. ``geo.near_filter``); the order is unchanged."""
+        query = query or {}
+        docs, next_cursor = paginate(
+            Roommate.collection, query, after=after, limit=limit, page=page
         )
-        docs = list(cursor)
-        return _dump(docs), total
+        hydrate_authors(docs)
+        present_images(docs, thumbnail=True)
+        total = cached_count(Roommate.collection, query) if include_total else None
+        return docs, total, next_cursor
 
     @staticmethod
     def get_user_roommate_posts(user_id):
         docs = list(Roommate.collection.find({"user_id": ObjectId(user_id)}).sort("created_at", -1))
-        return _dump(docs)
+        return present_images(docs, thumbnail=True)
 
     @staticmethod
-    def update_roommate_post(roommate_id, title=None, description=None, preferences=None, location=None, images=None, year=None):
-        print(f"[DEBUG] Model update method - roommate_id: {roommate_id}")
-        print(f"[DEBUG] Model update method - year parameter: {year}, type: {type(year)}")
+    def update_roommate_post(roommate_id, title=None, description=None, preferences=None, location=None, images=None, year=None, user_id=None):
+        """With ``user_id`` the update only applies to their own post and the
+        updated post is returned (raises NotFound/Forbidden)."""
+        logger.debug("Model update method - roommate_id: %s", roommate_id)
+        logger.debug("Model update method - year parameter: %s, type: %s", year, type(year))
         
         update_data = {"updated_at": datetime.utcnow()}
         if title is not None:
@@ -92,18 +115,83 @@ class Roommate:
             update_data["description"] = description
         if preferences is not None:
             update_data["preferences"] = preferences
+        update = {"$set": update_data}
         if location is not None:
             update_data["location"] = location
+            geo = geocode(location)
+            if geo:
+                update_data["geo"] = geo
+            else:
+                update["$unset"] = {"geo": ""}
         if images is not None:
-            update_data["images"] = images
+            update_data["images"] = externalize_images(images)
         if year is not None:
             update_data["year"] = year
-            print(f"[DEBUG] Adding year to update_data: {year}")
+            logger.debug("Adding year to update_data: %s", year)
 
-        res = Roommate.collection.update_one({"_id": ObjectId(roommate_id)}, {"$set": update_data})
-        return res.modified_count > 0
+        if user_id is not None:
+            doc = update_owned(Roommate.collection, roommate_id, owned_by(user_id), update)
+            Roommate.match_index.upsert(doc)
+            invalidate_search("roommates", doc["_id"])
+            response_cache.invalidate("roommates")
+            return present_images([doc])[0]
+
+        doc = Roommate.collection.find_one_and_update(
+            {"_id": ObjectId(roommate_id)},
+            update,
+            projection=MATCH_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if doc:
+            Roommate.match_index.upsert(doc)
+            invalidate_search("roommates", doc["_id"])
+        response_cache.invalidate("roommates")
+        return doc is not None
 
     @staticmethod
-    def delete_roommate_post(roommate_id):
+    def delete_roommate_post(roommate_id, user_id=None):
+        """With ``user_id`` only their own post is deleted (raises NotFound/Forbidden)."""
+        if user_id is not None:
+            deleted = delete_owned(Roommate.collection, roommate_id, owned_by(user_id))
+            Roommate.match_index.remove(deleted["_id"])
+            invalidate_search("roommates", deleted["_id"])
+            response_cache.invalidate("roommates")
+            return True
+
         res = Roommate.collection.delete_one({"_id": ObjectId(roommate_id)})
-        return res.deleted_count > 0
\ No newline at end of file
+        Roommate.match_index.remove(ObjectId(roommate_id))
+        invalidate_search("roommates", ObjectId(roommate_id))
+        response_cache.invalidate("roommates")
+        return res.deleted_count > 0
+
+    @staticmethod
+    def find_matches(user_id, post_id=None, limit=10):
+        """Best matches for one of ``user_id``'s posts (their newest by default).
+
+        Returns ``(post, matches)``; each match carries a ``match_score``.
+        Raises NotFound when there is no such post and Forbidden when it
+        belongs to someone else.
+        """
+        if post_id:
+            post = Roommate.collection.find_one({"_id": maybe_object_id(post_id)}, MATCH_PROJECTION)
+            if post is None:
+                raise NotFound(post_id)
+            if str(post.get("user_id")) != str(user_id):
+                raise Forbidden(post_id)
+        else:
+            post = Roommate.collection.find_one(
+                {"user_id": ObjectId(user_id)}, MATCH_PROJECTION, sort=[("created_at", -1)]
+            )
+            if post is None:
+                raise NotFound(user_id)
+
+        ranked = Roommate.match_index.matches(post, limit)
+        if not ranked:
+            return post, []
+        docs = {d["_id"]: d for d in Roommate.collection.find({"_id": {"$in": [_id for _id, _ in ranked]}})}
+        matches = []
+        for _id, score in ranked:
+            if _id in docs:
+                docs[_id]["match_score"] = score
+                matches.append(docs[_id])
+        return post, present_images(hydrate_authors(matches), thumbnail=True)
@@ -1,9 +1,24 @@
 from datetime import datetime
 from bson.objectid import ObjectId
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from app import db
+from app.utils.indexes import register_indexes
+from app.utils.image_store import externalize_images, present_images
+from app.utils.events import publish
+from app.utils.response_cache import response_cache
+from app.utils.trade_cycles import TradeCycles
+from app.utils.ownership import any_of, owned_by, update_owned, delete_owned
 
+@register_indexes
 class Trade:
     collection = db.trades
+    indexes = [
+        IndexModel([('status', ASCENDING), ('created_at', DESCENDING)]),  # open trades
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)]),
+        IndexModel([('interested_users', ASCENDING)]),
+    ]
+    # Want graph of open trades for /api/trades/cycles, kept current by the writes below
+    cycles = TradeCycles(db.trades)
     
     @staticmethod
     def create_trade(user_id, item_name, description, images=None, trade_preferences=None):
@@ -11,7 +26,7 @@ class Trade:
             'user_id': ObjectId(user_id),
             'item_name': item_name,
             'description': description,
-            'images': images or [],
+            'images': externalize_images(images) or [],
             'trade_preferences': trade_preferences or {},
             'status': 'open',  # open, pending, completed, cancelled
             'created_at': datetime.utcnow(),
@@ -19,43 +34,67 @@ class Trade:
         }
         result = db.trades.insert_one(trade_data)
         trade_data['_id'] = result.inserted_id
-        return trade_data
+        Trade.cycles.add_trade(trade_data)
+        response_cache.invalidate('trades')
+        return present_images([trade_data])[0]
     
     @staticmethod
     def get_by_id(trade_id):
-        return db.trades.find_one({'_id': ObjectId(trade_id)})
+        trade = db.trades.find_one({'_id': ObjectId(trade_id)})
+        return present_images([trade])[0] if trade else None
     
     @staticmethod
     def get_all_trades():
-        return list(db.trades.find({'status': 'open'}).sort('created_at', -1))
+        trades = list(db.trades.find({'status': 'open'}).sort('created_at', -1))
+        return present_images(trades, thumbnail=True)
     
     @staticmethod
     def get_user_trades(user_id):
-        return list(db.trades.find({
+        trades = list(db.trades.find({
             '$or': [
                 {'user_id': ObjectId(user_id)},
                 {'interested_users': ObjectId(user_id)}
             ]
         }).sort('created_at', -1))
+        return present_images(trades, thumbnail=True)
     
     @staticmethod
-    def update_trade(trade_id, item_name=None, description=None, images=None, trade_preferences=None, status=None):
+    def update_trade(trade_id, item_name=None, description=None, images=None, trade_preferences=None, status=None, user_id=None):
+        """With ``user_id`` only the owner or the listed buyer may update; the
+        updated trade is returned (raises NotFound/Forbidden)."""
         update_data = {'updated_at': datetime.utcnow()}
         if item_name is not None:
             update_data['item_name'] = item_name
         if description is not None:
             update_data['description'] = description
         if images is not None:
-            update_data['images'] = images
+            update_data['images'] = externalize_images(images)
         if trade_preferences is not None:
             update_data['trade_preferences'] = trade_preferences
         if status is not None:
             update_data['status'] = status
         
+        if user_id is not None:
+            allowed = any_of(owned_by(user_id), owned_by(user_id, 'trade_preferences.buyer_id'))
+            trade = update_owned(db.trades, trade_id, allowed, {'$set': update_data})
+            if trade.get('status') == 'open':
+                Trade.cycles.add_trade(trade)
+            else:
+                Trade.cycles.remove_trade(trade['_id'])
+            response_cache.invalidate('trades')
+            publish('trade', {'trade_id': trade_id, 'changes': update_data}, trades=[trade_id])
+            return present_images([trade])[0]
+
         result = db.trades.update_one(
             {'_id': ObjectId(trade_id)},
             {'$set': update_data}
         )
+        if result.modified_count > 0:
+            if status is not None:
+                # Reopened or closed without the document at hand: rebuild on next use
+                Trade.cycles.invalidate()
+            response_cache.invalidate('trades')
+            publish('trade', {'trade_id': trade_id, 'changes': update_data}, trades=[trade_id])
         return result.modified_count > 0
     
     @staticmethod
@@ -64,6 +103,10 @@ class Trade:
             {'_id': ObjectId(trade_id)},
             {'$addToSet': {'interested_users': ObjectId(user_id)}}
         )
+        if result.modified_count > 0:
+            Trade.cycles.add_interest(ObjectId(trade_id), ObjectId(user_id))
+            response_cache.invalidate('trades')
+            publish('trade', {'trade_id': trade_id, 'interest_added': user_id}, trades=[trade_id])
         return result.modified_count > 0
     
     @staticmethod
@@ -72,9 +115,40 @@ class Trade:
             {'_id': ObjectId(trade_id)},
             {'$pull': {'interested_users': ObjectId(user_id)}}
         )
+        if result.modified_count > 0:
+            Trade.cycles.remove_interest(ObjectId(trade_id), ObjectId(user_id))
+            response_cache.invalidate('trades')
+            publish('trade', {'trade_id': trade_id, 'interest_removed': user_id}, trades=[trade_id])
         return result.modified_count > 0
     
     @staticmethod
-    def delete_trade(trade_id):
+    def delete_trade(trade_id, user_id=None):
+        """With ``user_id`` only the owner may delete (raises NotFound/Forbidden)."""
+        if user_id is not None:
+            delete_owned(db.trades, trade_id, owned_by(user_id))
+            Trade.cycles.remove_trade(ObjectId(trade_id))
+            response_cache.invalidate('trades')
+            return True
         result = db.trades.delete_one({'_id': ObjectId(trade_id)})
-        return result.deleted_count > 0
\ No newline at end of file
+        Trade.cycles.remove_trade(ObjectId(trade_id))
+        response_cache.invalidate('trades')
+        return result.deleted_count > 0
+
+    @staticmethod
+    def suggest_cycles(user_id, limit=10):
+        """Exchange cycles ``user_id`` is part of, shortest first.
+
+        Each cycle is a list of legs ``{giver_id, receiver_id, trade}`` where
+        ``trade`` is one of the giver's open trades the receiver wants.
+        """
+        cycles = Trade.cycles.for_user(ObjectId(user_id), limit)
+        trade_ids = {ids[0] for cycle in cycles for _, _, ids in cycle}
+        trades = {t['_id']: t for t in db.trades.find({'_id': {'$in': list(trade_ids)}})} if trade_ids else {}
+        present_images(list(trades.values()), thumbnail=True)
+        return [
+            [
+                {'giver_id': str(giver), 'receiver_id': str(receiver), 'trade': trades.get(ids[0])}
+                for giver, receiver, ids in cycle
+            ]
+            for cycle in cycles
+        ]
@@ -1,10 +1,26 @@
+import logging
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from pymongo import IndexModel, ASCENDING
 from app import db
+from app.utils.indexes import register_indexes
+from app.utils.identity_cache import user_cache, IDENTITY_PROJECTION
 from bson.objectid import ObjectId
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
+@register_indexes
 class User(UserMixin):
+    collection = db.users
+    # Lookups at login/registration; uniqueness is still checked in register()
+    indexes = [
+        IndexModel([('email', ASCENDING)]),
+        IndexModel([('nyu_id', ASCENDING)]),
+        IndexModel([('username', ASCENDING)]),
+        IndexModel([('reset_token', ASCENDING)], sparse=True),
+    ]
+
     def __init__(self, user_data):
         self.user_data = user_data
     
@@ -44,23 +60,21 @@ class User(UserMixin):
 
     @staticmethod
     def cleanup_sessions():
-        """Clean up all user sessions in the database"""
+        """Drop expired sessions and reset tokens (live ones are kept)"""
         try:
-            # Clear any session data stored in MongoDB
-            db.sessions.delete_many({})
-            # Update all users to clear any stored session/remember tokens
+            now = datetime.utcnow()
+            # The TTL index does this too, but only once it exists and about once a minute
+            db.sessions.delete_many({'expires': {'$lte': now}})
             db.users.update_many(
-                {},
+                {'reset_token_expiry': {'$lte': now}},
                 {'$unset': {
-                    'session_token': '',
-                    'remember_token': '',
                     'reset_token': '',
                     'reset_token_expiry': ''
                 }}
             )
             return True
         except Exception as e:
-            print(f"Error cleaning up sessions: {e}")
+            logger.error("Error cleaning up sessions: %s", e)
             return False
     
     @staticmethod
@@ -80,36 +94,42 @@ class User(UserMixin):
             user_data['_id'] = result.inserted_id
             return User(user_data)
         except Exception as e:
-            print(f"Error creating user: {str(e)}")
+            logger.error("Error creating user: %s", str(e))
             return None
         
     @staticmethod
     def get_by_id(user_id):
         try:
-            print(f"Attempting to load user with ID: {user_id}")
+            logger.debug("Attempting to load user with ID: %s", user_id)
             
             if not user_id:
-                print("Warning: Attempted to load user with empty ID")
+                logger.warning("Attempted to load user with empty ID")
                 return None
                 
             # Handle string IDs properly
             if isinstance(user_id, str):
                 if not ObjectId.is_valid(user_id):
-                    print(f"Warning: Invalid ObjectId format: {user_id}")
+                    logger.warning("Invalid ObjectId format: %s", user_id)
                     return None
                 user_id = ObjectId(user_id)
                 
-            print(f"Looking up user with ObjectId: {user_id}")
-            user_data = db.users.find_one({'_id': user_id})
+            # Request memo / process cache first; records there have no password hash
+            user_data = user_cache.get(str(user_id))
+            if user_data:
+                return User(user_data)
+
+            logger.debug("Looking up user with ObjectId: %s", user_id)
+            user_data = db.users.find_one({'_id': user_id}, IDENTITY_PROJECTION)
             
             if not user_data:
-                print(f"Warning: No user found with ID {user_id}")
+                logger.warning("No user found with ID %s", user_id)
                 return None
             
-            print(f"Found user data: {user_data.get('username')} (ID: {user_data.get('_id')})")
+            logger.debug("Found user data: %s (ID: %s)", user_data.get('username'), user_data.get('_id'))
+            user_cache.put(str(user_id), user_data)
             return User(user_data)
         except Exception as e:
-            print(f"Error in get_by_id: {str(e)}")
+            logger.error("Error in get_by_id: %s", str(e))
             return None
     
     @staticmethod
@@ -152,7 +172,22 @@ class User(UserMixin):
             {'_id': ObjectId(self.id)},
             {'$set': {'password': generate_password_hash(password)}}
         )
+        user_cache.invalidate(self.id)
         
+    @staticmethod
+    def find_taken(email, nyu_id, username):
+        """Which of email/nyu_id/username is already registered (one query), or None."""
+        existing = db.users.find_one(
+            {'$or': [{'email': email}, {'nyu_id': nyu_id}, {'username': username}]},
+            {'email': 1, 'nyu_id': 1, 'username': 1}
+        )
+        if not existing:
+            return None
+        for field, value in (('email', email), ('nyu_id', nyu_id), ('username', username)):
+            if existing.get(field) == value:
+                return field
+        return None
+
     @staticmethod
     def get_by_nyu_id(nyu_id):
         user_data = db.users.find_one({'nyu_id': nyu_id})
@@ -1,12 +1,16 @@
+import logging
 from flask import Blueprint, request, jsonify, session
 from flask_login import login_user, logout_user, login_required, current_user
 import sys
 from pprint import pformat
 from app.models.user import User
+from app.utils.identity_cache import user_cache
 import secrets
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 
+logger = logging.getLogger(__name__)
+
 bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
 @bp.route('/register', methods=['POST', 'OPTIONS'])
@@ -20,7 +24,7 @@ def register():
         return jsonify({'error': 'Content-Type must be application/json'}), 415
 
     data = request.get_json()
-    print("Received registration data:", data)  # Debug print
+    logger.debug("Received registration for %s (%s)", data.get('email'), data.get('username'))
     
     if not all(k in data for k in ('email', 'username', 'password', 'NetID')):
         return jsonify({'error': 'Missing required fields'}), 400
@@ -33,19 +37,13 @@ def register():
     if not data['NetID'].strip():
         return jsonify({'error': 'NetID is required'}), 400
     
-    # Check if email is already registered
-    if User.get_by_email(data['email']):
+    # Check email, NetID and username in a single query
+    taken = User.find_taken(data['email'], data['NetID'], data['username'])
+    if taken == 'email':
         return jsonify({'error': 'Email already registered'}), 400
-    
-    # Check if NetID is already registered
-    if User.get_by_nyu_id(data['NetID']):
+    if taken == 'nyu_id':
         return jsonify({'error': 'NetID already registered'}), 400
-        
-    # Check if username is already taken
-    # Using the db connection from app
-    from app import db
-    existing_user = db.users.find_one({'username': data['username']})
-    if existing_user:
+    if taken == 'username':
         return jsonify({'error': 'Username already taken'}), 400
     
     user = User.create_user(
@@ -75,7 +73,7 @@ def login():
     try:
         # Check if user is already authenticated
         if current_user.is_authenticated:
-            print(f"User already authenticated: {current_user.id}")
+            logger.debug("User already authenticated: %s", current_user.id)
             response = jsonify({
                 'success': True,
                 'message': 'Already logged in',
@@ -92,7 +90,7 @@ def login():
             })
             return response
     except Exception as e:
-        print(f"Error checking authentication: {e}")
+        logger.error("Error checking authentication: %s", e)
         return jsonify({'success': False, 'error': 'Authentication error'}), 500
 
     if request.method == 'OPTIONS':
@@ -103,30 +101,28 @@ def login():
         return jsonify({'error': 'Please login'}), 401
         
     data = request.get_json()
-    print("Received login data:", data)  # Debug print
+    logger.debug("Received login for %s", data.get('email'))
     
     if not all(k in data for k in ('email', 'password')):
-        print("Missing required fields")  # Debug print
+        logger.info("Missing required fields")
         return jsonify({'error': 'Missing required fields'}), 400
     
     user = User.get_by_email(data['email'])
-    print("Found user:", user.user_data if user else None)  # Debug print
+    logger.debug("Found user: %s", user.id if user else None)
     
     if user:
-        print("Stored password hash:", user.user_data.get('password'))
-        print("Checking password:", data['password'])
         if user.check_password(data['password']):
-            print("Password check succeeded")
+            logger.debug("Password check succeeded")
             
-            print(f"Starting login process for user ID: {user.id}")
+            logger.debug("Starting login process for user ID: %s", user.id)
             
             # Clear any existing session data
             if current_user.is_authenticated:
-                print(f"Found existing authenticated user: {current_user.id}")
+                logger.debug("Found existing authenticated user: %s", current_user.id)
                 logout_user()
                 
             session.clear()
-            print("Cleared session")
+            logger.debug("Cleared session")
             
             # Expire all existing cookies in response
             response = jsonify({
@@ -146,7 +142,7 @@ def login():
             
             # Log in the new user with fresh session
             if not login_user(user, remember=True, fresh=True):
-                print(f"Failed to login user: {user.id}")
+                logger.error("Failed to login user: %s", user.id)
                 return jsonify({'error': 'Failed to log in user'}), 500
             
             # Set minimal session data
@@ -154,17 +150,17 @@ def login():
             session['_fresh'] = True
             session.modified = True
             
-            print(f"Successfully logged in user: {user.id}")
+            logger.debug("Successfully logged in user: %s", user.id)
             
             # Verify the logged-in user
             if current_user.is_authenticated:
-                print(f"Verified logged in user: {current_user.id}")
+                logger.debug("Verified logged in user: %s", current_user.id)
             else:
-                print("Warning: User not authenticated after login!")
+                logger.warning("User not authenticated after login!")
                 
             return response
             
-            print(f"Session after setting data: {session}")
+            logger.debug("Session after setting data: %s", session)
             
             # Create response with user data
             response = jsonify({
@@ -196,24 +192,24 @@ def login():
                 max_age=7 * 24 * 3600  # 7 days
             )
             
-            print(f"Current user after login: {current_user.id if current_user.is_authenticated else 'Not authenticated'}")
-            print(f"Final session state: {session}")
-            print(f"Response headers: {dict(response.headers)}")
+            logger.debug("Current user after login: %s", current_user.id if current_user.is_authenticated else 'Not authenticated')
+            logger.debug("Final session state: %s", session)
+            logger.debug("Response headers: %s", response.headers)
             
             # Test if the user loader works
             from app import login_manager
             test_user = login_manager.user_callback(user.id)
-            print(f"Test user load: {test_user.id if test_user else 'None'}")
+            logger.debug("Test user load: %s", test_user.id if test_user else 'None')
             
             return response
         else:
-            print("Password check failed")
+            logger.info("Password check failed")
     
     if not user:
-        print("User not found")  # Debug print
+        logger.info("User not found")
         return jsonify({'error': 'Invalid email or password'}), 401
     
-    print("Password incorrect")  # Debug print
+    logger.debug("Password incorrect")
     return jsonify({'error': 'Invalid email or password'}), 401
 
 @bp.route('/logout', methods=['POST', 'OPTIONS'])
@@ -225,7 +221,7 @@ def logout():
     try:
         # Get user info before logout for logging
         user_id = current_user.get_id() if current_user.is_authenticated else None
-        print(f"Starting logout for user: {user_id}")
+        logger.debug("Starting logout for user: %s", user_id)
         
         # If we have a logged-in user, update their record
         if user_id:
@@ -237,6 +233,7 @@ def logout():
                     'remember_token': '',
                 }}
             )
+            user_cache.invalidate(user_id)
         
         # Clear Flask-Login's session
         logout_user()
@@ -261,11 +258,11 @@ def logout():
                 response.set_cookie(cookie_name, '', expires=0, secure=True,
                                  httponly=True, samesite='Lax', domain=None, path=path)
         
-        print(f"Successfully logged out user: {user_id}")
+        logger.debug("Successfully logged out user: %s", user_id)
         return response
         
     except Exception as e:
-        print(f"Error during logout: {e}")
+        logger.error("Error during logout: %s", e)
         # Even if there's an error, try to clear everything
         session.clear()
         response = jsonify({'message': 'Logged out with errors'})
@@ -0,0 +1,77 @@
+import logging
+from bson.objectid import ObjectId
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from app.models.chat import Chat, InvalidHistoryCursor
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('chats', __name__, url_prefix='/api/chats')
+
+def _member_chat(chat_id):
+    """``(chat, None)`` for a chat the current user is in, else ``(None, error response)``."""
+    if not ObjectId.is_valid(chat_id):
+        return None, (jsonify({'error': 'Chat not found'}), 404)
+    chat = Chat.get_by_id(chat_id)
+    if not chat:
+        return None, (jsonify({'error': 'Chat not found'}), 404)
+    if not Chat.is_member(chat, current_user.id):
+        return None, (jsonify({'error': 'Not part of this chat'}), 403)
+    return chat, None
+
+@bp.route('', methods=['GET'])
+@login_required
+def list_chats():
+    """Chat headers (last message, no history) for the inbox."""
+    try:
+        return jsonify({'chats': Chat.get_user_chats(current_user.id)}), 200
+    except Exception as e:
+        logger.error("Error listing chats: %s", e)
+        return jsonify({'error': 'Failed to load chats'}), 500
+
+@bp.route('', methods=['POST'])
+@login_required
+def create_chat():
+    data = request.get_json(silent=True) or {}
+    friend_id = data.get('friend_id')
+    if not friend_id or not ObjectId.is_valid(friend_id):
+        return jsonify({'error': 'A valid friend_id is required'}), 400
+    chat = Chat.create_chat(friend_id, data.get('friend_profile_pic'), user_id=current_user.id)
+    return jsonify({'success': True, 'chat': chat}), 201
+
+@bp.route('/<chat_id>', methods=['GET'])
+@login_required
+def get_chat(chat_id):
+    chat, error = _member_chat(chat_id)
+    if error:
+        return error
+    return jsonify(chat), 200
+
+@bp.route('/<chat_id>/messages', methods=['GET'])
+@login_required
+def get_messages(chat_id):
+    """Newest-first history; ``?before=<next_cursor>`` loads older messages."""
+    chat, error = _member_chat(chat_id)
+    if error:
+        return error
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    try:
+        messages, next_cursor = Chat.get_messages(chat['_id'], request.args.get('before'), limit)
+    except InvalidHistoryCursor as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'messages': messages, 'next_cursor': next_cursor}), 200
+
+@bp.route('/<chat_id>/messages', methods=['POST'])
+@login_required
+def add_message(chat_id):
+    chat, error = _member_chat(chat_id)
+    if error:
+        return error
+    text = ((request.get_json(silent=True) or {}).get('text') or '').strip()
+    if not text:
+        return jsonify({'error': 'Message text is required'}), 400
+    Chat.add_message(chat['_id'], current_user.id, text)
+    return jsonify({'success': True}), 201
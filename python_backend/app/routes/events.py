@@ -0,0 +1,56 @@
+import logging
+from bson.objectid import ObjectId
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_login import current_user
+from app.utils.events import broker, format_sse, trade_topic, user_topic
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('events', __name__, url_prefix='/api/events')
+
+# Comment line sent when idle so proxies don't close the connection
+HEARTBEAT_SECONDS = 15
+
+def _header_user_id():
+    # Trade pages authenticate with X-User-ID; EventSource can't set headers,
+    # so ?user_id= is accepted the same way. It is only a claimed identity,
+    # so it never unlocks the user's own (message-carrying) topic.
+    user_id = request.headers.get('X-User-ID') or request.args.get('user_id')
+    if user_id and ObjectId.is_valid(user_id):
+        return user_id
+    return None
+
+@bp.route('', methods=['GET'])
+def stream():
+    """Server-sent events for the current user and any ``?trades=<id>,<id>``.
+
+    Events: ``trade`` (status/field changes and interest) and ``message``.
+    Only a logged-in session receives its ``user:<id>`` events; an
+    ``X-User-ID`` / ``?user_id=`` caller may only follow trades.
+    """
+    trade_ids = [t for t in request.args.get('trades', '').split(',') if ObjectId.is_valid(t)]
+    topics = [trade_topic(t) for t in trade_ids]
+    if current_user.is_authenticated:
+        user_id = current_user.id
+        topics.append(user_topic(user_id))
+    else:
+        user_id = _header_user_id()
+        if not user_id:
+            return jsonify({'error': 'Authentication required'}), 401
+        if not topics:
+            return jsonify({'error': 'Log in to receive user events, or pass ?trades='}), 401
+
+    def generate():
+        # Subscribe only once the stream is actually being consumed, so a
+        # client that goes away before the first chunk leaves nothing behind
+        with broker.subscribe(topics) as subscription:
+            logger.debug("Event stream opened for user %s (%d trades)", user_id, len(trade_ids))
+            yield b'retry: 5000\n\n'
+            while True:
+                item = subscription.get(timeout=HEARTBEAT_SECONDS)
+                yield format_sse(*item) if item else b': keepalive\n\n'
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let nginx buffer the stream
+    return response
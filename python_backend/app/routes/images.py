@@ -0,0 +1,68 @@
+from flask import Blueprint, request, jsonify, make_response
+from flask_login import login_required
+from app.utils.image_store import (
+    InvalidImage, decode_inline_image, get_image_store, image_url, is_image_ref
+)
+
+bp = Blueprint('images', __name__, url_prefix='/api/images')
+
+# Content-addressed, so a given URL never changes
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+def _present(digest):
+    return {
+        'id': digest,
+        'url': image_url(digest),
+        'thumbnail_url': image_url(digest, thumbnail=True)
+    }
+
+@bp.route('', methods=['POST'])
+@bp.route('/', methods=['POST'])
+@login_required
+def upload_images():
+    """Store uploaded images: multipart ``file``/``files`` or JSON ``images`` (base64)."""
+    blobs = [f.read() for f in request.files.getlist('file') + request.files.getlist('files')]
+    if not blobs:
+        data = request.get_json(silent=True) or {}
+        inline = data.get('images') or ([data['image']] if data.get('image') else [])
+        for value in inline:
+            blob = decode_inline_image(value)
+            if blob is None:
+                return jsonify({'success': False, 'error': 'Images must be base64-encoded JPEG, PNG, GIF or WebP'}), 400
+            blobs.append(blob)
+    if not blobs:
+        return jsonify({'success': False, 'error': 'No images provided'}), 400
+
+    try:
+        digests = [get_image_store().put(blob) for blob in blobs]
+    except InvalidImage as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    return jsonify({'success': True, 'images': [_present(d) for d in digests]}), 201
+
+def _serve(digest, variant):
+    if not is_image_ref(digest):
+        return jsonify({'error': 'Image not found'}), 404
+
+    etag = f'"{digest}-{variant}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = make_response('', 304)
+    else:
+        found = get_image_store().read(digest, variant)
+        if not found:
+            return jsonify({'error': 'Image not found'}), 404
+        data, content_type = found
+        response = make_response(data)
+        response.headers['Content-Type'] = content_type
+
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE
+    return response
+
+@bp.route('/<digest>', methods=['GET'])
+def get_image(digest):
+    return _serve(digest, 'original')
+
+@bp.route('/<digest>/thumbnail', methods=['GET'])
+def get_thumbnail(digest):
+    return _serve(digest, 'thumbnail')
@@ -0,0 +1,78 @@
+import logging
+from bson.objectid import ObjectId
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from app.models.message import Message
+from app.models.conversation import Conversation
+from app.utils.authors import resolve_authors
+from app.utils.pagination import InvalidCursor
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('messages', __name__, url_prefix='/api/messages')
+
+@bp.route('', methods=['POST'])
+@login_required
+def send_message():
+    data = request.get_json(silent=True) or {}
+    receiver_id = data.get('receiver_id')
+    text = (data.get('message') or '').strip()
+    if not receiver_id or not ObjectId.is_valid(receiver_id):
+        return jsonify({'error': 'A valid receiver_id is required'}), 400
+    if not text:
+        return jsonify({'error': 'Message text is required'}), 400
+    try:
+        message = Message.create_message(current_user.id, receiver_id, text)
+        return jsonify({'success': True, 'message': message}), 201
+    except Exception as e:
+        logger.error("Error sending message: %s", e)
+        return jsonify({'error': 'Failed to send message'}), 500
+
+@bp.route('/inbox', methods=['GET'])
+@login_required
+def get_inbox():
+    """One row per counterpart: last message, when, and how many are unread."""
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    try:
+        rows = Conversation.get_inbox(current_user.id, limit)
+        peers = resolve_authors([row['peerId'] for row in rows])
+        for row in rows:
+            peer = peers.get(row['peerId'])
+            row['peer_name'] = peer.get('username', 'Unknown') if peer else 'User not found'
+            row['peer_image'] = peer.get('profile_image') if peer else None
+        return jsonify({'conversations': rows}), 200
+    except Exception as e:
+        logger.error("Error loading inbox: %s", e)
+        return jsonify({'error': 'Failed to load inbox'}), 500
+
+@bp.route('/<peer_id>', methods=['GET'])
+@login_required
+def get_conversation(peer_id):
+    """Newest-first history; ``?before=<next_cursor>`` loads older messages."""
+    if not ObjectId.is_valid(peer_id):
+        return jsonify({'error': 'Invalid user id'}), 400
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    try:
+        messages, next_cursor = Message.get_conversation(
+            current_user.id, peer_id, before=request.args.get('before'), limit=limit
+        )
+        return jsonify({'messages': messages, 'next_cursor': next_cursor}), 200
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error("Error loading conversation: %s", e)
+        return jsonify({'error': 'Failed to load conversation'}), 500
+
+@bp.route('/<peer_id>/read', methods=['POST'])
+@login_required
+def mark_read(peer_id):
+    if not ObjectId.is_valid(peer_id):
+        return jsonify({'error': 'Invalid user id'}), 400
+    Conversation.mark_read(current_user.id, peer_id)
+    return jsonify({'success': True}), 200
@@ -1,10 +1,30 @@
+import logging
 from flask import Blueprint, request, jsonify, make_response, session
 from flask_login import login_required, current_user
 from app.models.post import Post
+from app.utils.pagination import InvalidCursor
+from app.utils.ownership import NotFound, Forbidden
+from app.utils.conditional import check_not_modified, compute_validators, is_conditional, with_validators
+from app.utils.response_cache import response_cache
+from app.utils.geo import InvalidLocation, near_filter
+from app.utils.facets import InvalidFilter, combine, facet_counts, parse_filters
+from app.utils.image_store import InvalidImage
+
+logger = logging.getLogger(__name__)
 
 bp = Blueprint('posts', __name__)
 
+def _flag(name, default):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+def _first_page():
+    return not request.args.get('after') and request.args.get('page', '1').strip() == '1'
+
 @bp.route('/posts', methods=['GET'])
+@response_cache.cached(tags=('posts',), when=_first_page)
 def get_posts():
     try:
         # Parse and validate query params
@@ -14,32 +34,71 @@ def get_posts():
         except ValueError:
             return jsonify({"error": "page and limit must be integers"}), 400
 
+        # ?after=<cursor> switches to keyset paging; an empty value asks for
+        # the first page. Totals are skipped in cursor mode unless requested.
+        after = request.args.get('after')
+        include_total = _flag('include_total', after is None)
+
+        # ?near=<lat>,<lng>|<place>&radius=<meters> and the category/condition/
+        # status/type/price filters narrow the feed; the order stays the same
+        try:
+            near = near_filter(request.args.get('near'), request.args.get('radius'))
+            filters = parse_filters(request.args)
+        except (InvalidLocation, InvalidFilter) as e:
+            return jsonify({"error": str(e)}), 400
+        query = combine(near, filters)
+        # Facet counts (cached) come with the first page unless ?facets=false
+        facets = facet_counts(Post.collection, filters, near) if _flag('facets', _first_page()) else None
+
       # call model
-        posts, total = Post.get_all_posts(page=page, limit=limit)
+        try:
+            # Revalidation: compare against a projection of the page first
+            if is_conditional():
+                stamps, total = Post.page_stamps(
+                    page=page, limit=limit, after=after, include_total=include_total, query=query
+                )
+                not_modified = check_not_modified(stamps, total, facets)
+                if not_modified:
+                    return not_modified
 
-        return jsonify({
+            posts, total, next_cursor = Post.get_all_posts(
+                page=page, limit=limit, after=after, include_total=include_total, query=query
+            )
+        except InvalidCursor as e:
+            return jsonify({"error": str(e)}), 400
+
+        body = {
             "posts": posts,
-            "page": max(1, page),
             "limit": max(1, min(limit, 100)),
-            "total": total
-        }), 200
+            "next_cursor": next_cursor
+        }
+        if after is None:
+            body["page"] = max(1, page)
+        if include_total:
+            body["total"] = total
+        if facets is not None:
+            body["facets"] = facets
+        response = jsonify(body)
+        if posts:
+            with_validators(response, *compute_validators(posts, total, facets))
+        return response, 200
     except Exception as e:
-        print(f"Error getting posts: {e}")
+        logger.error("Error getting posts: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @bp.route('/posts', methods=['POST'])
 @login_required
 def create_post():
-    print("Creating new post...")
-    print(f"Session: {session}")
-    print(f"Current user: {current_user.id if current_user else 'No current user'}")
-    print(f"Headers: {dict(request.headers)}")
+    logger.debug("Creating new post...")
+    logger.debug("Session: %s", session)
+    logger.debug("Current user: %s", current_user.id if current_user else 'No current user')
+    logger.debug("Headers: %s", request.headers)
     
     data = request.get_json()
-    print("Received data:", data)
+    logger.debug("Received fields: %s", list(data or {}))
     
     if not all(k in data for k in ('title', 'description')):
-        print("Missing required fields")
+        logger.info("Missing required fields")
         return jsonify({'success': False, 'error': 'Missing required fields'}), 400
     
     try:
@@ -48,14 +107,14 @@ def create_post():
         user_id_header = request.headers.get('X-User-ID')
         
         if user_id_header:
-            print(f"X-User-ID header present: {user_id_header}")
+            logger.debug("X-User-ID header present: %s", user_id_header)
             if user_id_header != str(user_id):
-                print(f"Warning: X-User-ID header ({user_id_header}) doesn't match session user ({user_id})")
-                print("Using session user ID for consistency")
+                logger.warning("X-User-ID header (%s) doesn't match session user (%s)", user_id_header, user_id)
+                logger.debug("Using session user ID for consistency")
         else:
-            print("No X-User-ID header present, using session user")
+            logger.debug("No X-User-ID header present, using session user")
         
-        print(f"Creating post for user: {user_id}")
+        logger.debug("Creating post for user: %s", user_id)
         post = Post.create_post(
             user_id=user_id,
             title=data['title'],
@@ -65,19 +124,21 @@ def create_post():
             condition=data.get('condition'),
             images=data.get('images'),
             price=data.get('price'),
-            status=data.get('status', 'Available')
+            status=data.get('status', 'Available'),
+            location=data.get('location')
         )
-        print("Post created successfully:", post)
+        logger.debug("Post created successfully: %s", post.get('_id'))
         
         response_data = {
             'success': True,
             'post': post,
             'message': 'Post created successfully'
         }
-        print("Sending response:", response_data)
         return jsonify(response_data), 201
+    except InvalidImage as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        print(f"Error creating post: {e}")
+        logger.error("Error creating post: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -85,11 +146,16 @@ def create_post():
 
 @bp.route('/posts/<post_id>', methods=['GET'])
 def get_post(post_id):
+    if is_conditional():
+        not_modified = check_not_modified(Post.get_stamp(post_id))
+        if not_modified:
+            return not_modified
+
     post = Post.get_by_id(post_id)
     if not post:
         return jsonify({'error': 'Post not found'}), 404
     
-    return jsonify(post), 200
+    return with_validators(jsonify(post), *compute_validators(post)), 200
 
 @bp.route('/users/profile/posts', methods=['GET', 'OPTIONS'])
 @login_required
@@ -109,31 +175,31 @@ def get_user_posts():
         
     try:
         # Log request information for debugging
-        print(f"GET /users/profile/posts request received")
-        print(f"Headers: {dict(request.headers)}")
-        print(f"Session: {session}")
-        print(f"Cookie: {request.cookies}")
+        logger.debug("GET /users/profile/posts request received")
+        logger.debug("Headers: %s", request.headers)
+        logger.debug("Session: %s", session)
+        logger.debug("Cookie names: %s", list(request.cookies))
         
         # Check auth and get user_id
         if not current_user.is_authenticated:
-            print(f"User not authenticated")
+            logger.debug("User not authenticated")
             return jsonify({'error': 'User not authenticated'}), 401
 
         # Check if the user ID header matches the session user
         user_id_header = request.headers.get('X-User-ID')
         if user_id_header:
             if user_id_header == 'undefined' or user_id_header == 'null' or not user_id_header.strip():
-                print(f"Invalid X-User-ID header: {user_id_header}")
-                print("Continuing with session user ID")
+                logger.info("Invalid X-User-ID header: %s", user_id_header)
+                logger.debug("Continuing with session user ID")
             elif user_id_header != str(current_user.id):
-                print(f"Warning: X-User-ID header ({user_id_header}) doesn't match session user ({current_user.id})")
-                print("Continuing with session user")
+                logger.warning("X-User-ID header (%s) doesn't match session user (%s)", user_id_header, current_user.id)
+                logger.debug("Continuing with session user")
         else:
-            print("No X-User-ID header present, using session user")
+            logger.debug("No X-User-ID header present, using session user")
             
-        print(f"Fetching posts for user: {current_user.id}")
+        logger.debug("Fetching posts for user: %s", current_user.id)
         # Get posts for the current logged-in user
-        posts = Post.get_posts_by_user(current_user.id)
+        posts = Post.get_user_posts(current_user.id)
         
         # Ensure consistent format with users.py endpoint
         return jsonify({
@@ -141,7 +207,7 @@ def get_user_posts():
             "posts": posts
         }), 200
     except Exception as e:
-        print(f"Error getting user posts: {e}")
+        logger.error("Error getting user posts: %s", e)
         return jsonify({
             "success": False,
             "error": str(e)
@@ -155,42 +221,34 @@ def delete_post(post_id):
         user_id_header = request.headers.get('X-User-ID')
         if user_id_header:
             if user_id_header == 'undefined' or user_id_header == 'null':
-                print(f"Invalid X-User-ID header in delete_post: {user_id_header}")
+                logger.info("Invalid X-User-ID header in delete_post: %s", user_id_header)
                 # Continue using session user
             else:
-                print(f"Using X-User-ID header: {user_id_header}")
+                logger.debug("Using X-User-ID header: %s", user_id_header)
         else:
-            print(f"No X-User-ID header, using session user")
+            logger.debug("No X-User-ID header, using session user")
         
-        # First get the post to verify ownership
-        post = Post.get_by_id(post_id)
-        if not post:
+        # Ownership is checked as part of the delete itself
+        try:
+            Post.delete_post(post_id, user_id=current_user.id)
+        except NotFound:
             return jsonify({
                 'success': False,
                 'error': 'Post not found'
             }), 404
-
-        # Verify that the current user owns this post
-        if str(post['user_id']) != current_user.id:
-            print(f"Authorization failure - post owner: {post['user_id']}, current user: {current_user.id}")
+        except Forbidden:
+            logger.warning("Authorization failure - post %s, current user: %s", post_id, current_user.id)
             return jsonify({
                 'success': False,
                 'error': 'Not authorized to delete this post'
             }), 403
 
-        # Delete the post
-        if Post.delete_post(post_id):
-            return jsonify({
-                'success': True,
-                'message': 'Post deleted successfully'
-            }), 200
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to delete post'
-            }), 500
+        return jsonify({
+            'success': True,
+            'message': 'Post deleted successfully'
+        }), 200
     except Exception as e:
-        print(f"Error deleting post: {e}")
+        logger.error("Error deleting post: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -200,39 +258,37 @@ def delete_post(post_id):
 @login_required
 def update_post(post_id):
     try:
-        post = Post.get_by_id(post_id)
-        if not post:
+        data = request.get_json()
+        try:
+            post = Post.update_post(
+                post_id=post_id,
+                title=data.get('title'),
+                description=data.get('description'),
+                images=data.get('images'),
+                price=data.get('price'),
+                location=data.get('location'),
+                user_id=current_user.id
+            )
+        except NotFound:
             return jsonify({
                 'success': False,
                 'error': 'Post not found'
             }), 404
-        
-        if str(post['user_id']) != current_user.id:
+        except Forbidden:
             return jsonify({
                 'success': False,
                 'error': 'Not authorized to edit this post'
             }), 403
         
-        data = request.get_json()
-        success = Post.update_post(
-            post_id=post_id,
-            title=data.get('title'),
-            description=data.get('description'),
-            images=data.get('images'),
-            price=data.get('price')
-        )
-        
-        if success:
-            return jsonify({
-                'success': True,
-                'message': 'Post updated successfully'
-            }), 200
         return jsonify({
-            'success': False,
-            'error': 'Failed to update post'
-        }), 500
+            'success': True,
+            'message': 'Post updated successfully',
+            'post': post
+        }), 200
+    except InvalidImage as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        print(f"Error updating post: {e}")
+        logger.error("Error updating post: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
@@ -241,13 +297,13 @@ def update_post(post_id):
 @bp.route('/users/<user_id>/posts', methods=['GET'])
 def get_posts_by_user_id(user_id):
     try:
-        posts = Post.get_posts_by_user(user_id)
+        posts = Post.get_user_posts(user_id)
         return jsonify({
             'success': True,
             'posts': posts
         }), 200
     except Exception as e:
-        print(f"Error getting user posts: {e}")
+        logger.error("Error getting user posts: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
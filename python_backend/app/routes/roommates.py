@@ -1,8 +1,17 @@
+import logging
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from app.models.roommate import Roommate
+from app.utils.pagination import InvalidCursor
+from app.utils.ownership import NotFound, Forbidden
+from app.utils.conditional import check_not_modified, compute_validators, is_conditional, with_validators
+from app.utils.response_cache import response_cache
+from app.utils.matching import DEFAULT_LIMIT, MAX_LIMIT
+from app.utils.geo import InvalidLocation, near_filter
+from app.utils.image_store import InvalidImage
 from bson import ObjectId
-from app import db
+
+logger = logging.getLogger(__name__)
 
 bp = Blueprint('roommates', __name__)
 
@@ -16,11 +25,14 @@ def _present_roommate(doc):
         "id": str(doc.get("_id")) if doc.get("_id") is not None else None,
         "user_id": str(doc.get("user_id")) if doc.get("user_id") is not None else None,
         "username": doc.get("username", ""),
+        "author_name": doc.get("author_name", doc.get("username", "")),
+        "author_image": doc.get("author_image"),
         "year": doc.get("year", ""),
         "title": doc.get("title", ""),
         "description": doc.get("description", ""),
         "preferences": doc.get("preferences", []),
         "location": doc.get("location", ""),
+        "geo": doc.get("geo"),
         "images": doc.get("images", []),
         "created_at": doc.get("created_at"),
         "updated_at": doc.get("updated_at"),
@@ -43,36 +55,71 @@ def roommates_user_options(user_id):
     return ("", 200)
 
 
-# GET /api/roommates?page=&limit=
+# GET /api/roommates?page=&limit=  or  ?after=<cursor>&limit=  (+ ?near=&radius=)
 @bp.route("/roommates", methods=["GET"])
+@response_cache.cached(tags=("roommates",))
 def get_roommate_posts():
     try:
         page = request.args.get('page')
         limit = request.args.get('limit')
+        after = request.args.get('after')
+
+        near = request.args.get('near')
 
-        if page or limit:
+        if page or limit or after is not None or near:
             try:
                 page = int(page or 1)
                 limit = int(limit or 20)
             except ValueError:
                 return _error("page and limit must be integers", 400)
 
-            docs, total = Roommate.get_all_roommate_posts_paginated(page=page, limit=limit)
+            # ?near=<lat>,<lng>|<place>&radius=<meters> narrows the feed, same order
+            try:
+                query = near_filter(near, request.args.get('radius'))
+            except InvalidLocation as e:
+                return _error(str(e), 400)
+
+            include_total = request.args.get('include_total', 'true' if after is None else 'false')
+            include_total = include_total.lower() in ('1', 'true', 'yes')
+
+            try:
+                if is_conditional():
+                    stamps, total = Roommate.page_stamps(
+                        page=page, limit=limit, after=after, include_total=include_total, query=query
+                    )
+                    not_modified = check_not_modified(stamps, total)
+                    if not_modified:
+                        return not_modified
+
+                docs, total, next_cursor = Roommate.get_all_roommate_posts_paginated(
+                    page=page, limit=limit, after=after, include_total=include_total, query=query
+                )
+            except InvalidCursor as e:
+                return _error(str(e), 400)
+
+            validators = compute_validators(docs, total) if docs else None
             docs = [_present_roommate(d) for d in docs]
-            return jsonify({
+            body = {
                 "success": True,
                 "roommates": docs,
-                "page": max(1, page),
                 "limit": max(1, min(limit, 100)),
-                "total": total
-            }), 200
+                "next_cursor": next_cursor
+            }
+            if after is None:
+                body["page"] = max(1, page)
+            if include_total:
+                body["total"] = total
+            response = jsonify(body)
+            if validators:
+                with_validators(response, *validators)
+            return response, 200
 
         posts = Roommate.get_all_roommate_posts()
         posts = [_present_roommate(p) for p in posts]
         return jsonify({"success": True, "roommates": posts}), 200
 
     except Exception as e:
-        print(f"[roommates.get] error: {e}")
+        logger.error("[roommates.get] error: %s", e)
         return _error(str(e), 500)
 
 # POST /api/roommates
@@ -82,9 +129,9 @@ def get_roommate_posts():
 
 def create_roommate_post():
     try:
-        print("Creating new roommate post...")
+        logger.debug("Creating new roommate post...")
         data = request.get_json(silent=True) or {}
-        print("Received data:", data)
+        logger.debug("Received fields: %s", list(data))
 
         title = (data.get("title") or "").strip()
         description = (data.get("description") or "").strip()
@@ -101,27 +148,23 @@ def create_roommate_post():
             return _error("'preferences' must be a list of strings or a comma-separated string.", 400)
 
         if images is not None and not isinstance(images, list):
-            return _error("'images' must be a list of base64 strings or URLs.", 400)
+            return _error("'images' must be a list of base64 strings, image ids or URLs.", 400)
 
             # --- CODE FOR REVIEWING POTENTIAL ERRORS ---
         # 1) allow request to override
         req_username = (data.get("username") or "").strip()
         req_year = str(data.get("year") or "").strip()
 
-        # 2) try current_user attributes
+        # 2) fall back to the logged-in user's record (already loaded, no extra query)
+        profile = current_user.user_data or {}
         cu_username = (
-            getattr(current_user, "username", None)
-            or getattr(current_user, "name", None)
-            or getattr(current_user, "full_name", None)
-            or getattr(current_user, "email", None)
-        )
-        cu_year = (
-            getattr(current_user, "year", None)
-            or getattr(current_user, "class_year", None)
-            or getattr(current_user, "graduation_year", None)
+            profile.get("username")
+            or profile.get("name")
+            or profile.get("full_name")
+            or profile.get("email")
         )
+        cu_year = profile.get("year") or profile.get("class_year") or profile.get("graduation_year")
 
-        # 3) DB lookup 
         uid = current_user.id
         if not isinstance(uid, ObjectId):
             try:
@@ -129,28 +172,11 @@ def create_roommate_post():
             except Exception:
                 return _error("Invalid user id.", 500)
 
-        u_doc = db.users.find_one(
-            {"_id": uid},
-            {"username": 1, "name": 1, "full_name": 1, "email": 1,
-            "year": 1, "class_year": 1, "graduation_year": 1}
-        ) or {}
-
-        db_username = u_doc.get("username") or u_doc.get("name") or u_doc.get("full_name") or u_doc.get("email")
-        db_year = u_doc.get("year") or u_doc.get("class_year") or u_doc.get("graduation_year")
-
-        # 4) final pick with safe fallbacks
-        username = req_username or cu_username or db_username or f"user-{str(uid)[:6]}"
-        year = str(req_year or cu_year or db_year or "")
+        # 3) final pick with safe fallbacks
+        username = req_username or cu_username or f"user-{str(uid)[:6]}"
+        year = str(req_year or cu_year or "")
         # END
 
-
-        uid = current_user.id
-        if not isinstance(uid, ObjectId):
-            try:
-                uid = ObjectId(uid)
-            except Exception:
-                return _error("Invalid user id.", 500)
-
         post = Roommate.create_roommate_post(
             user_id=uid,
             title=title,
@@ -162,46 +188,70 @@ def create_roommate_post():
             year=year,
         )
 
-        if post and isinstance(post, dict) and post.get("_id"):
-            presented = post 
-        else:
-            inserted_id = getattr(post, "inserted_id", None)
-            if inserted_id:
-                presented = Roommate.get_by_id(str(inserted_id))
-            else:
-                presented = {
-                    "title": title,
-                    "description": description,
-                    "preferences": preferences or [],
-                    "location": location,
-                    "images": images or []
-                }
-
-        print("Roommate post created:", presented)
+        # The model returns the inserted document, so there is nothing to re-read
+        logger.debug("Roommate post created: %s", post.get("_id"))
         return jsonify({
             "success": True,
-            "post": _present_roommate(presented),
+            "post": _present_roommate(post),
             "message": "Roommate post created successfully"
         }), 201
 
+    except InvalidImage as e:
+        return _error(str(e), 400)
     except Exception as e:
-        print(f"[roommates.create] error: {e}")
+        logger.error("[roommates.create] error: %s", e)
         return _error(str(e), 500)
 
 
 
 
 
+# GET /api/roommates/matches?post_id=&limit=
+@bp.route("/roommates/matches", methods=["GET"])
+@login_required
+def get_roommate_matches():
+    """Roommate posts ranked by compatibility with one of the caller's posts."""
+    try:
+        try:
+            limit = int(request.args.get("limit", DEFAULT_LIMIT))
+        except ValueError:
+            return _error("limit must be an integer", 400)
+        limit = max(1, min(limit, MAX_LIMIT))
+
+        try:
+            post, matches = Roommate.find_matches(current_user.id, request.args.get("post_id"), limit)
+        except NotFound:
+            return _error("Roommate post not found", 404)
+        except Forbidden:
+            return _error("Matches are only available for your own posts", 403)
+
+        results = []
+        for doc in matches:
+            presented = _present_roommate(doc)
+            presented["match_score"] = doc["match_score"]
+            results.append(presented)
+        return jsonify({"success": True, "post_id": str(post["_id"]), "matches": results}), 200
+
+    except Exception as e:
+        logger.error("[roommates.matches] error: %s", e)
+        return _error(str(e), 500)
+
 # GET /api/roommates/<id>
 @bp.route("/roommates/<post_id>", methods=["GET"])
 def get_roommate_post(post_id):
     try:
+        if is_conditional():
+            not_modified = check_not_modified(Roommate.get_stamp(post_id))
+            if not_modified:
+                return not_modified
+
         post = Roommate.get_by_id(post_id)
         if not post:
             return _error("Roommate post not found", 404)
-        return jsonify({"success": True, "post": _present_roommate(post)}), 200
+        response = jsonify({"success": True, "post": _present_roommate(post)})
+        return with_validators(response, *compute_validators(post)), 200
     except Exception as e:
-        print(f"[roommates.get_one] error: {e}")
+        logger.error("[roommates.get_one] error: %s", e)
         return _error(str(e), 500)
 
 # PUT /api/roommates/<id>
@@ -209,31 +259,31 @@ def get_roommate_post(post_id):
 @login_required
 def update_roommate_post(post_id):
     try:
-        existing = Roommate.get_by_id(post_id)
-        if not existing:
+        data = request.get_json(silent=True) or {}
+        logger.debug("Received update fields: %s", list(data))
+        logger.debug("Year value received: %s", data.get('year'))
+        try:
+            Roommate.update_roommate_post(
+                roommate_id=post_id,
+                title=data.get("title"),
+                description=data.get("description"),
+                preferences=data.get("preferences"),
+                location=data.get("location"),
+                images=data.get("images"),
+                year=data.get("year"),
+                user_id=current_user.id
+            )
+        except NotFound:
             return _error("Roommate post not found", 404)
-        if str(existing["user_id"]) != current_user.id:
+        except Forbidden:
             return _error("Not authorized to edit this post", 403)
 
-        data = request.get_json(silent=True) or {}
-        print(f"[DEBUG] Received update data: {data}")
-        print(f"[DEBUG] Year value received: {data.get('year')}")
-        success = Roommate.update_roommate_post(
-            roommate_id=post_id,
-            title=data.get("title"),
-            description=data.get("description"),
-            preferences=data.get("preferences"),
-            location=data.get("location"),
-            images=data.get("images"),
-            year=data.get("year")
-        )
-
-        if success:
-            return jsonify({"success": True, "message": "Roommate post updated successfully"}), 200
-        return _error("Failed to update roommate post", 500)
+        return jsonify({"success": True, "message": "Roommate post updated successfully"}), 200
 
+    except InvalidImage as e:
+        return _error(str(e), 400)
     except Exception as e:
-        print(f"[roommates.update] error: {e}")
+        logger.error("[roommates.update] error: %s", e)
         return _error(str(e), 500)
 
 # DELETE /api/roommates/<id>
@@ -241,18 +291,17 @@ def update_roommate_post(post_id):
 @login_required
 def delete_roommate_post(post_id):
     try:
-        existing = Roommate.get_by_id(post_id)
-        if not existing:
+        try:
+            Roommate.delete_roommate_post(post_id, user_id=current_user.id)
+        except NotFound:
             return _error("Roommate post not found", 404)
-        if str(existing["user_id"]) != current_user.id:
+        except Forbidden:
             return _error("Not authorized to delete this post", 403)
 
-        if Roommate.delete_roommate_post(post_id):
-            return jsonify({"success": True, "message": "Roommate post deleted successfully"}), 200
-        return _error("Failed to delete roommate post", 500)
+        return jsonify({"success": True, "message": "Roommate post deleted successfully"}), 200
 
     except Exception as e:
-        print(f"[roommates.delete] error: {e}")
+        logger.error("[roommates.delete] error: %s", e)
         return _error(str(e), 500)
 
 # GET /api/users/<user_id>/roommates
@@ -263,5 +312,5 @@ def get_user_roommate_posts(user_id):
         posts = [_present_roommate(p) for p in posts]
         return jsonify({"success": True, "roommates": posts}), 200
     except Exception as e:
-        print(f"[roommates.user_list] error: {e}")
+        logger.error("[roommates.user_list] error: %s", e)
         return _error(str(e), 500)
\ No newline at end of file
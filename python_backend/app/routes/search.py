@@ -1,9 +1,14 @@
+import logging
 from flask import Blueprint, request, jsonify
 from app import db
+from app.utils.authors import hydrate_authors
+from app.utils.image_store import image_url
+from app.utils.search import parse_query, search as search_collection
+from app.utils.response_cache import response_cache
 from bson.objectid import ObjectId
 from flask_cors import cross_origin
-from bson import json_util
-import json
+
+logger = logging.getLogger(__name__)
 
 bp = Blueprint('search', __name__, url_prefix='/api')
 
@@ -12,10 +17,18 @@ bp = Blueprint('search', __name__, url_prefix='/api')
 @cross_origin(origins=["http://127.0.0.1:5500", "http://localhost:5500"], 
               supports_credentials=True,
               allow_headers=["Content-Type", "Authorization", "X-Requested-With"])
+# Search is case-insensitive, so "Desk " and "desk" share an entry
+@response_cache.cached(tags=('posts', 'roommates'), normalize={'q': lambda q: ' '.join(q.lower().split())})
 def search():
     if request.method == 'OPTIONS':
         return '', 200
-    query = request.args.get('q', '').strip()
+    query = parse_query(request.args.get('q', '').strip())
+    scope = request.args.get('scope', 'posts')
+    if scope not in ('posts', 'roommates', 'all'):
+        return jsonify({
+            'success': False,
+            'error': "scope must be one of 'posts', 'roommates' or 'all'"
+        }), 400
     
     if not query:
         return jsonify({
@@ -23,60 +36,42 @@ def search():
             'results': []
         })
 
-    # Search in posts collection using a case-insensitive regex
-    results = list(db.posts.find({
-        '$or': [
-            {'title': {'$regex': query, '$options': 'i'}},
-            {'description': {'$regex': query, '$options': 'i'}},
-            {'type': {'$regex': query, '$options': 'i'}}
-        ]
-    }).sort('created_at', -1).limit(20))  # Limit to 20 results and sort by newest first
+    # Ranked text search (title weighted above description), newest first on ties
+    results = search_collection(db.posts, query, limit=20) if scope in ('posts', 'all') else []
+    roommate_results = search_collection(db.roommates, query, limit=20) if scope in ('roommates', 'all') else []
 
     formatted_results = []
     
     try:
+        # Resolve every author in one query instead of one per result
+        try:
+            hydrate_authors(results + roommate_results)
+        except Exception as e:
+            logger.error("Error fetching author information: %s", str(e))
+            for result in results + roommate_results:
+                result['author_name'] = 'Error fetching user'
+                result['author_image'] = None
+                result['user_id'] = None
+
         for result in results:
+            user_id = result.get('user_id')  # Changed from author_id to user_id
             formatted_post = {
                 '_id': str(result.get('_id')),
                 'title': result.get('title', 'Untitled'),
                 'description': result.get('description', ''),
                 'image_url': result.get('image_url') if result.get('image_url') else None,
-                'images': result.get('images', []),  # Include all images if available
+                'images': [image_url(ref, thumbnail=True) for ref in result.get('images', [])],  # Include all images if available
                 'type': result.get('type', 'item'),
                 'created_at': result.get('created_at', None),
                 'favorites_count': len(result.get('favorites', [])),
-                'favorites': [str(fav) if isinstance(fav, ObjectId) else fav for fav in result.get('favorites', [])]
+                'favorites': [str(fav) if isinstance(fav, ObjectId) else fav for fav in result.get('favorites', [])],
+                'author_name': result['author_name'],
+                'author_id': str(user_id) if user_id else None,
+                # Include author profile image if available
+                'author_image': result['author_image'],
+                'score': result.get('score')
             }
             
-            # Handle author information
-            # Handle author information
-            try:
-                user_id = result.get('user_id')  # Changed from author_id to user_id
-                if user_id:
-                    if isinstance(user_id, ObjectId):
-                        author = db.users.find_one({'_id': user_id})
-                    else:
-                        author = db.users.find_one({'_id': ObjectId(str(user_id))})
-                    
-                    if author:
-                        formatted_post['author_name'] = author.get('username', 'Unknown')
-                        formatted_post['author_id'] = str(user_id)
-                        # Include author profile image if available
-                        formatted_post['author_image'] = author.get('profile_image')
-                    else:
-                        formatted_post['author_name'] = 'User not found'
-                        formatted_post['author_id'] = str(user_id)
-                        formatted_post['author_image'] = None
-                else:
-                    formatted_post['author_name'] = 'No author specified'
-                    formatted_post['author_id'] = None
-                    formatted_post['author_image'] = None
-            except Exception as e:
-                print(f"Error fetching author information: {str(e)}")
-                formatted_post['author_name'] = 'Error fetching user'
-                formatted_post['author_id'] = None
-                formatted_post['author_image'] = None
-            
             # Format date if it exists
             if formatted_post['created_at']:
                 try:
@@ -85,14 +80,30 @@ def search():
                     formatted_post['created_at'] = None
             
             formatted_results.append(formatted_post)
-            
-        return jsonify({
+
+        body = {
             'success': True,
             'results': formatted_results
-        })
+        }
+        if scope != 'posts':
+            body['roommates'] = [{
+                '_id': str(r['_id']),
+                'user_id': str(r['user_id']) if r.get('user_id') else None,
+                'title': r.get('title', ''),
+                'description': r.get('description', ''),
+                'location': r.get('location', ''),
+                'preferences': r.get('preferences', []),
+                'year': r.get('year', ''),
+                'images': [image_url(ref, thumbnail=True) for ref in r.get('images', [])],
+                'created_at': r.get('created_at'),
+                'author_name': r['author_name'],
+                'author_image': r['author_image'],
+                'score': r.get('score')
+            } for r in roommate_results]
+        return jsonify(body)
         
     except Exception as e:
-        print(f"Error formatting search results: {str(e)}")
+        logger.error("Error formatting search results: %s", str(e))
         return jsonify({
             'success': False,
             'error': 'An error occurred while processing search results'
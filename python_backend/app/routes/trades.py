@@ -1,32 +1,44 @@
+import logging
 from flask import Blueprint, request, jsonify, session
 from app.models.trade import Trade
-from app.utils.json_encoder import MongoJSONEncoder
 from app.utils.header_auth import header_auth_required
+from app.utils.image_store import InvalidImage
+from app.utils.ownership import NotFound, Forbidden
+from app.utils.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
 
 bp = Blueprint('trades', __name__)
 
 @bp.route('/trades', methods=['GET'])
+@response_cache.cached(tags=('trades',))
 def get_trades():
     trades = Trade.get_all_trades()
-    # Convert MongoDB documents to JSON serializable format
-    serialized_trades = MongoJSONEncoder.encode_document(trades)
-    return jsonify(serialized_trades), 200
+    return jsonify(trades), 200
+
+@bp.route('/trades/cycles', methods=['GET'])
+@header_auth_required
+def get_trade_cycles():
+    """Suggested 2- to k-way exchanges the X-User-ID user is part of."""
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    cycles = Trade.suggest_cycles(request.headers.get('X-User-ID'), limit)
+    return jsonify({'cycles': [{'length': len(legs), 'legs': legs} for legs in cycles]}), 200
 
 @bp.route('/trades', methods=['POST'])
 def create_trade():
     # Debug information
-    print("***** TRADE REQUEST RECEIVED *****")
-    print(f"Request headers: {dict(request.headers)}")
-    print(f"Request data: {request.get_json()}")
-    print(f"Session: {session if 'session' in globals() else 'Session not available'}")
+    logger.debug("***** TRADE REQUEST RECEIVED *****")
+    logger.debug("Request headers: %s", request.headers)
+    logger.debug("Request fields: %s", list(request.get_json(silent=True) or {}))
+    logger.debug("Session: %s", session)
     
     # Get the user ID from the X-User-ID header
     user_id = request.headers.get('X-User-ID')
     if not user_id or user_id == 'undefined' or user_id == 'null' or not user_id.strip():
-        print("Missing or invalid X-User-ID header")
+        logger.info("Missing or invalid X-User-ID header")
         return jsonify({'error': 'Valid X-User-ID header is required'}), 400
     
-    print(f"Using user ID: {user_id}")
+    logger.debug("Using user ID: %s", user_id)
     
     # Process the request
     try:
@@ -44,23 +56,22 @@ def create_trade():
             trade_preferences=data.get('trade_preferences')
         )
         
-        print("Trade created successfully:", trade)
-        
-        # Convert MongoDB document to JSON serializable format
-        serialized_trade = MongoJSONEncoder.encode_document(trade)
+        logger.debug("Trade created successfully: %s", trade.get('_id'))
         
         # Return success with the trade data
         response = jsonify({
             'success': True,
             'message': 'Trade request created successfully',
-            'trade': serialized_trade,
+            'trade': trade,
             'trade_id': str(trade.get('_id'))
         })
         
         return response, 201
         
+    except InvalidImage as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Error creating trade: {str(e)}")
+        logger.error("Error creating trade: %s", str(e))
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/trades/<trade_id>', methods=['GET'])
@@ -69,68 +80,55 @@ def get_trade(trade_id):
     if not trade:
         return jsonify({'error': 'Trade not found'}), 404
     
-    # Convert MongoDB document to JSON serializable format
-    serialized_trade = MongoJSONEncoder.encode_document(trade)
-    
-    return jsonify(serialized_trade), 200
+    return jsonify(trade), 200
 
 @bp.route('/trades/user/<user_id>', methods=['GET'])
 def get_user_trades(user_id):
     trades = Trade.get_user_trades(user_id)
-    # Convert MongoDB documents to JSON serializable format
-    serialized_trades = MongoJSONEncoder.encode_document(trades)
-    return jsonify(serialized_trades), 200
+    return jsonify(trades), 200
 
 @bp.route('/trades/<trade_id>', methods=['PUT'])
 def update_trade(trade_id):
-    trade = Trade.get_by_id(trade_id)
-    if not trade:
-        return jsonify({'error': 'Trade not found'}), 404
-    
     # Get user ID from X-User-ID header
     user_id = request.headers.get('X-User-ID')
     if not user_id:
         return jsonify({'error': 'X-User-ID header is required'}), 400
     
-    # Check if the current user is either the trade owner or the buyer
+    # Only the trade owner or the buyer may update; checked inside the write
     data = request.get_json()
-    trade_preferences = trade.get('trade_preferences', {})
-    buyer_id = trade_preferences.get('buyer_id')
-    
-    if (str(trade['user_id']) != user_id and 
-        (not buyer_id or str(buyer_id) != user_id)):
+    try:
+        trade = Trade.update_trade(
+            trade_id=trade_id,
+            item_name=data.get('item_name'),
+            description=data.get('description'),
+            images=data.get('images'),
+            trade_preferences=data.get('trade_preferences'),
+            status=data.get('status'),
+            user_id=user_id
+        )
+    except NotFound:
+        return jsonify({'error': 'Trade not found'}), 404
+    except Forbidden:
         return jsonify({'error': 'Unauthorized'}), 403
+    except InvalidImage as e:
+        return jsonify({'error': str(e)}), 400
     
-    success = Trade.update_trade(
-        trade_id=trade_id,
-        item_name=data.get('item_name'),
-        description=data.get('description'),
-        images=data.get('images'),
-        trade_preferences=data.get('trade_preferences'),
-        status=data.get('status')
-    )
-    
-    if success:
-        return jsonify({'message': 'Trade updated successfully'}), 200
-    return jsonify({'error': 'Failed to update trade'}), 500
+    return jsonify({'message': 'Trade updated successfully', 'trade': trade}), 200
 
 @bp.route('/trades/<trade_id>', methods=['DELETE'])
 def delete_trade(trade_id):
-    trade = Trade.get_by_id(trade_id)
-    if not trade:
-        return jsonify({'error': 'Trade not found'}), 404
-    
     # Get user ID from X-User-ID header
     user_id = request.headers.get('X-User-ID')
     if not user_id:
         return jsonify({'error': 'X-User-ID header is required'}), 400
     
-    if str(trade['user_id']) != user_id:
+    try:
+        Trade.delete_trade(trade_id, user_id=user_id)
+    except NotFound:
+        return jsonify({'error': 'Trade not found'}), 404
+    except Forbidden:
         return jsonify({'error': 'Unauthorized'}), 403
-    
-    if Trade.delete_trade(trade_id):
-        return jsonify({'message': 'Trade deleted successfully'}), 200
-    return jsonify({'error': 'Failed to delete trade'}), 500
+    return jsonify({'message': 'Trade deleted successfully'}), 200
 
 @bp.route('/trades/<trade_id>/interest', methods=['POST'])
 def express_interest(trade_id):
@@ -168,6 +166,4 @@ def remove_interest(trade_id):
 @bp.route('/users/<user_id>/trades', methods=['GET'])
 def get_trades_by_user(user_id):
     trades = Trade.get_user_trades(user_id)
-    # Convert MongoDB documents to JSON serializable format
-    serialized_trades = MongoJSONEncoder.encode_document(trades)
-    return jsonify(serialized_trades), 200
\ No newline at end of file
+    return jsonify(trades), 200
\ No newline at end of file
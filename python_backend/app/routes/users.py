@@ -1,20 +1,88 @@
-from flask import Blueprint, request, jsonify, session, make_response
+import logging
+from flask import Blueprint, Response, request, jsonify, session, make_response, stream_with_context
 from flask_login import login_required, current_user, login_user
 from app.models.user import User
+from app.models.post import Post
+from app.utils.identity_cache import user_cache
+from app.utils.response_cache import response_cache
+from app.utils.json_encoder import dumps
+from app.utils.conditional import (
+    VALIDATOR_PROJECTION, check_not_modified, compute_validators, is_conditional, with_validators
+)
 from app import db
 from bson.objectid import ObjectId
 import re
+from datetime import datetime
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
 
 bp = Blueprint('users', __name__, url_prefix='/api/users')
 
+# Fields clients may ask for with ?fields=; never the password or the
+# embedded posts/roommates/trades arrays
+PRIVATE_USER_FIELDS = {'password': 0, 'reset_token': 0, 'reset_token_expiry': 0}
+LISTABLE_USER_FIELDS = ('username', 'email', 'nyu_id', 'bio', 'profile_image', 'is_active')
+USERS_DEFAULT_LIMIT = 100
+USERS_MAX_LIMIT = 1000
+USERS_BATCH_SIZE = 100
+
 @bp.route('/')
 @bp.route('')
 def list_users():
-    users = list(db.users.find())
-    # Convert ObjectId to string for JSON serialization
-    for user in users:
-        user['_id'] = str(user['_id'])
-    return jsonify(users)
+    """Stream one page of users as a JSON array, ordered by ``_id``.
+
+    ``?after=<id>`` continues after the last id of the previous page (also
+    sent back in ``X-Next-Cursor`` and a ``Link: rel="next"`` header),
+    ``?limit=`` is capped at ``USERS_MAX_LIMIT`` and ``?fields=a,b`` picks
+    from ``LISTABLE_USER_FIELDS``.
+    """
+    try:
+        limit = max(1, min(int(request.args.get('limit', USERS_DEFAULT_LIMIT)), USERS_MAX_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    requested = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    unknown = [f for f in requested if f not in LISTABLE_USER_FIELDS]
+    if unknown:
+        return jsonify({
+            'error': f'Unknown fields: {", ".join(unknown)}',
+            'allowed': list(LISTABLE_USER_FIELDS)
+        }), 400
+    projection = {field: 1 for field in requested or LISTABLE_USER_FIELDS}
+
+    query = {}
+    after = request.args.get('after')
+    if after:
+        if not ObjectId.is_valid(after):
+            return jsonify({'error': f'Invalid cursor: {after}'}), 400
+        query['_id'] = {'$gt': ObjectId(after)}
+
+    # Find where this page ends from the _id index alone, so the cursor can
+    # go in the headers before the body starts streaming
+    edge = list(db.users.find(query, {'_id': 1}).sort('_id', 1).skip(limit - 1).limit(2))
+    next_cursor = str(edge[0]['_id']) if len(edge) == 2 else None
+
+    users = db.users.find(query, projection).sort('_id', 1).limit(limit).batch_size(USERS_BATCH_SIZE)
+
+    def generate():
+        yield b'['
+        try:
+            for i, user in enumerate(users):
+                user['_id'] = str(user['_id'])
+                yield (b',' if i else b'') + dumps(user)
+        finally:
+            users.close()
+        yield b']'
+
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        args = request.args.to_dict()
+        args['after'] = next_cursor
+        next_url = f'{request.base_url}?{urlencode(args)}'
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    return response
 
 @bp.route('/collections')
 def list_collections():
@@ -39,13 +107,12 @@ def get_profile():
 @login_required
 def update_profile():
     try:
-        print("Headers:", dict(request.headers))
+        logger.debug("Headers: %s", request.headers)
         data = request.get_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
             
-        print("Raw request data:", request.get_data())
-        print("Parsed update data:", data)  # Debug print
+        logger.debug("Parsed update data: %s", data)
         
         # Ensure all required fields are present
         required_fields = ['username', 'email', 'nyu_id']
@@ -77,13 +144,20 @@ def update_profile():
             'nyu_id': nyu_id,
             'bio': bio
         }
+        # Only a real change moves the validators of /api/users/<id>
+        profile = current_user.user_data or {}
+        if any(profile.get(field) != value for field, value in update_data.items()):
+            update_data['updated_at'] = datetime.utcnow()
         
         result = db.users.update_one(
             {'_id': ObjectId(current_user.id)},
             {'$set': update_data}
         )
+        user_cache.invalidate(current_user.id)
         
         if result.modified_count > 0:
+            # Cached feeds and search results embed author names
+            response_cache.invalidate('posts', 'roommates')
             return jsonify({
                 'success': True,
                 'message': 'Profile updated successfully'
@@ -95,7 +169,7 @@ def update_profile():
             }), 400
             
     except Exception as e:
-        print(f"Error updating profile: {str(e)}")
+        logger.error("Error updating profile: %s", str(e))
         return jsonify({
             'success': False,
             'error': 'Server error while updating profile'
@@ -118,38 +192,32 @@ def get_user_posts():
         return response
 
     # Debug information
-    print(f"Accessing posts endpoint. Method: {request.method}")
-    print(f"Session data: {session}")
-    print(f"Request cookies: {request.cookies}")
-    print(f"Request headers: {dict(request.headers)}")
-    print(f"Current user authenticated: {current_user.is_authenticated}")
+    logger.debug("Accessing posts endpoint. Method: %s", request.method)
+    logger.debug("Session data: %s", session)
+    logger.debug("Request cookie names: %s", list(request.cookies))
+    logger.debug("Request headers: %s", request.headers)
+    logger.debug("Current user authenticated: %s", current_user.is_authenticated)
     
     try:
         # Use the current user from the login_required decorator
         active_user_id = str(current_user.id)
-        print(f"Active user ID for fetching posts: {active_user_id}")
+        logger.debug("Active user ID for fetching posts: %s", active_user_id)
         
         # Check X-User-ID header for consistency
         header_user_id = request.headers.get('X-User-ID')
         if header_user_id:
             if header_user_id == 'undefined' or header_user_id == 'null':
-                print(f"Invalid X-User-ID header: {header_user_id}")
+                logger.info("Invalid X-User-ID header: %s", header_user_id)
                 # Continue using the session user ID
             elif header_user_id != active_user_id:
-                print(f"Warning: X-User-ID header ({header_user_id}) doesn't match session user ({active_user_id})")
+                logger.warning("X-User-ID header (%s) doesn't match session user (%s)", header_user_id, active_user_id)
                 # We'll still use the authenticated user from the session
         else:
-            print("No X-User-ID header present, using session user")
+            logger.debug("No X-User-ID header present, using session user")
         
-        # Get user's posts from the database
-        user_posts = list(db.posts.find({'user_id': active_user_id}))
-        print(f"Found {len(user_posts)} posts for user {active_user_id}")
-        
-        # Convert ObjectId to string for JSON serialization
-        for post in user_posts:
-            post['_id'] = str(post['_id'])
-            if 'user_id' in post:
-                post['user_id'] = str(post['user_id'])
+        # Get user's posts from the database (user_id is stored as an ObjectId)
+        user_posts = Post.get_user_posts(active_user_id)
+        logger.debug("Found %s posts for user %s", len(user_posts), active_user_id)
         
         response = jsonify({
             'success': True,
@@ -163,7 +231,7 @@ def get_user_posts():
             })
         return response
     except Exception as e:
-        print(f"Error fetching posts: {e}")
+        logger.error("Error fetching posts: %s", e)
         response = jsonify({'error': f'Failed to fetch posts: {str(e)}'})
         origin = request.headers.get('Origin')
         if origin:
@@ -182,16 +250,7 @@ def get_user_posts_by_type(post_type):
         
     try:
         # Get user's posts from the database filtered by type
-        posts = list(db.posts.find({
-            'user_id': current_user.id,
-            'type': post_type
-        }))
-        
-        # Convert ObjectId to string for JSON serialization
-        for post in posts:
-            post['_id'] = str(post['_id'])
-            if 'user_id' in post:
-                post['user_id'] = str(post['user_id'])
+        posts = Post.get_user_posts(current_user.id, post_type=post_type)
         
         return jsonify({
             'success': True,
@@ -199,7 +258,7 @@ def get_user_posts_by_type(post_type):
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-        print(f"Error updating profile: {e}")
+        logger.error("Error updating profile: %s", e)
         return jsonify({'error': str(e)}), 500
 
 # Add route to get user by ID - supports both regular requests and preflight OPTIONS requests
@@ -221,16 +280,24 @@ def get_user(user_id):
     try:
         # Try to convert user_id to ObjectId
         obj_user_id = ObjectId(user_id)
-        user = db.users.find_one({'_id': obj_user_id})
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Convert ObjectId to string for JSON serialization
-        user['_id'] = str(user['_id'])
-        
+        if is_conditional():
+            response = check_not_modified(db.users.find_one({'_id': obj_user_id}, VALIDATOR_PROJECTION))
+        else:
+            response = None
+
+        if response is None:
+            user = db.users.find_one({'_id': obj_user_id}, PRIVATE_USER_FIELDS)
+
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+
+            validators = compute_validators(user)
+            # Convert ObjectId to string for JSON serialization
+            user['_id'] = str(user['_id'])
+
+            response = with_validators(jsonify(user), *validators)
+
         # Build response with proper CORS headers
-        response = jsonify(user)
         origin = request.headers.get('Origin')
         if origin:
             response.headers.update({
@@ -239,7 +306,7 @@ def get_user(user_id):
             })
         return response
     except Exception as e:
-        print(f"Error fetching user: {e}")
+        logger.error("Error fetching user: %s", e)
         response = jsonify({'error': str(e)})
         origin = request.headers.get('Origin')
         if origin:
@@ -0,0 +1,70 @@
+"""Batched author lookups for anything that shows author names.
+
+List endpoints used to run one ``db.users.find_one`` per result. Here all
+``user_id``s of a result set are resolved with a single ``$in`` query and
+remembered for the rest of the request, so an author that shows up twice
+(or in a second list in the same request) is only fetched once.
+"""
+from flask import g, has_request_context
+from app import db
+from app.utils.ids import maybe_object_id as _as_object_id
+
+AUTHOR_PROJECTION = {'username': 1, 'profile_image': 1}
+
+
+def _request_state():
+    """Per-request memo of user id -> author doc (None if the user is gone)."""
+    if not has_request_context():
+        return {}, None
+    if 'author_memo' not in g:
+        g.author_memo = {}
+        g.author_lookups_saved = 0
+    return g.author_memo, g
+
+
+def resolve_authors(user_ids):
+    """Return ``{ObjectId: author_doc_or_None}`` for the given ids."""
+    memo, state = _request_state()
+    ids = {oid for oid in (_as_object_id(u) for u in user_ids if u) if oid}
+    missing = [oid for oid in ids if oid not in memo]
+
+    if missing:
+        found = {
+            u['_id']: u
+            for u in db.users.find({'_id': {'$in': missing}}, AUTHOR_PROJECTION)
+        }
+        for oid in missing:
+            memo[oid] = found.get(oid)
+
+    if state is not None:
+        # Without batching every reference would have been its own find_one
+        naive = sum(1 for u in user_ids if u)
+        state.author_lookups_saved += naive - (1 if missing else 0)
+
+    return {oid: memo.get(oid) for oid in ids}
+
+
+def hydrate_authors(docs, id_field='user_id'):
+    """Set ``author_name``/``author_image`` on each doc in place."""
+    authors = resolve_authors([d.get(id_field) for d in docs])
+    for doc in docs:
+        ref = doc.get(id_field)
+        if not ref:
+            doc['author_name'] = 'No author specified'
+            doc['author_image'] = None
+            continue
+        author = authors.get(_as_object_id(ref))
+        if author:
+            doc['author_name'] = author.get('username', 'Unknown')
+            doc['author_image'] = author.get('profile_image')
+        else:
+            doc['author_name'] = 'User not found'
+            doc['author_image'] = None
+    return docs
+
+
+def lookups_saved():
+    """Round-trips avoided so far in the current request."""
+    if has_request_context():
+        return g.get('author_lookups_saved', 0)
+    return 0
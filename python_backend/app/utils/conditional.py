@@ -0,0 +1,74 @@
+"""Conditional GET (ETag / Last-Modified) for documents and pages.
+
+Validators come from each document's ``_id`` and ``updated_at`` (falling
+back to ``created_at`` and then the ObjectId timestamp), so they can be
+computed from a projected query of just those fields. When a request
+carries ``If-None-Match`` / ``If-Modified-Since``, routes check that cheap
+projection first and answer ``304`` without fetching, joining or
+serializing the full documents.
+
+ETags are weak: author names and image URLs are joined in at read time and
+don't bump ``updated_at``.
+"""
+import hashlib
+from datetime import timezone
+
+from flask import make_response, request
+
+VALIDATOR_PROJECTION = {'updated_at': 1, 'created_at': 1}
+
+
+def _modified_at(doc):
+    stamp = doc.get('updated_at') or doc.get('created_at') or doc['_id'].generation_time
+    if not hasattr(stamp, 'tzinfo'):
+        return doc['_id'].generation_time
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=timezone.utc)
+    return stamp.replace(microsecond=0)
+
+
+def compute_validators(docs, *extra):
+    """``(etag, last_modified)`` for ``docs`` (a document or a page of them).
+
+    ``extra`` values (e.g. a total count) are folded into the ETag.
+    """
+    if isinstance(docs, dict):
+        docs = [docs]
+    stamps = [(str(doc['_id']), _modified_at(doc).timestamp()) for doc in docs]
+    etag = hashlib.sha1(repr((stamps, extra)).encode()).hexdigest()[:24]
+    last_modified = max((_modified_at(doc) for doc in docs), default=None)
+    return etag, last_modified
+
+
+def is_conditional():
+    return bool(request.if_none_match or request.if_modified_since)
+
+
+def not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return bool(since and last_modified and last_modified <= since)
+
+
+def with_validators(response, etag, last_modified):
+    """Attach validators; clients must revalidate before reusing the body."""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def not_modified_response(etag, last_modified):
+    return with_validators(make_response('', 304), etag, last_modified)
+
+
+def check_not_modified(stamps, *extra):
+    """304 response if the client's copy of ``stamps`` is current, else None."""
+    if not stamps:
+        return None
+    etag, last_modified = compute_validators(stamps, *extra)
+    if not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    return None
@@ -0,0 +1,122 @@
+"""In-process pub/sub feeding the server-sent events stream.
+
+Models publish small events to topics (``trade:<id>``, ``user:<id>``);
+each open ``/api/events`` connection holds a ``Subscription`` with its own
+bounded queue. Everything uses ``queue``/``threading`` primitives, so it
+works with gunicorn's threaded workers and, once gevent has monkey-patched
+them, with gevent workers.
+
+Fan-out is per process: run the stream behind a single worker process
+(``--threads N`` or ``-k gevent``), or publish through a shared broker by
+swapping ``broker`` for one with the same ``publish``/``subscribe`` API.
+"""
+import logging
+import queue
+import threading
+
+from app.utils.json_encoder import dumps
+
+logger = logging.getLogger(__name__)
+
+# Events a slow client may fall behind by before the oldest are dropped
+QUEUE_SIZE = 100
+
+
+def trade_topic(trade_id):
+    return f'trade:{trade_id}'
+
+
+def user_topic(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+    def __init__(self, broker, topics, maxsize=QUEUE_SIZE):
+        self.broker = broker
+        self.topics = frozenset(topics)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def deliver(self, event):
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                # Keep the newest state; a trade's latest status matters more
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Next ``(event, data)``, or None after ``timeout`` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventBroker:
+    def __init__(self):
+        self._topics = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics):
+        subscription = Subscription(self, topics)
+        with self._lock:
+            for topic in subscription.topics:
+                self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._topics[topic]
+
+    def publish(self, topics, event, data):
+        """Send ``event`` to everyone subscribed to any of ``topics`` (once each)."""
+        with self._lock:
+            targets = set()
+            for topic in topics:
+                targets |= self._topics.get(topic, set())
+        for subscription in targets:
+            subscription.deliver((event, data))
+        return len(targets)
+
+    def stats(self):
+        with self._lock:
+            subscriptions = set().union(*self._topics.values()) if self._topics else set()
+            return {'topics': len(self._topics), 'subscriptions': len(subscriptions)}
+
+
+broker = EventBroker()
+
+
+def publish(event, data, trades=(), users=()):
+    """Publish to trade and user topics. Never raises: events are best effort."""
+    topics = [trade_topic(t) for t in trades] + [user_topic(u) for u in users if u]
+    try:
+        return broker.publish(topics, event, data)
+    except Exception as e:
+        logger.error("Error publishing %s event: %s", event, e)
+        return 0
+
+
+def format_sse(event, data):
+    """One ``text/event-stream`` message."""
+    return b'event: ' + event.encode() + b'\ndata: ' + dumps(data) + b'\n\n'
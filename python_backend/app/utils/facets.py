@@ -0,0 +1,129 @@
+"""Filters and facet counts for browsing posts.
+
+``parse_filters`` turns ``?category=&condition=&status=&type=&min_price=&max_price=``
+into per-field query clauses (comma-separated values mean "any of"), which
+the feed combines with its keyset pagination.
+
+``facet_counts`` answers "how many posts per category / condition" for the
+current filters with a single ``$facet`` aggregation. Each facet ignores its
+own filter, so picking a category still shows the counts of the other
+categories. Counts are cached for ``FACET_TTL_SECONDS`` in a bounded LRU
+(``FACET_CACHE_SIZE`` filter combinations, since ``near``/price values are
+arbitrary) and dropped on every post write (``invalidate``).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+FACET_FIELDS = ('category', 'condition')
+FILTER_FIELDS = ('category', 'condition', 'status', 'type')
+MAX_FILTER_VALUES = 20
+MAX_FACET_VALUES = 50
+
+FACET_TTL_SECONDS = int(os.getenv('FACET_TTL', 60))
+FACET_CACHE_SIZE = 256
+
+_cache = OrderedDict()    # key -> (computed at, counts)
+_lock = threading.Lock()
+_generation = 0
+
+
+class InvalidFilter(ValueError):
+    """A filter parameter we can't turn into a query."""
+
+
+def _price(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        price = float(value)
+    except ValueError:
+        raise InvalidFilter(f"{name} must be a number")
+    if price < 0:
+        raise InvalidFilter(f"{name} must not be negative")
+    return price
+
+
+def parse_filters(args):
+    """``{field: clause}`` for the filter parameters present in ``args``."""
+    filters = {}
+    for field in FILTER_FIELDS:
+        raw = args.get(field)
+        if not raw:
+            continue
+        values = [v.strip() for v in raw.split(',') if v.strip()][:MAX_FILTER_VALUES]
+        if values:
+            filters[field] = values[0] if len(values) == 1 else {'$in': values}
+
+    low, high = _price(args, 'min_price'), _price(args, 'max_price')
+    if low is not None and high is not None and low > high:
+        raise InvalidFilter("min_price must not be greater than max_price")
+    price = {}
+    if low is not None:
+        price['$gte'] = low
+    if high is not None:
+        price['$lte'] = high
+    if price:
+        filters['price'] = price
+    return filters
+
+
+def combine(*queries):
+    """AND the non-empty queries together."""
+    queries = [q for q in queries if q]
+    if not queries:
+        return {}
+    return queries[0] if len(queries) == 1 else {'$and': queries}
+
+
+def facet_counts(collection, filters, base=None, ttl=FACET_TTL_SECONDS):
+    """``{field: [{'value', 'count'}]}`` for ``FACET_FIELDS``, most common first."""
+    key = (collection.full_name, repr(sorted(filters.items())), repr(base))
+    now = time.monotonic()
+    with _lock:
+        hit = _cache.get(key)
+        if hit and now - hit[0] < ttl:
+            _cache.move_to_end(key)
+            return hit[1]
+        if hit:
+            del _cache[key]
+        generation = _generation
+
+    shared = {f: c for f, c in filters.items() if f not in FACET_FIELDS}
+    facets = {}
+    for field in FACET_FIELDS:
+        # Every other facet's filter applies, this one's doesn't
+        others = {f: c for f, c in filters.items() if f in FACET_FIELDS and f != field}
+        facets[field] = [
+            {'$match': combine(others, {field: {'$nin': [None, '']}})},
+            {'$group': {'_id': f'${field}', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1, '_id': 1}},
+            {'$limit': MAX_FACET_VALUES},
+        ]
+    result = next(collection.aggregate([
+        {'$match': combine(base, shared)},
+        {'$facet': facets},
+    ]), {})
+    counts = {
+        field: [{'value': row['_id'], 'count': row['count']} for row in result.get(field, [])]
+        for field in FACET_FIELDS
+    }
+
+    with _lock:
+        # Counted while a write invalidated the cache: don't keep it
+        if generation == _generation:
+            _cache[key] = (now, counts)
+            _cache.move_to_end(key)
+            while len(_cache) > FACET_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return counts
+
+
+def invalidate():
+    """Forget every cached count (called after post writes)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _cache.clear()
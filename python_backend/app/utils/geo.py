@@ -0,0 +1,122 @@
+"""Listing locations as GeoJSON points, for "near me" queries.
+
+``location`` stays the free text the user typed. At write time it is
+matched against the offline gazetteer in ``app/data/gazetteer.json`` (NYU
+buildings and NYC neighborhoods) and, when a place is recognized, its point
+is stored in ``geo``. ``?near=<lat>,<lng>`` or ``?near=<place>`` plus
+``?radius=<meters>`` then become a ``$geoWithin`` filter on that field,
+served by a ``(geo 2dsphere, created_at, _id)`` index, so it combines with
+the newest-first keyset pagination unchanged.
+
+Listings whose location isn't recognized simply have no ``geo`` and never
+match a ``near`` query; ``flask --app app geo backfill`` geocodes documents
+written before this existed or before the gazetteer learned their place.
+"""
+import json
+import os
+import re
+import threading
+
+from pymongo import IndexModel, DESCENDING, GEOSPHERE
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'gazetteer.json')
+
+EARTH_RADIUS_METERS = 6378100
+DEFAULT_RADIUS_METERS = 1000
+MAX_RADIUS_METERS = 25000
+
+_NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+_COORDINATES_RE = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+_places = None
+_places_lock = threading.Lock()
+
+
+class InvalidLocation(ValueError):
+    """``near``/``radius`` that can't be turned into a search area."""
+
+
+def normalize_place(text):
+    text = str(text or '').lower().replace("'", '').replace('’', '')
+    return _NON_WORD_RE.sub(' ', text).strip()
+
+
+def point(lat, lng):
+    return {'type': 'Point', 'coordinates': [lng, lat]}
+
+
+def _load():
+    """``[(alias, place)]``, campus buildings first, then longest alias first."""
+    global _places
+    with _places_lock:
+        if _places is None:
+            with open(GAZETTEER_PATH, encoding='utf-8') as f:
+                places = json.load(f)['places']
+            aliases = []
+            for place in places:
+                for alias in [place['name']] + place.get('aliases', []):
+                    aliases.append((normalize_place(alias), place))
+            aliases.sort(key=lambda item: (item[1]['kind'] != 'campus', -len(item[0])))
+            _places = aliases
+    return _places
+
+
+def lookup(text):
+    """The gazetteer place mentioned in ``text``, or None.
+
+    An exact name/alias wins; otherwise the first alias (buildings before
+    neighborhoods, longer before shorter) that appears as whole words.
+    """
+    normalized = normalize_place(text)
+    if not normalized:
+        return None
+    aliases = _load()
+    for alias, place in aliases:
+        if alias == normalized:
+            return place
+    padded = f' {normalized} '
+    for alias, place in aliases:
+        if f' {alias} ' in padded:
+            return place
+    return None
+
+
+def geocode(text):
+    """GeoJSON point for a free-text location, or None if it isn't recognized."""
+    place = lookup(text)
+    return point(place['lat'], place['lng']) if place else None
+
+
+def geo_index():
+    """``$geoWithin`` on ``geo`` plus the newest-first keyset order."""
+    return IndexModel([('geo', GEOSPHERE), ('created_at', DESCENDING), ('_id', DESCENDING)])
+
+
+def _center(near):
+    match = _COORDINATES_RE.match(near)
+    if match:
+        lat, lng = float(match.group(1)), float(match.group(2))
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise InvalidLocation(f"near is out of range: {near}")
+        return lat, lng
+    place = lookup(near)
+    if place is None:
+        raise InvalidLocation(f"Unknown place: {near}")
+    return place['lat'], place['lng']
+
+
+def near_filter(near, radius=None):
+    """Filter for listings within ``radius`` meters of ``near`` ({} without ``near``).
+
+    ``near`` is ``"<lat>,<lng>"`` or a gazetteer place ("Bobst", "Williamsburg").
+    """
+    if not near:
+        return {}
+    lat, lng = _center(near)
+    try:
+        meters = float(radius) if radius not in (None, '') else DEFAULT_RADIUS_METERS
+    except ValueError:
+        raise InvalidLocation("radius must be a number of meters")
+    if not 0 < meters <= MAX_RADIUS_METERS:
+        raise InvalidLocation(f"radius must be between 0 and {MAX_RADIUS_METERS} meters")
+    return {'geo': {'$geoWithin': {'$centerSphere': [[lng, lat], meters / EARTH_RADIUS_METERS]}}}
@@ -1,8 +1,11 @@
+import logging
 from functools import wraps
 from flask import request, jsonify
 from bson import ObjectId
 from app.models.user import User
 
+logger = logging.getLogger(__name__)
+
 def header_auth_required(f):
     """
     Decorator that checks for X-User-ID header and authenticates the user.
@@ -15,7 +18,7 @@ def header_auth_required(f):
         
         # Check if X-User-ID is present and valid
         if not user_id or user_id == 'undefined' or user_id == 'null' or not user_id.strip():
-            print(f"Missing or invalid X-User-ID header: {user_id}")
+            logger.info("Missing or invalid X-User-ID header: %s", user_id)
             return jsonify({'error': 'X-User-ID header is required for authentication'}), 401
         
         # Try to validate the user ID
@@ -29,10 +32,10 @@ def header_auth_required(f):
             #     print(f"User with ID {user_id} not found")
             #     return jsonify({'error': 'User not found'}), 404
             
-            print(f"Authenticated request using X-User-ID: {user_id}")
+            logger.debug("Authenticated request using X-User-ID: %s", user_id)
             return f(*args, **kwargs)
         except Exception as e:
-            print(f"Error validating user ID from header: {e}")
+            logger.error("Error validating user ID from header: %s", e)
             return jsonify({'error': 'Invalid user ID'}), 401
     
     return decorated
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""Cache of user identity records for ``load_user`` and header auth.
+
+Two layers:
+
+* a per-request memo on ``flask.g`` so the session user, the ``X-User-ID``
+  user and any later ``User.get_by_id`` in the same request cost one lookup
+* a bounded, TTL-based LRU shared by the whole process
+
+Cached records never contain the password hash (see ``IDENTITY_PROJECTION``).
+Entries are dropped on profile updates, password changes and logout; other
+workers only see such a change once their TTL expires.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_request_context
+
+# Fields that are never needed to identify the current user
+IDENTITY_PROJECTION = {
+    'password': 0,
+    'posts': 0,
+    'roommates': 0,
+    'trades': 0,
+    'reset_token': 0,
+    'reset_token_expiry': 0,
+    'session_token': 0,
+    'remember_token': 0,
+}
+
+
+class IdentityCache:
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.request_hits = 0
+
+    # --- request-scoped memo ---
+    def _memo(self):
+        if not has_request_context():
+            return None
+        if 'user_identity_memo' not in g:
+            g.user_identity_memo = {}
+        return g.user_identity_memo
+
+    def get(self, user_id):
+        """Cached user record for ``user_id`` (a string), or None."""
+        memo = self._memo()
+        if memo is not None and user_id in memo:
+            with self._lock:
+                self.request_hits += 1
+            return memo[user_id]
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                record = entry[1]
+            else:
+                if entry:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+
+        if memo is not None:
+            memo[user_id] = record
+        return record
+
+    def put(self, user_id, record):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, record)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        memo = self._memo()
+        if memo is not None:
+            memo[user_id] = record
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            self._entries.pop(user_id, None)
+        memo = self._memo()
+        if memo is not None:
+            memo.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'request_hits': self.request_hits,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+user_cache = IdentityCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', 1024)),
+    ttl=int(os.getenv('USER_CACHE_TTL', 60)),
+)
@@ -0,0 +1,53 @@
+"""Typed ids for references between documents.
+
+Every reference to another document is stored as an ObjectId, never as its
+hex string: a string and an ObjectId never compare equal, so a query with
+the wrong type silently matches nothing and can't share an index with the
+right one. Convert at the edges (request args, headers, ``current_user.id``)
+with ``as_object_id``.
+
+``REFERENCE_FIELDS`` lists the reference fields per collection; the
+``flask --app app ids migrate`` command converts legacy string values.
+"""
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+
+# collection -> fields holding ids of other documents (arrays included)
+REFERENCE_FIELDS = {
+    'posts': ('user_id',),
+    'roommates': ('user_id',),
+    'trades': ('user_id', 'interested_users'),
+    'messages': ('senderId', 'receiverId'),
+    'chats': ('friendId', 'userId'),
+    'conversations': ('userId', 'peerId'),
+}
+
+
+def as_object_id(value):
+    """ObjectId for ``value`` (ObjectId or 24-hex string); raises InvalidId otherwise."""
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    raise InvalidId(f"{value!r} is not a valid ObjectId")
+
+
+def maybe_object_id(value):
+    """Like ``as_object_id`` but None for anything that isn't an id."""
+    try:
+        return as_object_id(value)
+    except InvalidId:
+        return None
+
+
+def convert_refs(value):
+    """Convert a stored reference (or array of them) from strings to ObjectIds.
+
+    Returns ``(new_value, changed)``; values that aren't valid ids are kept.
+    """
+    if isinstance(value, list):
+        converted = [convert_refs(item) for item in value]
+        return [v for v, _ in converted], any(changed for _, changed in converted)
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value), True
+    return value, False
@@ -0,0 +1,242 @@
+"""Content-addressed image storage kept outside the post documents.
+
+Images are stored once per SHA-256 digest (so re-uploads are free) together
+with a fixed-size JPEG thumbnail. Documents only keep the digest in their
+``images`` list; API responses turn digests into URLs served by the
+``images`` blueprint. Legacy entries (inline base64 or external URLs) are
+passed through untouched until ``flask images migrate`` moves them out.
+
+Two backends are available, picked with the ``IMAGE_STORE`` env var:
+
+* ``gridfs`` (default) - stored in MongoDB next to the rest of the data
+* ``filesystem`` - stored under ``IMAGE_STORE_PATH`` on local disk
+"""
+import abc
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+
+from flask import has_request_context, url_for
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - thumbnails fall back to originals
+    Image = None
+
+THUMBNAIL_SIZE = (320, 320)
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', 10 * 1024 * 1024))
+
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+_OWN_URL_RE = re.compile(r'/api/images/(?P<digest>[0-9a-f]{64})(/thumbnail)?/?$')
+_DATA_URI_RE = re.compile(r'^data:(?P<type>[\w/+.-]+)?(;[\w-]+=[\w-]+)*;base64,', re.IGNORECASE)
+
+# Magic numbers of the formats we accept
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+class InvalidImage(ValueError):
+    """Raised for uploads that are not a supported image."""
+
+
+def sniff_content_type(data):
+    for signature, content_type in _SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def is_image_ref(value):
+    return isinstance(value, str) and bool(_DIGEST_RE.match(value))
+
+
+def decode_inline_image(value):
+    """Return the bytes of an inline base64 image, or None if ``value`` isn't one."""
+    if not isinstance(value, str) or is_image_ref(value) or '://' in value[:16]:
+        return None
+    match = _DATA_URI_RE.match(value)
+    payload = value[match.end():] if match else value
+    try:
+        data = base64.b64decode(payload, validate=False)
+    except (binascii.Error, ValueError):
+        return None
+    return data if sniff_content_type(data) else None
+
+
+def make_thumbnail(data):
+    """Fixed-size JPEG thumbnail; the original bytes if Pillow isn't installed."""
+    if Image is None:
+        return data
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        thumb = ImageOps.fit(img, THUMBNAIL_SIZE)
+        out = io.BytesIO()
+        thumb.save(out, format='JPEG', quality=80, optimize=True)
+        return out.getvalue()
+
+
+class ImageStore(abc.ABC):
+    """Backend interface: ``_exists``/``_write``/``read`` keyed by digest."""
+
+    def put(self, data):
+        """Store ``data`` (and its thumbnail) and return its digest."""
+        if len(data) > MAX_IMAGE_BYTES:
+            raise InvalidImage(f"Image larger than {MAX_IMAGE_BYTES} bytes")
+        content_type = sniff_content_type(data)
+        if not content_type:
+            raise InvalidImage("Unsupported image format")
+
+        digest = hashlib.sha256(data).hexdigest()
+        if not self._exists(digest):
+            try:
+                thumbnail = make_thumbnail(data)
+            except (OSError, ValueError) as e:
+                raise InvalidImage(f"Could not decode image: {e}") from e
+            self._write(digest, 'thumbnail', thumbnail, 'image/jpeg' if Image else content_type)
+            # Original last: its presence is what marks the image as stored
+            self._write(digest, 'original', data, content_type)
+        return digest
+
+    @abc.abstractmethod
+    def read(self, digest, variant='original'):
+        """Return ``(bytes, content_type)`` or None."""
+
+    @abc.abstractmethod
+    def _exists(self, digest):
+        pass
+
+    @abc.abstractmethod
+    def _write(self, digest, variant, data, content_type):
+        pass
+
+
+class GridFSImageStore(ImageStore):
+    def __init__(self, database, collection='images'):
+        import gridfs
+        self.fs = gridfs.GridFS(database, collection=collection)
+
+    def _file_id(self, digest, variant):
+        return digest if variant == 'original' else f"{digest}:{variant}"
+
+    def _exists(self, digest):
+        return self.fs.exists(self._file_id(digest, 'original'))
+
+    def _write(self, digest, variant, data, content_type):
+        import gridfs
+        try:
+            self.fs.put(data, _id=self._file_id(digest, variant), contentType=content_type)
+        except gridfs.errors.FileExists:
+            pass  # another worker stored the same image first
+
+    def read(self, digest, variant='original'):
+        import gridfs
+        try:
+            f = self.fs.get(self._file_id(digest, variant))
+        except gridfs.errors.NoFile:
+            return None
+        return f.read(), f.content_type
+
+
+class FilesystemImageStore(ImageStore):
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, digest, variant):
+        suffix = '' if variant == 'original' else f'.{variant}'
+        return os.path.join(self.root, digest[:2], digest[2:4], digest + suffix)
+
+    def _exists(self, digest):
+        return os.path.exists(self._path(digest, 'original'))
+
+    def _write(self, digest, variant, data, content_type):
+        path = self._path(digest, variant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial file; the temp
+        # name is unique per call, so concurrent writes of the same digest
+        # can't truncate each other
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(tmp, 0o644)    # mkstemp creates it owner-only
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def read(self, digest, variant='original'):
+        try:
+            with open(self._path(digest, variant), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        return data, sniff_content_type(data) or 'application/octet-stream'
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_image_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if os.getenv('IMAGE_STORE', 'gridfs') == 'filesystem':
+                    root = os.getenv('IMAGE_STORE_PATH', os.path.join(os.getcwd(), 'image_store'))
+                    _store = FilesystemImageStore(root)
+                else:
+                    from app import db
+                    _store = GridFSImageStore(db)
+    return _store
+
+
+def externalize_images(images):
+    """Move inline base64 images into the store and return the list of refs.
+
+    URLs we handed out ourselves (e.g. sent back by an edit form) are turned
+    back into refs; other URLs are kept as they are.
+    """
+    if not images:
+        return images
+    refs = []
+    for value in images:
+        own = _OWN_URL_RE.search(value) if isinstance(value, str) else None
+        if own:
+            refs.append(own.group('digest'))
+            continue
+        data = decode_inline_image(value)
+        refs.append(get_image_store().put(data) if data is not None else value)
+    return refs
+
+
+def image_url(ref, thumbnail=False):
+    """URL for a stored image; anything else (URLs, legacy base64) as-is."""
+    if not is_image_ref(ref):
+        return ref
+    endpoint = 'images.get_thumbnail' if thumbnail else 'images.get_image'
+    if has_request_context():
+        return url_for(endpoint, digest=ref, _external=True)
+    return f"/api/images/{ref}" + ('/thumbnail' if thumbnail else '')
+
+
+def present_images(docs, thumbnail=False):
+    """Replace image refs with URLs on each doc in place."""
+    for doc in docs:
+        if doc and doc.get('images'):
+            doc['images'] = [image_url(ref, thumbnail) for ref in doc['images']]
+    return docs
@@ -0,0 +1,79 @@
+"""Declarative index registry.
+
+Each model declares the indexes its queries need next to the class::
+
+    @register_indexes
+    class Post:
+        collection = db.posts
+        indexes = [IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)])]
+
+``ensure_indexes()`` creates them (a no-op for indexes that already exist)
+and runs at startup unless ``AUTO_CREATE_INDEXES=false``; rolling deploys
+can run ``flask --app app indexes ensure`` instead. ``index_report()``
+lists declared indexes that are missing and existing ones that are unused.
+"""
+import logging
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+_registry = []
+
+
+def register_indexes(cls):
+    """Class decorator: add ``cls.indexes`` on ``cls.collection`` to the registry."""
+    _registry.append(cls)
+    return cls
+
+
+def registered():
+    """``[(collection, [IndexModel])]`` for every registered model."""
+    return [(cls.collection, list(cls.indexes)) for cls in _registry]
+
+
+def _name(index):
+    return index.document['name']
+
+
+def ensure_indexes():
+    """Create every declared index. Returns ``{collection: [created names]}``."""
+    created = {}
+    for collection, indexes in registered():
+        try:
+            created[collection.name] = collection.create_indexes(indexes)
+        except OperationFailure as e:
+            # One conflicting definition shouldn't stop the others
+            logger.error("Error creating indexes on %s: %s", collection.name, e)
+            created[collection.name] = []
+            for index in indexes:
+                try:
+                    created[collection.name] += collection.create_indexes([index])
+                except OperationFailure as e:
+                    logger.error("Error creating index %s on %s: %s", _name(index), collection.name, e)
+    return created
+
+
+def _index_usage(collection):
+    """``{index name: ops since server start}``; empty if $indexStats is unsupported."""
+    try:
+        return {
+            stat['name']: stat['accesses']['ops']
+            for stat in collection.aggregate([{'$indexStats': {}}])
+        }
+    except OperationFailure:
+        return {}
+
+
+def index_report():
+    """Per collection: declared indexes missing from the server, and unused ones."""
+    report = {}
+    for collection, indexes in registered():
+        declared = {_name(index) for index in indexes}
+        existing = set(collection.index_information())
+        usage = _index_usage(collection)
+        report[collection.name] = {
+            'missing': sorted(declared - existing),
+            'undeclared': sorted(existing - declared - {'_id_'}),
+            'unused': sorted(name for name, ops in usage.items() if ops == 0 and name != '_id_'),
+        }
+    return report
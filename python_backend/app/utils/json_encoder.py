@@ -1,26 +1,66 @@
-from bson import ObjectId
-from datetime import datetime
-
-class MongoJSONEncoder:
-    @staticmethod
-    def encode_document(document):
-        """Convert MongoDB document to JSON serializable format"""
-        if document is None:
-            return None
-        
-        if isinstance(document, list):
-            return [MongoJSONEncoder.encode_document(item) for item in document]
-        
-        if isinstance(document, dict):
-            result = {}
-            for key, value in document.items():
-                result[key] = MongoJSONEncoder.encode_document(value)
-            return result
-        
-        if isinstance(document, ObjectId):
-            return str(document)
-        
-        if isinstance(document, datetime):
-            return document.isoformat()
-        
-        return document
\ No newline at end of file
+"""Single-pass JSON serialization for MongoDB documents.
+
+Models return raw documents (ObjectId, datetime and all) and the Flask JSON
+provider below writes them straight to response bytes. There is no more
+``json.loads(json.dumps(...))`` round-trip in the models followed by a
+second encode in ``jsonify``.
+
+``orjson`` is used when it is installed (with non-string dict keys allowed,
+as the stdlib encoder does); the stdlib encoder is the fallback. The two
+agree on everything the API returns except non-finite floats: orjson
+writes ``NaN``/``Infinity`` as ``null``, the stdlib encoder as bare
+``NaN``/``Infinity``, which isn't valid JSON.
+"""
+import json
+from datetime import date, datetime
+
+from bson.objectid import ObjectId
+from bson.decimal128 import Decimal128
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def _default(o):
+    """Encode the BSON types the JSON encoders don't know about."""
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, Decimal128):
+        return str(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(obj):
+        """Serialize ``obj`` (Mongo documents included) to JSON bytes."""
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    _encoder = json.JSONEncoder(default=_default, separators=(',', ':'), ensure_ascii=False)
+
+    def dumps(obj):
+        """Serialize ``obj`` (Mongo documents included) to JSON bytes."""
+        return _encoder.encode(obj).encode('utf-8')
+
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider so ``jsonify`` understands Mongo documents."""
+
+    default = staticmethod(_default)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', _default)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        # Encode directly to bytes instead of str -> bytes via the base class
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
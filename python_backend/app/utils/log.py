@@ -0,0 +1,120 @@
+"""Application logging: levels, per-route sampling, redaction, async output.
+
+Modules log through ``logging.getLogger(__name__)`` (everything lives under
+the ``app`` logger). ``setup_logging`` attaches a single ``QueueHandler`` so
+request threads only enqueue records; a background ``QueueListener`` does
+the actual stdout writes.
+
+Environment:
+
+* ``LOG_LEVEL`` - DEBUG/INFO/WARNING/... (default DEBUG in development,
+  WARNING otherwise, so debug calls are skipped before any formatting)
+* ``LOG_SAMPLE_RATES`` - e.g. ``/api/posts=0.1,/api/search=0.01``: keep that
+  fraction of requests' DEBUG/INFO records per path prefix. Warnings and
+  errors are never sampled away.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+from collections.abc import Mapping
+
+from flask import g, has_request_context, request
+
+REDACTED = '[REDACTED]'
+
+# Keys whose values must never reach the logs
+_SENSITIVE_KEY_RE = re.compile(r'pass|token|secret|cookie|authorization|hash|session|^_id$', re.IGNORECASE)
+# key=value / "key": "value" pairs inside already formatted strings
+_SENSITIVE_PAIR_RE = re.compile(
+    r"""(?P<key>['"]?[\w-]*(?:pass|token|secret|cookie|authorization)[\w-]*['"]?\s*[:=]\s*)(?P<value>'[^']*'|"[^"]*"|[^\s,}]+)""",
+    re.IGNORECASE,
+)
+
+_listener = None
+
+
+def redact(value):
+    """Copy of ``value`` with sensitive mapping entries blanked out."""
+    if isinstance(value, Mapping) or (hasattr(value, 'items') and not isinstance(value, (str, bytes))):
+        try:
+            items = value.items()
+        except TypeError:
+            return value
+        return {
+            k: REDACTED if isinstance(k, str) and _SENSITIVE_KEY_RE.search(k) else redact(v)
+            for k, v in items
+        }
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(v) for v in value)
+    return value
+
+
+class RedactingFilter(logging.Filter):
+    """Blank out secrets in structured args, then in the formatted message."""
+
+    def filter(self, record):
+        if record.args:
+            if isinstance(record.args, Mapping):
+                record.args = redact(record.args)
+            else:
+                record.args = tuple(redact(a) for a in record.args)
+        message = record.getMessage()
+        record.msg = _SENSITIVE_PAIR_RE.sub(lambda m: m.group('key') + REDACTED, message)
+        record.args = None
+        return True
+
+
+def _parse_rates(spec):
+    rates = []
+    for part in (spec or '').split(','):
+        prefix, _, rate = part.strip().partition('=')
+        if prefix and rate:
+            rates.append((prefix, float(rate)))
+    # Longest prefix wins
+    return sorted(rates, key=lambda r: len(r[0]), reverse=True)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep DEBUG/INFO for a fraction of requests, decided once per request."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates or not has_request_context():
+            return True
+        if 'log_sampled' not in g:
+            rate = next((r for prefix, r in self.rates if request.path.startswith(prefix)), 1.0)
+            g.log_sampled = random.random() < rate
+        return g.log_sampled
+
+
+def setup_logging(dev_mode=False):
+    """Configure the ``app`` logger once; later calls are no-ops."""
+    global _listener
+    logger = logging.getLogger('app')
+    if _listener is not None:
+        return logger
+
+    default_level = 'DEBUG' if dev_mode else 'WARNING'
+    logger.setLevel(os.getenv('LOG_LEVEL', default_level).upper())
+    logger.propagate = False
+
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(SamplingFilter(_parse_rates(os.getenv('LOG_SAMPLE_RATES'))))
+    handler.addFilter(RedactingFilter())
+    logger.addHandler(handler)
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return logger
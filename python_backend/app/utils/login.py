@@ -2,6 +2,8 @@ from flask import session, request, jsonify
 from app.models.user import User
 import logging
 
+logger = logging.getLogger(__name__)
+
 # Login utility functions
 # Note: The main user_loader function is now in __init__.py
 
@@ -28,7 +30,7 @@ def update_session_consistency(user_id):
         
     if 'user_id' not in session or session['user_id'] != str(user_id):
         session['user_id'] = str(user_id)
-        print(f"Updated session user ID: {user_id}")
+        logger.debug("Updated session user ID: %s", user_id)
         return True
     
     return False
\ No newline at end of file
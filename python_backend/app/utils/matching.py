@@ -0,0 +1,232 @@
+"""Roommate compatibility matching, vectorized with NumPy.
+
+Each roommate post is encoded once, when it is written: its preferences
+become a column of a boolean matrix (one row per distinct normalized
+preference, so the rows a query touches are contiguous) and its location,
+year and owner become integer codes. Scoring
+one post against every other post is then a few array operations over all
+rows at once::
+
+    score = PREFERENCE_WEIGHT * jaccard(preferences)
+          + LOCATION_WEIGHT * (same location)
+          + YEAR_WEIGHT * (same year)
+
+The encoding lives in-process. ``Roommate`` create/update/delete keep it up
+to date in place; writes made by other workers show up when it is rebuilt
+from Mongo, at most ``MATCH_INDEX_TTL`` seconds later. The rebuild fills a
+separate ``MatchIndex`` without holding the lock, replays the writes made
+meanwhile and swaps the arrays in, so matching and writes never wait on it.
+"""
+import logging
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PREFERENCE_WEIGHT = 0.7
+LOCATION_WEIGHT = 0.2
+YEAR_WEIGHT = 0.1
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+MATCH_INDEX_TTL_SECONDS = int(os.getenv('MATCH_INDEX_TTL', 300))
+
+MATCH_PROJECTION = {'preferences': 1, 'location': 1, 'year': 1, 'user_id': 1}
+
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize(value):
+    """Case- and whitespace-insensitive form of a preference, location or year."""
+    return _SPACE_RE.sub(' ', str(value or '')).strip().lower()
+
+
+def preference_set(doc):
+    preferences = doc.get('preferences') or []
+    if isinstance(preferences, str):
+        preferences = preferences.split(',')
+    return {p for p in (normalize(p) for p in preferences) if p}
+
+
+def _grow(array, rows, cols=None, fill=0):
+    """``array`` padded with ``fill`` to ``rows`` (and ``cols``)."""
+    shape = (rows,) if cols is None else (rows, cols)
+    grown = np.full(shape, fill, dtype=array.dtype)
+    grown[tuple(slice(0, n) for n in array.shape)] = array
+    return grown
+
+
+class MatchIndex:
+    """Preference bit matrix plus location/year/owner codes, one slot per post."""
+
+    def __init__(self, collection, ttl=MATCH_INDEX_TTL_SECONDS):
+        self.collection = collection
+        self.ttl = ttl
+        self.built_at = None
+        self.stale = False
+        self._journal = None    # writes seen while a rebuild is running
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self, capacity=1024, vocab_capacity=64):
+        self.vocab = {}
+        self.codes = {'location': {}, 'year': {}, 'owner': {}}
+        self.row_of = {}
+        self.ids = []
+        self.size = 0
+        self.prefs = np.zeros((vocab_capacity, capacity), dtype=bool)
+        self.pref_counts = np.zeros(capacity, dtype=np.int32)
+        self.location = np.full(capacity, -1, dtype=np.int32)
+        self.year = np.full(capacity, -1, dtype=np.int32)
+        self.owner = np.full(capacity, -1, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+
+    def _code(self, kind, value):
+        value = normalize(value)
+        if not value:
+            return -1
+        codes = self.codes[kind]
+        return codes.setdefault(value, len(codes))
+
+    def _row(self, _id):
+        row = self.row_of.get(_id)
+        if row is not None:
+            return row
+        row = self.size
+        if row == len(self.alive):
+            capacity = 2 * row
+            self.prefs = _grow(self.prefs, self.prefs.shape[0], capacity)
+            self.pref_counts = _grow(self.pref_counts, capacity)
+            self.location = _grow(self.location, capacity, fill=-1)
+            self.year = _grow(self.year, capacity, fill=-1)
+            self.owner = _grow(self.owner, capacity, fill=-1)
+            self.alive = _grow(self.alive, capacity)
+        self.row_of[_id] = row
+        self.ids.append(_id)
+        self.size += 1
+        return row
+
+    def _columns(self, preferences):
+        for preference in preferences:
+            if preference not in self.vocab:
+                self.vocab[preference] = len(self.vocab)
+        if len(self.vocab) > self.prefs.shape[0]:
+            self.prefs = _grow(self.prefs, 2 * len(self.vocab), self.prefs.shape[1])
+        return [self.vocab[p] for p in preferences]
+
+    def _put(self, doc):
+        preferences = preference_set(doc)
+        columns = self._columns(preferences)
+        row = self._row(doc['_id'])
+        self.prefs[:, row] = False
+        self.prefs[columns, row] = True
+        self.pref_counts[row] = len(preferences)
+        self.location[row] = self._code('location', doc.get('location'))
+        self.year[row] = self._code('year', doc.get('year'))
+        self.owner[row] = self._code('owner', doc.get('user_id'))
+        self.alive[row] = True
+
+    def _build(self):
+        started = time.perf_counter()
+        self._reset()
+        for doc in self.collection.find({}, MATCH_PROJECTION):
+            self._put(doc)
+        self.built_at = time.monotonic()
+        logger.info("Built roommate match index: %d posts, %d preferences in %.1fms",
+                    self.size, len(self.vocab), (time.perf_counter() - started) * 1000)
+
+    def refresh_if_stale(self):
+        """Rebuild from Mongo when stale; call without holding ``_lock``.
+
+        Only one thread rebuilds at a time; the others keep matching
+        against the current arrays.
+        """
+        with self._lock:
+            stale = self.built_at is None or self.stale or time.monotonic() - self.built_at > self.ttl
+            if self._journal is not None or not stale:
+                return
+            self._journal = []
+            self.stale = False
+        try:
+            fresh = MatchIndex(self.collection, self.ttl)
+            fresh._build()
+        except Exception:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            for doc, _id in self._journal:
+                if doc is not None:
+                    fresh._put(doc)
+                else:
+                    fresh._remove(_id)
+            self._journal = None
+            for name in ('vocab', 'codes', 'row_of', 'ids', 'size', 'prefs', 'pref_counts',
+                         'location', 'year', 'owner', 'alive', 'built_at'):
+                setattr(self, name, getattr(fresh, name))
+
+    # --- incremental maintenance (called by the Roommate model) ---
+    def upsert(self, doc):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((doc, None))
+            if self.built_at is not None:
+                self._put(doc)
+
+    def remove(self, _id):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((None, _id))
+            self._remove(_id)
+
+    def _remove(self, _id):
+        row = self.row_of.pop(_id, None)
+        if row is not None:
+            self.alive[row] = False
+
+    def invalidate(self):
+        """Rebuild on next use; the current arrays are used until then."""
+        with self._lock:
+            self.stale = True
+
+    # --- queries ---
+    def matches(self, doc, limit=DEFAULT_LIMIT):
+        """``[(post_id, score)]`` for the best matches of ``doc``, best first.
+
+        Posts by ``doc``'s owner and posts with nothing in common are left out.
+        """
+        self.refresh_if_stale()
+        with self._lock:
+            n = self.size
+            preferences = preference_set(doc)
+            columns = [self.vocab[p] for p in preferences if p in self.vocab]
+
+            if columns:
+                shared = self.prefs[columns, :n].sum(axis=0, dtype=np.int32)
+            else:
+                shared = np.zeros(n, dtype=np.int32)
+            union = self.pref_counts[:n] + len(preferences) - shared
+            jaccard = np.divide(shared, union, out=np.zeros(n), where=union > 0)
+
+            score = PREFERENCE_WEIGHT * jaccard
+            location = self.codes['location'].get(normalize(doc.get('location')))
+            if location is not None:
+                score += LOCATION_WEIGHT * (self.location[:n] == location)
+            year = self.codes['year'].get(normalize(doc.get('year')))
+            if year is not None:
+                score += YEAR_WEIGHT * (self.year[:n] == year)
+
+            owner = self.codes['owner'].get(normalize(doc.get('user_id')), -2)
+            candidates = self.alive[:n] & (self.owner[:n] != owner) & (score > 0)
+            score = np.where(candidates, score, -np.inf)
+
+            k = min(limit, int(candidates.sum()))
+            if k == 0:
+                return []
+            top = np.argpartition(-score, k - 1)[:k]
+            top = top[np.argsort(-score[top], kind='stable')]
+            return [(self.ids[row], round(float(score[row]), 4)) for row in top]
@@ -0,0 +1,66 @@
+"""Ownership-checked writes in a single round trip.
+
+Instead of ``get_by_id`` + compare owner + write, the ownership predicate is
+part of the write filter, and ``find_one_and_update`` hands back the updated
+document. Only when nothing matched do we look at ``_id`` alone (an index
+only lookup) to tell a missing document from someone else's.
+"""
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+
+
+class NotFound(LookupError):
+    """No document with that id."""
+
+
+class Forbidden(PermissionError):
+    """The document exists but the caller may not change it."""
+
+
+def owned_by(user_id, field='user_id'):
+    """Filter clause: ``field`` is ``user_id`` (stored as ObjectId or string)."""
+    values = [str(user_id)]
+    if ObjectId.is_valid(str(user_id)):
+        values.append(ObjectId(str(user_id)))
+    return {field: {'$in': values}}
+
+
+def any_of(*clauses):
+    return {'$or': list(clauses)}
+
+
+def _object_id(doc_id):
+    try:
+        return ObjectId(str(doc_id))
+    except (InvalidId, TypeError):
+        raise NotFound(doc_id)
+
+
+def _missing_or_forbidden(collection, _id):
+    if collection.find_one({'_id': _id}, {'_id': 1}) is None:
+        raise NotFound(str(_id))
+    raise Forbidden(str(_id))
+
+
+def update_owned(collection, doc_id, owner, update, projection=None):
+    """Apply ``update`` if ``owner`` matches; return the updated document."""
+    _id = _object_id(doc_id)
+    doc = collection.find_one_and_update(
+        {'_id': _id, **owner},
+        update,
+        projection=projection,
+        return_document=ReturnDocument.AFTER
+    )
+    if doc is None:
+        _missing_or_forbidden(collection, _id)
+    return doc
+
+
+def delete_owned(collection, doc_id, owner, projection=None):
+    """Delete the document if ``owner`` matches; return what was deleted."""
+    _id = _object_id(doc_id)
+    doc = collection.find_one_and_delete({'_id': _id, **owner}, projection=projection or {'_id': 1})
+    if doc is None:
+        _missing_or_forbidden(collection, _id)
+    return doc
@@ -0,0 +1,110 @@
+"""Keyset (cursor) pagination shared by the feed-style list endpoints.
+
+Pages are ordered newest-first on ``(<field>, _id)`` so that ties on the
+timestamp still have a stable order. The cursor handed to clients is an
+opaque base64 token of ``<iso timestamp>,<object id>`` taken from the last
+document of the page; the next page is everything strictly "before" it.
+"""
+import base64
+import threading
+import time
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import IndexModel, DESCENDING
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Totals are only an approximation for the UI, so they are cached briefly
+# instead of counting the whole collection on every request.
+COUNT_TTL_SECONDS = 30
+
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue."""
+
+
+def clamp_limit(limit):
+    return max(1, min(int(limit), MAX_LIMIT))
+
+
+def encode_cursor(doc, field='created_at'):
+    value = doc.get(field)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = f"{value},{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        value, _id = raw.rsplit(',', 1)
+        return datetime.fromisoformat(value), ObjectId(_id)
+    except (ValueError, InvalidId, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {token}") from e
+
+
+def keyset_filter(query, after, field='created_at'):
+    """Combine ``query`` with the "strictly older than the cursor" predicate."""
+    if not after:
+        return query
+    value, _id = decode_cursor(after) if isinstance(after, str) else after
+    page_filter = {'$or': [
+        {field: {'$lt': value}},
+        {field: value, '_id': {'$lt': _id}},
+    ]}
+    return {'$and': [query, page_filter]} if query else page_filter
+
+
+def keyset_index(field='created_at'):
+    """The compound ``(field, _id)`` index a keyset-paginated collection needs."""
+    return IndexModel([(field, DESCENDING), ('_id', DESCENDING)])
+
+
+def paginate(collection, query=None, after=None, limit=DEFAULT_LIMIT, field='created_at', projection=None, page=None):
+    """Return ``(docs, next_cursor)`` for one newest-first page.
+
+    ``after`` is a cursor token from a previous page. ``page`` keeps the old
+    offset behaviour for callers that still send ``?page=``; it is ignored
+    when a cursor is given.
+    """
+    limit = clamp_limit(limit)
+
+    cursor = (
+        collection.find(keyset_filter(query or {}, after, field), projection)
+        .sort([(field, -1), ('_id', -1)])
+    )
+    if page is not None and not after:
+        cursor = cursor.skip((max(1, int(page)) - 1) * limit)
+
+    # Fetch one extra document to know whether there is a next page
+    docs = list(cursor.limit(limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1], field) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+def cached_count(collection, query=None, ttl=COUNT_TTL_SECONDS):
+    """Count matching documents, reusing the result for ``ttl`` seconds."""
+    key = (collection.full_name, repr(query or {}))
+    now = time.monotonic()
+    with _count_lock:
+        hit = _count_cache.get(key)
+        if hit and now - hit[0] < ttl:
+            return hit[1]
+
+    if query:
+        total = collection.count_documents(query)
+    else:
+        # Unfiltered totals come from collection metadata, not a scan
+        total = collection.estimated_document_count()
+
+    with _count_lock:
+        _count_cache[key] = (now, total)
+    return total
@@ -0,0 +1,223 @@
+"""Per-endpoint Mongo command metrics from pymongo command monitoring.
+
+``query_monitor`` is passed to ``MongoClient(event_listeners=[...])``. Each
+command is attributed to the Flask route that issued it (``GET /api/posts``)
+and aggregated: commands, wire time, documents and reply bytes, per route
+and per command name. ``/metrics/queries`` serves the aggregates.
+
+For tests there is a budget API::
+
+    query_monitor.set_budget('GET /api/search', 3)   # fails the request if exceeded
+
+    with query_monitor.budget(2):                    # fails the block if exceeded
+        client.get('/api/search?q=desk')
+
+Over-budget requests raise ``QueryBudgetExceeded`` when ``app.testing`` is
+set and are logged as warnings otherwise. ``QUERY_METRICS=false`` turns the
+listener off.
+
+Reply sizes are off by default: pymongo hands the listener decoded replies,
+so measuring them means re-encoding every reply (whole ``find`` batches and
+aggregation results) to BSON on the request thread, roughly doubling the
+encode work of large reads. ``QUERY_METRICS_BYTES=true`` turns them on for
+a profiling session; ``bytes`` stays 0 otherwise.
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+import bson
+from flask import current_app, g, has_request_context, request
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND = '<background>'
+
+# Commands pymongo sends for its own bookkeeping
+_IGNORED = {'isMaster', 'ismaster', 'hello', 'ping', 'buildInfo', 'buildinfo', 'endSessions',
+            'saslStart', 'saslContinue', 'getnonce', 'authenticate'}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """More Mongo commands than the budget allows."""
+
+
+def current_route():
+    """``"<METHOD> <url rule>"`` for the active request, or ``BACKGROUND``."""
+    if not has_request_context():
+        return BACKGROUND
+    rule = request.url_rule.rule if request.url_rule else request.path
+    return f"{request.method} {rule}"
+
+
+def _collection(event):
+    target = event.command.get(event.command_name)
+    if isinstance(target, str):
+        return target
+    return event.command.get('collection', '')
+
+
+def _documents(reply):
+    cursor = reply.get('cursor')
+    if isinstance(cursor, dict):
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or [])
+    n = reply.get('n')
+    return n if isinstance(n, int) else 0
+
+
+def _new_stats():
+    return {'requests': 0, 'commands': 0, 'duration_ms': 0.0, 'documents': 0, 'bytes': 0, 'errors': 0, 'by_command': {}}
+
+
+class QueryMonitor(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}
+        self._routes = {}
+        self._budgets = {}
+        self._captures = []
+        self._hooks = []
+        self._lock = threading.Lock()
+        self.enabled = os.getenv('QUERY_METRICS', 'true').lower() != 'false'
+        self.measure_bytes = os.getenv('QUERY_METRICS_BYTES', 'false').lower() == 'true'
+
+    # --- pymongo listener ---
+    def started(self, event):
+        if not self.enabled or event.command_name in _IGNORED:
+            return
+        route = current_route()
+        if has_request_context():
+            g.query_count = g.get('query_count', 0) + 1
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (route, _collection(event), event.command)
+
+    def _finish(self, event, reply=None, failed=False):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        route, collection, command = pending
+        duration_ms = event.duration_micros / 1000
+        documents = _documents(reply) if reply else 0
+        # Costs a full BSON re-encode of the reply, hence opt-in
+        size = len(bson.encode(reply)) if reply and self.measure_bytes else 0
+
+        record = {
+            'route': route,
+            'command': event.command_name,
+            'collection': collection,
+            'duration_ms': duration_ms,
+            'documents': documents,
+            'bytes': size,
+            'failed': failed,
+        }
+        with self._lock:
+            stats = self._routes.setdefault(route, _new_stats())
+            stats['commands'] += 1
+            stats['duration_ms'] += duration_ms
+            stats['documents'] += documents
+            stats['bytes'] += size
+            stats['errors'] += int(failed)
+            per_command = stats['by_command'].setdefault(f"{event.command_name} {collection}".strip(), [0, 0.0])
+            per_command[0] += 1
+            per_command[1] += duration_ms
+            for capture in self._captures:
+                capture.append(record)
+            hooks = list(self._hooks)
+
+        for hook in hooks:
+            try:
+                hook(record, command, event)
+            except Exception as e:
+                logger.error("Error in query monitor hook: %s", e)
+
+    def succeeded(self, event):
+        self._finish(event, reply=event.reply)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    # --- extension point ---
+    def add_hook(self, hook):
+        """Call ``hook(record, command, event)`` after every finished command."""
+        self._hooks.append(hook)
+
+    # --- Flask integration ---
+    def init_app(self, app):
+        @app.after_request
+        def _account_request(response):
+            route = current_route()
+            count = g.get('query_count', 0)
+            with self._lock:
+                self._routes.setdefault(route, _new_stats())['requests'] += 1
+            response.headers['X-Query-Count'] = str(count)
+            self._check_budget(route, count)
+            return response
+
+    def _check_budget(self, route, count):
+        budget = self._budgets.get(route)
+        if budget is None or count <= budget:
+            return
+        message = f"{route} ran {count} Mongo commands (budget {budget})"
+        if current_app.testing:
+            raise QueryBudgetExceeded(message)
+        logger.warning("Query budget exceeded: %s", message)
+
+    # --- budgets (tests) ---
+    def set_budget(self, route, max_commands):
+        """Allow ``route`` (e.g. ``'GET /api/search'``) at most ``max_commands`` per request."""
+        if max_commands is None:
+            self._budgets.pop(route, None)
+        else:
+            self._budgets[route] = max_commands
+
+    @contextmanager
+    def capture(self):
+        """Collect the command records issued inside the block."""
+        records = []
+        with self._lock:
+            self._captures.append(records)
+        try:
+            yield records
+        finally:
+            with self._lock:
+                self._captures.remove(records)
+
+    @contextmanager
+    def budget(self, max_commands):
+        """Fail if the block issues more than ``max_commands`` commands."""
+        with self.capture() as records:
+            yield records
+        if len(records) > max_commands:
+            summary = ', '.join(f"{r['command']} {r['collection']}" for r in records)
+            raise QueryBudgetExceeded(f"{len(records)} Mongo commands (budget {max_commands}): {summary}")
+
+    # --- reporting ---
+    def snapshot(self):
+        with self._lock:
+            routes = {}
+            for route, stats in self._routes.items():
+                requests = stats['requests']
+                routes[route] = dict(
+                    stats,
+                    duration_ms=round(stats['duration_ms'], 3),
+                    commands_per_request=round(stats['commands'] / requests, 2) if requests else None,
+                    by_command={
+                        name: {'count': count, 'duration_ms': round(ms, 3)}
+                        for name, (count, ms) in stats['by_command'].items()
+                    },
+                )
+            return {
+                'enabled': self.enabled,
+                'measure_bytes': self.measure_bytes,
+                'budgets': dict(self._budgets),
+                'routes': routes,
+            }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+query_monitor = QueryMonitor()
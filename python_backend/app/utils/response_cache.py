@@ -0,0 +1,272 @@
+"""Read-through cache of serialized responses for hot public endpoints.
+
+``@response_cache.cached(tags=('posts',))`` under a route stores the
+response body (bytes) and the headers that describe it, keyed by the
+request path plus the normalized query string (parameters sorted and
+stripped, optional per-parameter normalizers), so ``?limit=20&page=1`` and
+``?page=1&limit=20`` share an entry. Only ``200`` responses to GETs
+are stored; a hit replays the bytes without touching Mongo or the JSON
+encoder and still honours ``If-None-Match`` / ``If-Modified-Since``.
+
+Entries are tagged with the collections they were built from, and the
+model mutators call ``response_cache.invalidate(tag)`` after every write.
+
+Backends (``RESPONSE_CACHE``):
+
+* ``memory`` (default): per-process LRU with a TTL. A write only clears the
+  process that made it; other workers catch up within ``RESPONSE_CACHE_TTL``.
+* ``mongodb``: the ``response_cache`` collection, shared by all workers, so
+  invalidation is global (expired entries dropped by a TTL index).
+* ``off``
+
+Hit/miss counts per route are at ``/metrics/response-cache``; cached routes
+answer with ``X-Cache: HIT`` or ``MISS``.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+from urllib.parse import urlencode
+
+from bson.binary import Binary
+from flask import Response, current_app, request
+from pymongo import IndexModel, ASCENDING
+from pymongo.errors import PyMongoError
+
+from app.utils.indexes import register_indexes
+from app.utils.query_metrics import current_route
+
+logger = logging.getLogger(__name__)
+
+# Headers that belong to the cached representation (not CORS, cookies, ...)
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'X-Next-Cursor', 'Link')
+MAX_ENTRY_BYTES = 512 * 1024
+
+
+class MemoryBackend:
+    """Bounded LRU of ``key -> (expires, tags, entry)``."""
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item[2]
+
+    def set(self, key, entry, ttl, tags):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, frozenset(tags), entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tags):
+        tags = set(tags)
+        with self._lock:
+            stale = [key for key, (_, entry_tags, _) in self._entries.items() if entry_tags & tags]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+
+class MongoBackend:
+    """Entries shared by every worker; ``tags`` is indexed for invalidation."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.indexes = [
+            IndexModel([('expires', ASCENDING)], expireAfterSeconds=0),
+            IndexModel([('tags', ASCENDING)]),
+        ]
+
+    def get(self, key):
+        # The TTL monitor only runs once a minute, so check expiry here too
+        doc = self.collection.find_one({'_id': key, 'expires': {'$gt': datetime.utcnow()}})
+        if doc is None:
+            return None
+        return {'status': doc['status'], 'headers': doc['headers'], 'body': bytes(doc['body'])}
+
+    def set(self, key, entry, ttl, tags):
+        self.collection.replace_one({'_id': key}, {
+            'status': entry['status'],
+            'headers': entry['headers'],
+            'body': Binary(entry['body']),
+            'tags': list(tags),
+            'expires': datetime.utcnow() + timedelta(seconds=ttl),
+        }, upsert=True)
+
+    def invalidate(self, tags):
+        return self.collection.delete_many({'tags': {'$in': list(tags)}}).deleted_count
+
+    def clear(self):
+        self.collection.delete_many({})
+
+    def size(self):
+        return self.collection.estimated_document_count()
+
+
+def _normalized_query(normalize):
+    params = []
+    for name, value in request.args.items(multi=True):
+        value = value.strip()
+        if name in normalize:
+            value = normalize[name](value)
+        params.append((name, value))
+    return urlencode(sorted(params))
+
+
+class ResponseCache:
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.backend = None
+        self._generation = 0
+        self._routes = {}
+        self._lock = threading.Lock()
+        self.stores = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def init_app(self, app, db):
+        kind = os.getenv('RESPONSE_CACHE', 'memory').lower()
+        self.ttl = int(os.getenv('RESPONSE_CACHE_TTL', self.ttl))
+        if kind == 'mongodb' and db is not None:
+            self.backend = MongoBackend(db.response_cache)
+            register_indexes(self.backend)
+        elif kind in ('memory', 'mongodb'):
+            self.backend = MemoryBackend(maxsize=int(os.getenv('RESPONSE_CACHE_SIZE', 512)))
+        else:
+            self.backend = None
+        logger.info("Response cache: %s", type(self.backend).__name__ if self.backend else 'off')
+
+    # --- decorator ---
+    def cached(self, tags, when=None, normalize=None, ttl=None):
+        """Cache the view's ``200`` responses, tagged with ``tags``.
+
+        ``when()`` returning False bypasses the cache for that request;
+        ``normalize`` maps query parameter names to functions applied to
+        their values before they become part of the key.
+        """
+        normalize = normalize or {}
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None or request.method != 'GET' or (when and not when()):
+                    return view(*args, **kwargs)
+
+                route = current_route()
+                key = f"{request.path}?{_normalized_query(normalize)}"
+                entry = self._get(key)
+                self._count(route, entry is not None)
+                if entry is not None:
+                    response = Response(entry['body'], status=entry['status'], headers=entry['headers'])
+                    response.headers['X-Cache'] = 'HIT'
+                    return response.make_conditional(request)
+
+                generation = self._generation
+                response = current_app.make_response(view(*args, **kwargs))
+                # Don't store what was built while a write invalidated the tags
+                if response.status_code == 200 and not response.is_streamed and generation == self._generation:
+                    self._store(key, response, tags, ttl or self.ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def _get(self, key):
+        try:
+            return self.backend.get(key)
+        except PyMongoError as e:
+            logger.error("Error reading response cache: %s", e)
+            return None
+
+    def _store(self, key, response, tags, ttl):
+        body = response.get_data()
+        if len(body) > MAX_ENTRY_BYTES:
+            return
+        entry = {
+            'status': response.status_code,
+            'headers': [(name, response.headers[name]) for name in STORED_HEADERS if name in response.headers],
+            'body': body,
+        }
+        try:
+            self.backend.set(key, entry, ttl, tags)
+            with self._lock:
+                self.stores += 1
+        except PyMongoError as e:
+            logger.error("Error writing response cache: %s", e)
+
+    def _count(self, route, hit):
+        with self._lock:
+            stats = self._routes.setdefault(route, [0, 0])
+            stats[0 if hit else 1] += 1
+
+    # --- invalidation ---
+    def invalidate(self, *tags):
+        """Drop every entry built from any of ``tags`` (e.g. ``'posts'``)."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+        if self.backend is None:
+            return 0
+        try:
+            return self.backend.invalidate(tags)
+        except PyMongoError as e:
+            logger.error("Error invalidating response cache %s: %s", tags, e)
+            return 0
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    # --- reporting ---
+    def stats(self):
+        with self._lock:
+            hits = sum(h for h, _ in self._routes.values())
+            misses = sum(m for _, m in self._routes.values())
+            routes = {
+                route: {'hits': h, 'misses': m, 'hit_rate': round(h / (h + m), 4) if h + m else None}
+                for route, (h, m) in self._routes.items()
+            }
+            stores, invalidations = self.stores, self.invalidations
+        try:
+            size = self.backend.size() if self.backend else 0
+        except PyMongoError:
+            size = None
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'ttl_seconds': self.ttl,
+            'size': size,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+            'stores': stores,
+            'invalidations': invalidations,
+            'routes': routes,
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,255 @@
+"""Ranked full-text search over posts and roommate posts.
+
+The primary backend is a weighted MongoDB text index (title above
+description), ranked by text score with newest-first tie-breaking. When
+text search is unavailable (``SEARCH_BACKEND=memory``, or the server has no
+text index yet) an in-process inverted index with the same weights is used
+instead; a missing text index is retried every ``TEXT_INDEX_RETRY_SECONDS``,
+and any other ``$text`` failure only falls back for that one search.
+
+The in-process index is built once and then kept current per document:
+writes mark their ``_id`` with ``invalidate(name, _id)`` and the next search
+re-reads just those documents.
+
+User input never reaches a ``$regex``: queries are tokenized into plain
+words (plus optional "quoted phrases") and capped in size first.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+from pymongo import IndexModel, TEXT
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 8
+DEFAULT_LIMIT = 20
+
+# How long the in-process index is trusted before it is rebuilt
+MEMORY_INDEX_TTL_SECONDS = int(os.getenv('SEARCH_INDEX_TTL', 60))
+# How long a collection without a text index is searched in-process only
+TEXT_INDEX_RETRY_SECONDS = 300
+# Server error code for "text index required for $text query"
+INDEX_NOT_FOUND = 27
+
+SEARCH_FIELDS = {
+    'posts': {'title': 10, 'category': 4, 'description': 3, 'type': 2},
+    'roommates': {'title': 10, 'location': 4, 'preferences': 4, 'description': 3},
+}
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_PHRASE_RE = re.compile(r'"([^"]+)"')
+
+
+class ParsedQuery:
+    def __init__(self, terms, phrases):
+        self.terms = terms
+        self.phrases = phrases
+
+    def __bool__(self):
+        return bool(self.terms)
+
+    def text_search_string(self):
+        """The ``$search`` string: bare terms plus escaped quoted phrases."""
+        quoted = ['"{}"'.format(' '.join(_TOKEN_RE.findall(p))) for p in self.phrases]
+        return ' '.join(self.terms + quoted)
+
+
+def tokenize(text):
+    return [t.lower() for t in _TOKEN_RE.findall(text or '')]
+
+
+def parse_query(raw):
+    """Turn raw user input into a bounded set of plain search terms."""
+    raw = (raw or '')[:MAX_QUERY_LENGTH]
+    phrases = [p.lower() for p in _PHRASE_RE.findall(raw) if tokenize(p)]
+    terms = []
+    for term in tokenize(raw):
+        if term not in terms:
+            terms.append(term)
+    return ParsedQuery(terms[:MAX_TERMS], phrases[:2])
+
+
+def _field_text(doc, field):
+    value = doc.get(field)
+    if isinstance(value, list):
+        return ' '.join(str(v) for v in value)
+    return str(value) if value is not None else ''
+
+
+class InvertedIndex:
+    """Weighted term -> {doc id: score} postings for one collection."""
+
+    def __init__(self, collection, fields):
+        self.collection = collection
+        self.fields = fields
+        self.projection = dict.fromkeys(fields, 1)
+        self.projection['created_at'] = 1
+        self.built_at = None
+        self.pending = set()
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.postings = defaultdict(dict)    # token -> {doc id: weight}
+        self.doc_terms = {}                  # doc id -> {token: weight}, for removal
+        self.created_at = {}
+        self.text = {}
+
+    def _add(self, doc):
+        _id = doc['_id']
+        created = doc.get('created_at')
+        self.created_at[_id] = created.timestamp() if hasattr(created, 'timestamp') else 0
+        self.text[_id] = ' '.join(_field_text(doc, f) for f in self.fields).lower()
+        terms = defaultdict(float)
+        for field, weight in self.fields.items():
+            for token in tokenize(_field_text(doc, field)):
+                terms[token] += weight
+        for token, weight in terms.items():
+            self.postings[token][_id] = weight
+        self.doc_terms[_id] = terms
+
+    def _remove(self, _id):
+        for token in self.doc_terms.pop(_id, ()):
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(_id, None)
+                if not postings:
+                    del self.postings[token]
+        self.created_at.pop(_id, None)
+        self.text.pop(_id, None)
+
+    def _build(self):
+        self._reset()
+        self.pending.clear()
+        for doc in self.collection.find({}, self.projection):
+            self._add(doc)
+        self.built_at = time.monotonic()
+
+    def _reindex(self):
+        """Re-read only the documents written since the last search."""
+        ids, self.pending = list(self.pending), set()
+        docs = {d['_id']: d for d in self.collection.find({'_id': {'$in': ids}}, self.projection)}
+        for _id in ids:
+            self._remove(_id)
+            if _id in docs:
+                self._add(docs[_id])
+
+    def refresh_if_stale(self):
+        """Rebuild when stale, else catch up on pending writes (holding ``_lock``)."""
+        if self.built_at is None or time.monotonic() - self.built_at > MEMORY_INDEX_TTL_SECONDS:
+            self._build()
+        elif self.pending:
+            self._reindex()
+
+    def invalidate(self, _id=None):
+        """Re-read ``_id`` on next use, or rebuild everything without one."""
+        with self._lock:
+            if _id is None:
+                self.built_at = None
+            elif self.built_at is not None:
+                self.pending.add(_id)
+
+    def search(self, parsed, limit=DEFAULT_LIMIT):
+        """Return ``[(doc_id, score)]``, best first, newest first on ties."""
+        with self._lock:
+            self.refresh_if_stale()
+            scores = defaultdict(float)
+            for term in parsed.terms:
+                for _id, weight in self.postings.get(term, {}).items():
+                    scores[_id] += weight
+            if parsed.phrases:
+                scores = {
+                    _id: score for _id, score in scores.items()
+                    if all(p in self.text.get(_id, '') for p in parsed.phrases)
+                }
+            ranked = sorted(
+                scores.items(),
+                key=lambda item: (item[1], self.created_at.get(item[0], 0)),
+                reverse=True,
+            )
+        return ranked[:limit]
+
+
+_memory_indexes = {}
+_text_unavailable = {}    # collection name -> when the missing text index was seen
+
+
+def _memory_index(collection):
+    index = _memory_indexes.get(collection.name)
+    if index is None:
+        index = _memory_indexes[collection.name] = InvertedIndex(collection, SEARCH_FIELDS[collection.name])
+    return index
+
+
+def invalidate(collection_name, _id=None):
+    """After a write: re-index ``_id`` on next use (everything without one)."""
+    index = _memory_indexes.get(collection_name)
+    if index:
+        index.invalidate(_id)
+
+
+def text_index(collection_name):
+    """Weighted text index declaration for ``posts`` or ``roommates``."""
+    fields = SEARCH_FIELDS[collection_name]
+    return IndexModel(
+        [(field, TEXT) for field in fields],
+        weights=fields,
+        name=f"{collection_name}_text",
+        default_language='english',
+    )
+
+
+def _text_search(collection, parsed, limit):
+    cursor = (
+        collection.find(
+            {'$text': {'$search': parsed.text_search_string()}},
+            {'score': {'$meta': 'textScore'}},
+        )
+        .sort([('score', {'$meta': 'textScore'}), ('created_at', -1)])
+        .limit(limit)
+    )
+    return list(cursor)
+
+
+def _memory_search(collection, parsed, limit):
+    ranked = _memory_index(collection).search(parsed, limit)
+    if not ranked:
+        return []
+    docs = {d['_id']: d for d in collection.find({'_id': {'$in': [_id for _id, _ in ranked]}})}
+    results = []
+    for _id, score in ranked:
+        if _id in docs:
+            docs[_id]['score'] = score
+            results.append(docs[_id])
+    return results
+
+
+def search(collection, raw_query, limit=DEFAULT_LIMIT):
+    """Ranked search of ``collection`` (``db.posts`` or ``db.roommates``)."""
+    parsed = raw_query if isinstance(raw_query, ParsedQuery) else parse_query(raw_query)
+    if not parsed:
+        return []
+
+    missing_since = _text_unavailable.get(collection.name)
+    use_text = (
+        os.getenv('SEARCH_BACKEND', 'text') == 'text'
+        and (missing_since is None or time.monotonic() - missing_since > TEXT_INDEX_RETRY_SECONDS)
+    )
+    if use_text:
+        try:
+            results = _text_search(collection, parsed, limit)
+            _text_unavailable.pop(collection.name, None)
+            return results
+        except OperationFailure as e:
+            if e.code == INDEX_NOT_FOUND:
+                logger.info("No text index on %s yet, using in-process index: %s", collection.name, e)
+                _text_unavailable[collection.name] = time.monotonic()
+            else:
+                logger.warning("Text search failed on %s, using in-process index: %s", collection.name, e)
+    return _memory_search(collection, parsed, limit)
@@ -0,0 +1,195 @@
+"""Server-side sessions.
+
+The cookie only carries a signed, random session id; the session data lives
+in a ``SessionStore``. ``MongoSessionStore`` keeps one small document per
+session::
+
+    {'_id': <sid>, 'data': '<tagged JSON>', 'expires': <datetime>}
+
+and a TTL index on ``expires`` lets MongoDB drop expired sessions by itself,
+so every worker on every host sees the same sessions and nothing piles up.
+
+Writes are lazy: a request that only reads the session costs one lookup and
+no write. Unchanged sessions are re-saved only once less than half of their
+lifetime is left, which keeps the expiry sliding without a write per request.
+
+The session id is rotated whenever the session is cleared or the logged-in
+user changes (login, logout, registration): the data moves to a fresh id and
+the old record is deleted, so an id planted before login is worthless after.
+"""
+import abc
+import logging
+import secrets
+from datetime import datetime, timedelta
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from pymongo import ASCENDING, IndexModel
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+# Keys that alone don't make a session worth storing
+_BOOKKEEPING_KEYS = {'_permanent'}
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires = expires
+        self.modified = False
+        self.cleared = False
+        self.loaded_user_id = self.get('_user_id')
+
+    def clear(self):
+        super().clear()
+        self.cleared = True
+
+    def is_empty(self):
+        return not (set(self) - _BOOKKEEPING_KEYS)
+
+    def needs_new_sid(self):
+        """Cleared, or a different user than the one it was loaded for."""
+        return not self.new and (self.cleared or self.get('_user_id') != self.loaded_user_id)
+
+
+class SessionStore(abc.ABC):
+    """Backend interface: load/save/delete serialized sessions by id."""
+
+    @abc.abstractmethod
+    def load(self, sid):
+        """``(data, expires)`` for a live session, or None."""
+
+    @abc.abstractmethod
+    def save(self, sid, data, expires):
+        pass
+
+    @abc.abstractmethod
+    def delete(self, sid):
+        pass
+
+
+class MongoSessionStore(SessionStore):
+    def __init__(self, collection):
+        self.collection = collection
+        # expireAfterSeconds=0: each document expires at its own 'expires'
+        self.indexes = [IndexModel([('expires', ASCENDING)], expireAfterSeconds=0)]
+
+    def load(self, sid):
+        # The TTL monitor only runs once a minute, so check expiry here too
+        doc = self.collection.find_one({'_id': sid, 'expires': {'$gt': datetime.utcnow()}})
+        return (doc['data'], doc['expires']) if doc else None
+
+    def save(self, sid, data, expires):
+        self.collection.update_one(
+            {'_id': sid},
+            {'$set': {'data': data, 'expires': expires}},
+            upsert=True
+        )
+
+    def delete(self, sid):
+        self.collection.delete_one({'_id': sid})
+
+    def prune(self):
+        """Delete expired sessions now instead of waiting for the TTL monitor."""
+        return self.collection.delete_many({'expires': {'$lte': datetime.utcnow()}}).deleted_count
+
+
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSideSession
+
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-side-session')
+
+    def _new_sid(self):
+        return secrets.token_urlsafe(32)
+
+    def _new_session(self):
+        return self.session_class(sid=self._new_sid(), new=True)
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return self._new_session()
+        try:
+            sid = self._signer(app).unsign(cookie).decode()
+        except BadSignature:
+            return self._new_session()
+
+        try:
+            found = self.store.load(sid)
+        except Exception as e:
+            logger.error("Error loading session: %s", e)
+            found = None
+        if not found:
+            return self._new_session()
+
+        data, expires = found
+        try:
+            return self.session_class(self.serializer.loads(data), sid=sid, expires=expires)
+        except Exception as e:
+            logger.warning("Discarding unreadable session: %s", e)
+            return self._new_session()
+
+    def _needs_refresh(self, app, session, now):
+        lifetime = app.permanent_session_lifetime
+        return session.expires is None or session.expires - now < lifetime / 2
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.is_empty():
+            # Nothing worth keeping: drop what was stored and the cookie
+            if not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(
+                    name, domain=domain, path=path,
+                    secure=self.get_cookie_secure(app),
+                    samesite=self.get_cookie_samesite(app),
+                    httponly=self.get_cookie_httponly(app),
+                )
+            return
+
+        if session.needs_new_sid():
+            # Never carry a pre-login (or pre-clear) id into the new session
+            self.store.delete(session.sid)
+            session.sid = self._new_sid()
+            session.new = True
+            session.modified = True
+
+        now = datetime.utcnow()
+        if not session.modified and not self._needs_refresh(app, session, now):
+            return
+
+        expires = now + app.permanent_session_lifetime
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), expires)
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def mongo_sessions(collection):
+    """Session interface storing sessions in ``collection``."""
+    return ServerSideSessionInterface(MongoSessionStore(collection))
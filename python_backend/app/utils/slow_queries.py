@@ -0,0 +1,222 @@
+"""Opt-in slow-query log with explain plans.
+
+With ``SLOW_QUERY_MS`` set, every read/write command from the app slower
+than that is recorded in the capped ``slow_queries`` collection: route,
+collection, filter *shape* (values replaced by their type, so ``user_id``
+as a string and as an ObjectId are different shapes), sort, duration and
+the winning plan from ``explain``. Plans that scan the whole collection are
+flagged ``collscan``. Shape and sort are stored as JSON strings: their keys
+come from the query (``$or``, dotted paths), which servers before 5.0
+refuse as field names.
+
+Explains run on a background thread, at most once per shape every
+``EXPLAIN_TTL_SECONDS``, so the request that was slow isn't slowed further.
+``/admin/slow-queries`` (``X-Admin-Token: $ADMIN_TOKEN``) summarizes the
+worst shapes.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'slow_queries'
+CAPPED_BYTES = 16 * 1024 * 1024
+EXPLAIN_TTL_SECONDS = 600
+
+# Commands explain() understands, and the field holding the filter
+_EXPLAINABLE = {
+    'find': 'filter',
+    'aggregate': 'pipeline',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query',
+    'update': 'updates',
+    'delete': 'deletes',
+}
+# Session/driver fields that must not be sent back inside explain
+_DRIVER_FIELDS = {'lsid', 'txnNumber', '$clusterTime', '$db', '$readPreference', 'signature', 'readConcern', 'writeConcern'}
+
+
+def shape(value):
+    """``value`` with every literal replaced by its type name."""
+    if isinstance(value, dict):
+        return {k: shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            s = shape(item)
+            if s not in shapes:
+                shapes.append(s)
+        return shapes
+    return type(value).__name__
+
+
+def query_shape(command_name, command):
+    field = _EXPLAINABLE[command_name]
+    target = command.get(field)
+    if command_name in ('update', 'delete'):
+        target = [statement.get('q') for statement in target or []]
+    return shape(target or {})
+
+
+def _as_json(value, sort_keys=False):
+    """Canonical JSON text for a shape or sort spec (None stays None)."""
+    if value is None:
+        return None
+    return json.dumps(value, sort_keys=sort_keys, separators=(',', ':'), default=str)
+
+
+def _stages(plan):
+    """Every stage name in a (possibly nested) plan tree."""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _stages(item)
+
+
+def _index_names(plan):
+    if isinstance(plan, dict):
+        if 'indexName' in plan:
+            yield plan['indexName']
+        for value in plan.values():
+            yield from _index_names(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _index_names(item)
+
+
+def _winning_plan(explain):
+    planner = explain.get('queryPlanner')
+    if planner is None:
+        # aggregate explains nest the planner under the first stage
+        for stage in explain.get('stages') or []:
+            if '$cursor' in stage:
+                planner = stage['$cursor'].get('queryPlanner')
+                break
+    return (planner or {}).get('winningPlan') or {}
+
+
+class SlowQueryRecorder:
+    def __init__(self):
+        self.threshold_ms = None
+        self.db = None
+        self._explained = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query')
+
+    @property
+    def enabled(self):
+        return self.threshold_ms is not None and self.db is not None
+
+    def init_app(self, app, db, monitor):
+        threshold = os.getenv('SLOW_QUERY_MS')
+        if not threshold or db is None:
+            return
+        self.threshold_ms = float(threshold)
+        self.db = db
+        try:
+            db.create_collection(COLLECTION, capped=True, size=CAPPED_BYTES)
+        except CollectionInvalid:
+            pass  # already there
+        except Exception as e:
+            logger.error("Error creating %s collection: %s", COLLECTION, e)
+        monitor.add_hook(self.observe)
+        logger.info("Recording queries slower than %sms", self.threshold_ms)
+
+    # --- called from the command listener ---
+    def observe(self, record, command, event):
+        if (record['duration_ms'] < self.threshold_ms
+                or record['command'] not in _EXPLAINABLE
+                or record['collection'] == COLLECTION):
+            return
+        self._executor.submit(self._record, record, command, event.database_name)
+
+    def _plan(self, key, command_name, command, database_name):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._explained.get(key)
+            if cached and now - cached[0] < EXPLAIN_TTL_SECONDS:
+                return cached[1]
+
+        explain_cmd = {k: v for k, v in command.items() if k not in _DRIVER_FIELDS}
+        try:
+            explain = self.db.client[database_name or self.db.name].command(
+                'explain', explain_cmd, verbosity='queryPlanner'
+            )
+            winning = _winning_plan(explain)
+            stages = list(_stages(winning))
+            plan = {'stages': stages, 'indexes': list(_index_names(winning)), 'collscan': 'COLLSCAN' in stages}
+        except PyMongoError as e:
+            plan = {'stages': [], 'indexes': [], 'collscan': None, 'error': str(e)}
+
+        with self._lock:
+            self._explained[key] = (now, plan)
+        return plan
+
+    def _record(self, record, command, database_name):
+        try:
+            name = record['command']
+            # Filter key order doesn't change the query; sort key order does
+            filter_shape = _as_json(query_shape(name, command), sort_keys=True)
+            sort = _as_json(command.get('sort'))
+            key = repr((record['collection'], name, filter_shape, sort))
+            plan = self._plan(key, name, command, database_name)
+            self.db[COLLECTION].insert_one({
+                'ts': datetime.utcnow(),
+                'route': record['route'],
+                'collection': record['collection'],
+                'command': name,
+                'shape_key': key,
+                'shape': filter_shape,
+                'sort': sort,
+                'duration_ms': record['duration_ms'],
+                'documents': record['documents'],
+                'plan_stages': plan['stages'],
+                'plan_indexes': plan['indexes'],
+                'collscan': plan['collscan'],
+                'explain_error': plan.get('error'),
+            })
+        except Exception as e:
+            logger.error("Error recording slow query: %s", e)
+
+    # --- reporting ---
+    def summary(self, limit=20):
+        """Worst query shapes by total time spent."""
+        if self.db is None:
+            return []
+        return list(self.db[COLLECTION].aggregate([
+            {'$sort': {'ts': -1}},
+            {'$group': {
+                '_id': '$shape_key',
+                'collection': {'$first': '$collection'},
+                'command': {'$first': '$command'},
+                'shape': {'$first': '$shape'},
+                'sort': {'$first': '$sort'},
+                'routes': {'$addToSet': '$route'},
+                'count': {'$sum': 1},
+                'total_ms': {'$sum': '$duration_ms'},
+                'max_ms': {'$max': '$duration_ms'},
+                'avg_ms': {'$avg': '$duration_ms'},
+                'collscan': {'$max': '$collscan'},
+                'plan_stages': {'$first': '$plan_stages'},
+                'plan_indexes': {'$first': '$plan_indexes'},
+                'last_seen': {'$first': '$ts'},
+            }},
+            {'$sort': {'total_ms': -1}},
+            {'$limit': limit},
+            {'$project': {'_id': 0}},
+        ]))
+
+
+slow_queries = SlowQueryRecorder()
@@ -0,0 +1,368 @@
+"""Multi-party trade cycles: "A wants B's item, B wants C's, C wants A's".
+
+The want graph has one node per user with open trades and an edge
+``A -> B`` whenever A is in ``interested_users`` of one of B's open trades.
+Every simple cycle ``u0 -> u1 -> ... -> u0`` of at most ``max_length``
+users is an exchange in which each user hands one of their items to the
+user before them.
+
+Finding them:
+
+* a full build splits the graph into strongly connected components
+  (iterative Tarjan) and enumerates bounded cycles inside each component,
+  starting every cycle at its smallest user so each is found once;
+* after that the graph is kept current incrementally: a new edge
+  ``A -> B`` can only create cycles through itself, i.e. paths
+  ``B -> ... -> A``, so only those are searched (bounded, shortest first);
+  a removed edge drops the cycles that used it.
+
+Searches stop after ``max_per_search`` cycles and each user keeps at most
+``max_per_user``, so dense graphs can't blow up time or memory. The graph
+is per process; writes made by other workers arrive with the next rebuild,
+at most ``TRADE_CYCLES_TTL`` seconds later. A rebuild reads Mongo into a
+separate ``TradeCycles`` without holding the lock, replays the writes that
+happened meanwhile and swaps the result in, so requests keep using the old
+graph until then. ``stats()`` is served at ``/metrics/trade-cycles``.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_LENGTH = 4
+DEFAULT_MAX_PER_SEARCH = 50
+DEFAULT_MAX_PER_USER = 20
+
+TRADE_CYCLES_TTL_SECONDS = int(os.getenv('TRADE_CYCLES_TTL', 300))
+
+TRADE_PROJECTION = {'user_id': 1, 'interested_users': 1}
+
+
+def canonical(users):
+    """Rotation of a cycle that starts at its smallest user."""
+    start = users.index(min(users))
+    return tuple(users[start:] + users[:start])
+
+
+def strongly_connected_components(nodes, successors):
+    """Tarjan's algorithm without recursion; yields components as lists."""
+    index = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    counter = 0
+    for root in nodes:
+        if root in index:
+            continue
+        work = [(root, iter(successors(root)))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors(child))))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                yield component
+
+
+class TradeCycles:
+    def __init__(self, collection=None, max_length=DEFAULT_MAX_LENGTH, ttl=TRADE_CYCLES_TTL_SECONDS,
+                 max_per_search=DEFAULT_MAX_PER_SEARCH, max_per_user=DEFAULT_MAX_PER_USER):
+        self.collection = collection
+        self.max_length = max_length
+        self.ttl = ttl
+        self.max_per_search = max_per_search
+        self.max_per_user = max_per_user
+        self.built_at = None
+        self.stale = False
+        self.rebuilds = 0
+        self._journal = None    # writes seen while a rebuild is running
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.owner = {}                                       # trade id -> owner
+        self.interested = defaultdict(set)                    # trade id -> users
+        self.wants = defaultdict(lambda: defaultdict(set))    # user -> owner -> trade ids
+        self.wanted_by = defaultdict(set)                     # owner -> users (reverse edges)
+        self.cycles = set()
+        self.by_user = defaultdict(set)
+        self.by_edge = defaultdict(set)
+
+    # --- graph ---
+    def _successors(self, user):
+        return self.wants[user].keys() if user in self.wants else ()
+
+    def _add_want(self, user, trade_id):
+        """Record the interest; True if it created the edge ``user -> owner``."""
+        owner = self.owner.get(trade_id)
+        if owner is None or owner == user or user in self.interested[trade_id]:
+            return False
+        self.interested[trade_id].add(user)
+        trades = self.wants[user][owner]
+        trades.add(trade_id)
+        if len(trades) > 1:
+            return False
+        self.wanted_by[owner].add(user)
+        return True
+
+    def _drop_want(self, user, trade_id):
+        owner = self.owner.get(trade_id)
+        if owner is None or user not in self.interested.get(trade_id, ()):
+            return
+        self.interested[trade_id].discard(user)
+        trades = self.wants[user].get(owner)
+        if trades is None:
+            return
+        trades.discard(trade_id)
+        if not trades:
+            del self.wants[user][owner]
+            if not self.wants[user]:
+                del self.wants[user]
+            self.wanted_by[owner].discard(user)
+            self._drop_cycles_through(user, owner)
+
+    # --- cycles ---
+    def _store(self, users):
+        key = canonical(list(users))
+        if key in self.cycles or any(len(self.by_user[u]) >= self.max_per_user for u in key):
+            return False
+        self.cycles.add(key)
+        for i, user in enumerate(key):
+            self.by_user[user].add(key)
+            self.by_edge[(user, key[(i + 1) % len(key)])].add(key)
+        return True
+
+    def _drop_cycles_through(self, a, b):
+        for key in self.by_edge.pop((a, b), ()):
+            self.cycles.discard(key)
+            for i, user in enumerate(key):
+                self.by_user[user].discard(key)
+                edge = (user, key[(i + 1) % len(key)])
+                if edge != (a, b):
+                    self.by_edge[edge].discard(key)
+
+    def _distances_to(self, target, max_edges, allowed=None):
+        """``{user: edges to target}`` for users within ``max_edges`` (reverse BFS)."""
+        distances = {target: 0}
+        frontier = [target]
+        for distance in range(1, max_edges + 1):
+            next_frontier = []
+            for node in frontier:
+                for user in self.wanted_by.get(node, ()):
+                    if user not in distances and (allowed is None or allowed(user)):
+                        distances[user] = distance
+                        next_frontier.append(user)
+            frontier = next_frontier
+        return distances
+
+    def _paths(self, start, target, max_edges, allowed=None):
+        """Simple paths ``start -> ... -> target`` of at most ``max_edges``
+        edges, shortest first (iterative deepening, bounded by ``max_per_search``).
+
+        Meet in the middle: a reverse BFS marks the users within half the
+        length of ``target``, and once the path is that close the forward
+        search only steps onto marked users.
+        """
+        horizon = max(1, max_edges // 2)
+        distances = self._distances_to(target, horizon, allowed)
+        found = 0
+        for depth in range(1, max_edges + 1):
+            stack = [(start, iter(self._successors(start)))]
+            path = [start]
+            while stack:
+                node, children = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    stack.pop()
+                    path.pop()
+                    continue
+                if len(path) == depth:
+                    if child == target:
+                        yield list(path)
+                        found += 1
+                        if found >= self.max_per_search:
+                            return
+                    continue
+                # edges still needed from ``child`` to ``target``
+                needed = depth - len(path)
+                if needed <= horizon and distances.get(child, needed + 1) > needed:
+                    continue
+                if child == target or child in path or (allowed is not None and not allowed(child)):
+                    continue
+                path.append(child)
+                stack.append((child, iter(self._successors(child))))
+
+    def _cycles_through(self, a, b):
+        """New cycles closed by the edge ``a -> b``."""
+        if len(self.by_user[a]) >= self.max_per_user or len(self.by_user[b]) >= self.max_per_user:
+            return 0
+        added = 0
+        for path in self._paths(b, a, self.max_length - 1):
+            added += self._store([a] + path)
+        return added
+
+    # --- building ---
+    def load(self, trades):
+        """Rebuild from open trade documents (``_id``, ``user_id``, ``interested_users``)."""
+        started = time.perf_counter()
+        with self._lock:
+            self._reset()
+            trades = list(trades)
+            for trade in trades:
+                self.owner[trade['_id']] = trade['user_id']
+            for trade in trades:
+                for user in trade.get('interested_users') or []:
+                    self._add_want(user, trade['_id'])
+
+            for component in strongly_connected_components(list(self.wants), self._successors):
+                if len(component) < 2:
+                    continue
+                members = set(component)
+                for start in sorted(component):
+                    if len(self.by_user[start]) >= self.max_per_user:
+                        continue
+                    # Cycles whose smallest user is ``start``
+                    for path in self._paths(start, start, self.max_length,
+                                            allowed=lambda u, s=start: u in members and u > s):
+                        self._store(path)
+            self.built_at = time.monotonic()
+        logger.info("Built trade cycle index: %d trades, %d cycles in %.1fms",
+                    len(self.owner), len(self.cycles), (time.perf_counter() - started) * 1000)
+
+    def _needs_rebuild(self):
+        return self.built_at is None or self.stale or time.monotonic() - self.built_at > self.ttl
+
+    def refresh_if_stale(self):
+        """Rebuild from Mongo when stale; call without holding ``_lock``.
+
+        Only one thread rebuilds at a time, the others keep reading the
+        current graph (an empty one before the first build).
+        """
+        if self.collection is None:
+            return
+        with self._lock:
+            if self._journal is not None or not self._needs_rebuild():
+                return
+            self._journal = []
+            self.stale = False
+        try:
+            fresh = TradeCycles(max_length=self.max_length, max_per_search=self.max_per_search,
+                                max_per_user=self.max_per_user)
+            fresh.load(self.collection.find({'status': 'open'}, TRADE_PROJECTION))
+        except Exception:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            for method, args in self._journal:
+                getattr(fresh, method)(*args)
+            self._journal = None
+            for name in ('owner', 'interested', 'wants', 'wanted_by', 'cycles', 'by_user', 'by_edge', 'built_at'):
+                setattr(self, name, getattr(fresh, name))
+            self.rebuilds += 1
+
+    def invalidate(self):
+        """Rebuild on next use; the current graph is served until then."""
+        with self._lock:
+            self.stale = True
+
+    # --- incremental maintenance (called by the Trade model) ---
+    def _record(self, method, *args):
+        """Keep the write for a rebuild in progress to replay."""
+        if self._journal is not None:
+            self._journal.append((method, args))
+
+    def add_trade(self, trade):
+        with self._lock:
+            self._record('add_trade', trade)
+            if self.built_at is None:
+                return
+            self.owner[trade['_id']] = trade['user_id']
+            for user in trade.get('interested_users') or []:
+                self._add_interest(trade['_id'], user)
+
+    def add_interest(self, trade_id, user):
+        """Number of new cycles the interest closed."""
+        with self._lock:
+            self._record('add_interest', trade_id, user)
+            if self.built_at is None:
+                return 0
+            return self._add_interest(trade_id, user)
+
+    def _add_interest(self, trade_id, user):
+        if self._add_want(user, trade_id):
+            return self._cycles_through(user, self.owner[trade_id])
+        return 0
+
+    def remove_interest(self, trade_id, user):
+        with self._lock:
+            self._record('remove_interest', trade_id, user)
+            self._drop_want(user, trade_id)
+
+    def remove_trade(self, trade_id):
+        with self._lock:
+            self._record('remove_trade', trade_id)
+            for user in list(self.interested.get(trade_id, ())):
+                self._drop_want(user, trade_id)
+            self.interested.pop(trade_id, None)
+            self.owner.pop(trade_id, None)
+
+    # --- queries ---
+    def legs(self, key):
+        """``[(giver, receiver, trade ids)]`` for a stored cycle."""
+        return [
+            (key[(i + 1) % len(key)], user, sorted(self.wants[user][key[(i + 1) % len(key)]]))
+            for i, user in enumerate(key)
+        ]
+
+    def for_user(self, user, limit=10):
+        """Cycles ``user`` takes part in, shortest first, as lists of legs."""
+        self.refresh_if_stale()
+        with self._lock:
+            keys = sorted(self.by_user.get(user, ()), key=lambda k: (len(k), k))[:limit]
+            return [self.legs(key) for key in keys]
+
+    def stats(self):
+        with self._lock:
+            lengths = defaultdict(int)
+            for key in self.cycles:
+                lengths[len(key)] += 1
+            return {
+                'trades': len(self.owner),
+                'users': len(self.wants),
+                'edges': sum(len(targets) for targets in self.wants.values()),
+                'cycles': len(self.cycles),
+                'cycles_by_length': dict(sorted(lengths.items())),
+                'built_seconds_ago': round(time.monotonic() - self.built_at, 1) if self.built_at else None,
+                'rebuilds': self.rebuilds,
+                'rebuilding': self._journal is not None,
+            }
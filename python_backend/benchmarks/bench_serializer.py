@@ -0,0 +1,96 @@
+"""Micro-benchmark: old dumps/loads round-trip vs. the single-pass serializer.
+
+Builds a feed page shaped like ``GET /api/posts`` (ObjectIds, datetimes and
+inline base64 images) and times:
+
+* old: ``json.loads(json.dumps(doc, cls=JSONEncoder))`` in the model, then a
+  second ``json.dumps`` in ``jsonify``
+* new: one ``app.utils.json_encoder.dumps`` call straight to bytes
+
+Run from ``python_backend/``::
+
+    python benchmarks/bench_serializer.py [--posts 20] [--image-kb 200]
+"""
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import timeit
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+# The serializer has no app dependencies; load it by path so the benchmark
+# doesn't import the ``app`` package (which connects to MongoDB on import).
+_here = os.path.dirname(os.path.abspath(__file__))
+_spec = importlib.util.spec_from_file_location(
+    'json_encoder', os.path.join(_here, '..', 'app', 'utils', 'json_encoder.py')
+)
+json_encoder = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(json_encoder)
+
+
+class LegacyJSONEncoder(json.JSONEncoder):
+    """The encoder the models used before (``post.JSONEncoder``)."""
+
+    def default(self, o):
+        if isinstance(o, ObjectId):
+            return str(o)
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def make_page(posts, image_kb):
+    image = 'data:image/jpeg;base64,' + base64.b64encode(os.urandom(image_kb * 1024)).decode()
+    now = datetime.utcnow()
+    return [{
+        '_id': ObjectId(),
+        'user_id': ObjectId(),
+        'title': f'Desk lamp #{i}',
+        'description': 'Barely used, pick up near Washington Square. ' * 4,
+        'type': 'item',
+        'category': 'furniture',
+        'condition': 'good',
+        'images': [image, image],
+        'price': 15,
+        'status': 'Available',
+        'created_at': now,
+        'updated_at': now,
+        'author_name': 'someone',
+        'author_image': None,
+    } for i in range(posts)]
+
+
+def legacy(page):
+    plain = json.loads(json.dumps(page, cls=LegacyJSONEncoder))
+    return json.dumps({'posts': plain}).encode('utf-8')
+
+
+def single_pass(page):
+    return json_encoder.dumps({'posts': page})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=20)
+    parser.add_argument('--image-kb', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    page = make_page(args.posts, args.image_kb)
+    assert json.loads(legacy(page)) == json.loads(single_pass(page))
+
+    backend = 'orjson' if json_encoder.orjson is not None else 'stdlib json'
+    print(f"{args.posts} posts, 2 x {args.image_kb} KB images each, backend: {backend}")
+    results = {}
+    for name, fn in (('legacy round-trip', legacy), ('single pass', single_pass)):
+        best = min(timeit.repeat(lambda: fn(page), number=1, repeat=args.repeat))
+        results[name] = best
+        print(f"  {name:<18} {best * 1000:8.2f} ms")
+    print(f"  speedup            {results['legacy round-trip'] / results['single pass']:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark the trade cycle matcher on a synthetic want graph.
+
+    python benchmarks/bench_trade_cycles.py --trades 100000
+
+Builds a random graph (each user owns ``--trades-per-user`` open trades and
+is interested in ``--interests`` random trades of other users), then times
+the full build, incremental interest updates and per-user lookups. Runs
+without MongoDB or the Flask app.
+"""
+import argparse
+import importlib.util
+import os
+import random
+import statistics
+import time
+
+_PATH = os.path.join(os.path.dirname(__file__), '..', 'app', 'utils', 'trade_cycles.py')
+_spec = importlib.util.spec_from_file_location('trade_cycles', _PATH)
+trade_cycles = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(trade_cycles)
+
+
+def synthetic_trades(n_trades, trades_per_user, interests, seed):
+    rng = random.Random(seed)
+    n_users = max(2, n_trades // trades_per_user)
+    trades = [{'_id': i, 'user_id': i % n_users, 'interested_users': []} for i in range(n_trades)]
+    for user in range(n_users):
+        for trade in rng.sample(trades, interests):
+            if trade['user_id'] != user:
+                trade['interested_users'].append(user)
+    return trades, n_users, rng
+
+
+def percentiles(samples_ms):
+    samples_ms = sorted(samples_ms)
+    return {
+        'p50': round(statistics.median(samples_ms), 3),
+        'p99': round(samples_ms[int(len(samples_ms) * 0.99) - 1], 3),
+        'max': round(samples_ms[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trades', type=int, default=100_000)
+    parser.add_argument('--trades-per-user', type=int, default=2)
+    parser.add_argument('--interests', type=int, default=3, help='Trades each user is interested in.')
+    parser.add_argument('--max-length', type=int, default=trade_cycles.DEFAULT_MAX_LENGTH)
+    parser.add_argument('--updates', type=int, default=2000, help='Incremental interests to time.')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    trades, n_users, rng = synthetic_trades(args.trades, args.trades_per_user, args.interests, args.seed)
+    graph = trade_cycles.TradeCycles(max_length=args.max_length)
+
+    started = time.perf_counter()
+    graph.load(trades)
+    build_s = time.perf_counter() - started
+    print(f"users={n_users} trades={args.trades} max_length={args.max_length}")
+    print(f"full build: {build_s:.2f}s  {graph.stats()}")
+
+    add_ms, found = [], 0
+    for _ in range(args.updates):
+        user, trade = rng.randrange(n_users), rng.randrange(args.trades)
+        started = time.perf_counter()
+        found += graph.add_interest(trade, user)
+        add_ms.append((time.perf_counter() - started) * 1000)
+    print(f"add_interest x{args.updates}: {percentiles(add_ms)} ms, {found} new cycles")
+
+    remove_ms = []
+    for _ in range(args.updates):
+        trade = rng.randrange(args.trades)
+        interested = list(graph.interested.get(trade, ()))
+        if not interested:
+            continue
+        started = time.perf_counter()
+        graph.remove_interest(trade, interested[0])
+        remove_ms.append((time.perf_counter() - started) * 1000)
+    if remove_ms:
+        print(f"remove_interest x{len(remove_ms)}: {percentiles(remove_ms)} ms")
+
+    lookup_ms = []
+    for _ in range(args.updates):
+        user = rng.randrange(n_users)
+        started = time.perf_counter()
+        graph.for_user(user)
+        lookup_ms.append((time.perf_counter() - started) * 1000)
+    print(f"for_user x{args.updates}: {percentiles(lookup_ms)} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Mongo commands per request for the write paths trimmed in user-016.
+
+Needs a MongoDB to talk to (command monitoring doesn't run against fakes):
+
+    MONGODB_URI=mongodb://localhost:27017/casaconnect_test python -m pytest tests
+
+The test creates a throwaway user and roommate post and deletes them again.
+Skipped when ``MONGODB_URI`` is unset or the server can't be reached. Each
+test also asserts that commands were seen at all, so a client without
+command monitoring fails instead of passing with zero commands.
+
+The response cache is pinned to the ``memory`` backend: with ``mongodb``
+every write adds a ``delete`` on ``response_cache`` for invalidation.
+"""
+import os
+import uuid
+
+import pymongo
+import pytest
+from pymongo.errors import PyMongoError
+
+_uri = os.getenv('MONGODB_URI')
+try:
+    if not _uri:
+        raise PyMongoError("MONGODB_URI is not set")
+    pymongo.MongoClient(_uri, serverSelectionTimeoutMS=2000).server_info()
+except PyMongoError as e:
+    pytest.skip(f"MongoDB not available: {e}", allow_module_level=True)
+
+os.environ['RESPONSE_CACHE'] = 'memory'
+
+from app import app, db  # noqa: E402
+from app.utils.query_metrics import query_monitor  # noqa: E402
+
+# users lookup (email/NetID/username in one query), users insert, session save
+REGISTER_BUDGET = 3
+# session load, user load, roommates insert, session save
+CREATE_ROOMMATE_BUDGET = 4
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    tag = uuid.uuid4().hex[:10]
+    user = {
+        'email': f'qc-{tag}@nyu.edu',
+        'username': f'qc-{tag}',
+        'password': 'query-count-test',
+        'NetID': f'qc{tag}',
+    }
+    with app.test_client() as client:
+        client.user = user
+        yield client
+    created = db.users.find_one({'email': user['email']}, {'_id': 1})
+    if created:
+        db.roommates.delete_many({'user_id': created['_id']})
+        db.users.delete_one({'_id': created['_id']})
+
+
+def test_register_command_count(client):
+    with query_monitor.budget(REGISTER_BUDGET) as commands:
+        response = client.post('/api/auth/register', json=client.user)
+    assert response.status_code == 201, response.get_json()
+    assert commands, "no Mongo commands observed; is command monitoring on?"
+
+
+def test_create_roommate_command_count(client):
+    assert client.post('/api/auth/register', json=client.user).status_code == 201
+
+    with query_monitor.budget(CREATE_ROOMMATE_BUDGET) as commands:
+        response = client.post('/api/roommates', json={
+            'title': 'Room near campus',
+            'description': 'Quiet flat, looking for one roommate',
+            'preferences': 'quiet, non-smoker',
+            'location': 'Greenwich Village',
+        })
+    assert response.status_code == 201, response.get_json()
+    assert commands, "no Mongo commands observed; is command monitoring on?"